@@ -6,6 +6,7 @@ import asyncio
 from typing import Dict, Any, Optional
 import google.generativeai as genai
 from google.generativeai import GenerativeModel
+from app.performance import span
 
 class AIService:
     def __init__(self):
@@ -29,20 +30,23 @@ class AIService:
         for attempt in range(self.max_retries):
             try:
                 async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.post(
-                        f"https://generativelanguage.googleapis.com/v1beta/models/{model.model_name}:generateContent",
-                        headers={
-                            "Content-Type": "application/json",
-                            "x-goog-api-key": self.api_key
-                        },
-                        json={
-                            "contents": [{
-                                "parts": [{
-                                    "text": prompt
+                    with span("ai", model.model_name) as ai_span:
+                        ai_span.annotate(attempt=attempt + 1, prompt_chars=len(prompt))
+                        response = await client.post(
+                            f"https://generativelanguage.googleapis.com/v1beta/models/{model.model_name}:generateContent",
+                            headers={
+                                "Content-Type": "application/json",
+                                "x-goog-api-key": self.api_key
+                            },
+                            json={
+                                "contents": [{
+                                    "parts": [{
+                                        "text": prompt
+                                    }]
                                 }]
-                            }]
-                        }
-                    )
+                            }
+                        )
+                        ai_span.annotate(status_code=response.status_code, bytes=len(response.content))
                     
                     if response.status_code == 200:
                         return response.json()
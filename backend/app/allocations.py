@@ -0,0 +1,205 @@
+"""
+Opt-in allocation tracking with tracemalloc.
+
+While tracing is on, every HTTP request's net allocations (memory still
+held when it finishes) and peak allocations (highest traced memory above
+its starting point) are added to its route template. tracemalloc only sees
+the whole process, so requests running concurrently are charged for each
+other's allocations; the per-route figures are meaningful on average, not
+for a single request. Snapshots taken at different times can be compared
+to find the allocation sites that keep growing.
+"""
+
+import itertools
+import os
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from app.performance import route_key
+
+MAX_SNAPSHOTS = 4
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+class RequestAllocations:
+    """Traced memory at the start of a request, and the highest seen since"""
+
+    __slots__ = ("start", "peak")
+
+    def __init__(self, start: int):
+        self.start = start
+        self.peak = start
+
+class AllocationTracker:
+    """Attributes allocations to routes and keeps snapshots for comparison"""
+
+    def __init__(self):
+        self.in_flight: List[RequestAllocations] = []
+        self.snapshots: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.snapshot_ids = itertools.count(1)
+        self.reset()
+
+    def reset(self):
+        """Reset per-route allocation statistics"""
+        self.routes: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1):
+        """Start tracing allocations, keeping `frames` frames of traceback per allocation"""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.in_flight.clear()
+        self.snapshots.clear()
+        tracemalloc.start(frames)
+
+    def stop(self):
+        """Stop tracing and drop snapshots; per-route statistics are kept"""
+        tracemalloc.stop()
+        self.in_flight.clear()
+        self.snapshots.clear()
+
+    def begin_request(self) -> RequestAllocations:
+        """Start accounting a request"""
+        current, peak = tracemalloc.get_traced_memory()
+        # Resetting the peak for this request must not lose the peaks of
+        # requests already running, so fold it into theirs first
+        for request in self.in_flight:
+            request.peak = max(request.peak, peak)
+        tracemalloc.reset_peak()
+        request = RequestAllocations(current)
+        self.in_flight.append(request)
+        return request
+
+    def end_request(self, request: RequestAllocations, route: str):
+        """Finish accounting a request and add it to its route"""
+        if request not in self.in_flight:
+            # Tracing was stopped or restarted while the request ran
+            return
+        self.in_flight.remove(request)
+        current, peak = tracemalloc.get_traced_memory()
+        net = current - request.start
+        peak = max(request.peak, peak) - request.start
+
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = {"requests": 0, "net_bytes": 0, "peak_bytes_total": 0, "max_peak_bytes": 0}
+        stats["requests"] += 1
+        stats["net_bytes"] += net
+        stats["peak_bytes_total"] += peak
+        stats["max_peak_bytes"] = max(stats["max_peak_bytes"], peak)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get tracing status and allocations per route, largest net growth first"""
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        routes = {}
+        for route, stats in sorted(self.routes.items(), key=lambda item: item[1]["net_bytes"], reverse=True):
+            routes[route] = {
+                "requests": stats["requests"],
+                "net_bytes": stats["net_bytes"],
+                "avg_net_bytes": stats["net_bytes"] / stats["requests"],
+                "avg_peak_bytes": stats["peak_bytes_total"] / stats["requests"],
+                "max_peak_bytes": stats["max_peak_bytes"],
+            }
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "traceback_frames": tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else 0,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "routes": routes,
+            "snapshots": [self._describe(snapshot_id, entry) for snapshot_id, entry in self.snapshots.items()],
+        }
+
+    def _describe(self, snapshot_id: int, entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {"snapshot_id": snapshot_id, "taken_at": entry["taken_at"], "traced_bytes": entry["traced_bytes"]}
+
+    def take_snapshot(self) -> Dict[str, Any]:
+        """Take and keep a snapshot; only the latest MAX_SNAPSHOTS are kept"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Allocation tracking is not enabled")
+        snapshot_id = next(self.snapshot_ids)
+        self.snapshots[snapshot_id] = {
+            "snapshot": tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS),
+            "taken_at": time.time(),
+            "traced_bytes": tracemalloc.get_traced_memory()[0],
+        }
+        while len(self.snapshots) > MAX_SNAPSHOTS:
+            self.snapshots.popitem(last=False)
+        return self._describe(snapshot_id, self.snapshots[snapshot_id])
+
+    def compare(self, start_id: int, end_id: Optional[int] = None, top: int = 20) -> Optional[Dict[str, Any]]:
+        """Get the allocation sites that grew most between two snapshots, or from one snapshot until now.
+
+        Returns None if a snapshot is unknown.
+        """
+        start = self.snapshots.get(start_id)
+        if start is None:
+            return None
+        if end_id is None:
+            # Snapshots are dropped when tracing stops, so it is still on
+            end = {
+                "snapshot": tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS),
+                "taken_at": time.time(),
+            }
+        else:
+            end = self.snapshots.get(end_id)
+            if end is None:
+                return None
+
+        key_type = "traceback" if start["snapshot"].traceback_limit > 1 else "lineno"
+        differences = end["snapshot"].compare_to(start["snapshot"], key_type)
+        growing = [difference for difference in differences if difference.size_diff > 0]
+        return {
+            "start_snapshot_id": start_id,
+            "end_snapshot_id": end_id,
+            "interval_seconds": end["taken_at"] - start["taken_at"],
+            "size_diff_bytes": sum(difference.size_diff for difference in differences),
+            "top_growing": [
+                {
+                    # Frames run from oldest to most recent
+                    "site": str(difference.traceback[-1]),
+                    "traceback": [str(frame) for frame in difference.traceback],
+                    "size_diff_bytes": difference.size_diff,
+                    "count_diff": difference.count_diff,
+                    "size_bytes": difference.size,
+                    "count": difference.count,
+                }
+                for difference in growing[:top]
+            ]
+        }
+
+class AllocationTrackingMiddleware:
+    """Charges each HTTP request's allocations to its route while tracing is on"""
+
+    def __init__(self, app, tracker: AllocationTracker):
+        self.app = app
+        self.tracker = tracker
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracker.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        request = self.tracker.begin_request()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.tracker.end_request(request, route_key(scope))
+
+# Global allocation tracker; ALLOCATION_TRACKING_FRAMES > 0 starts tracing at startup
+allocation_tracker = AllocationTracker()
+
+def init_allocation_tracking() -> bool:
+    """Start tracing if ALLOCATION_TRACKING_FRAMES is set"""
+    frames = int(os.getenv("ALLOCATION_TRACKING_FRAMES", "0"))
+    if frames > 0 and not allocation_tracker.enabled:
+        allocation_tracker.start(frames)
+    return allocation_tracker.enabled
@@ -1,10 +1,13 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import jwt
 import os
 from datetime import datetime, timedelta
 from app.database import db_service
+from app.typeahead import typeahead_index
+from app.dataloader import load_by_id
+from app.performance import span, performance_monitor
 from passlib.context import CryptContext
 
 # JWT Configuration
@@ -39,7 +42,7 @@ class AuthService:
 
             # Create new user
             user_id = self.generate_user_id()
-            await self.db.transact([
+            result = await self.db.transact([
                 {
                     "users": {
                         "create": {
@@ -52,6 +55,9 @@ class AuthService:
                 }
             ])
 
+            if "error" not in result:
+                typeahead_index.add_user({"id": user_id, "email": email, "name": name})
+
             return {
                 "success": True,
                 "user_id": user_id,
@@ -75,11 +81,12 @@ class AuthService:
             
             # If user doesn't exist, create them with default role
             if not existing_user.get("users"):
-                await self.db.transact([
+                user_id = self.generate_user_id()
+                result = await self.db.transact([
                     {
                         "users": {
                             "create": {
-                                "id": self.generate_user_id(),
+                                "id": user_id,
                                 "email": email,
                                 "role": "developer",  # Default role
                                 "created_at": int(datetime.now().timestamp())
@@ -87,6 +94,9 @@ class AuthService:
                         }
                     }
                 ])
+
+                if "error" not in result:
+                    typeahead_index.add_user({"id": user_id, "email": email})
             
             # Generate magic link token
             token_data = {
@@ -175,6 +185,7 @@ class AuthService:
                 detail=f"Failed to verify magic link: {str(e)}"
             )
     
+    @span("auth")
     async def get_current_user(self, credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
         """Get current user from JWT token"""
         try:
@@ -188,22 +199,14 @@ class AuthService:
                     detail="Invalid token type"
                 )
             
-            # Get user from database
-            user_result = await self.db.query({
-                "users": {
-                    "where": {"id": payload["sub"]}
-                }
-            })
-            
-            users = user_result.get("users", [])
-            if not users:
+            # Get user from database, batched with other lookups in the request
+            user = await load_by_id(self.db, "users", payload["sub"])
+            if not user:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="User not found"
                 )
             
-            user = users[0]
-            
             return {
                 "id": user["id"],
                 "email": user["email"],
@@ -260,7 +263,7 @@ class AuthService:
 
             # Create new user with password
             user_id = self.generate_user_id()
-            await self.db.transact([
+            result = await self.db.transact([
                 {
                     "users": {
                         "create": {
@@ -275,6 +278,9 @@ class AuthService:
                 }
             ])
 
+            if "error" not in result:
+                typeahead_index.add_user({"id": user_id, "email": email, "name": name})
+
             return {
                 "success": True,
                 "user_id": user_id,
@@ -346,6 +352,26 @@ class AuthService:
                 "error": f"Login failed: {str(e)}"
             }
 
+    async def suggest_users(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Suggest users by email or name prefix"""
+        try:
+            performance_monitor.record_cache("typeahead", typeahead_index.users_loaded)
+            if not typeahead_index.users_loaded:
+                await self.load_user_directory()
+
+            return typeahead_index.suggest_users(prefix, limit)
+        except Exception:
+            return []
+
+    async def load_user_directory(self) -> bool:
+        """(Re)load every user into the typeahead index"""
+        result = await self.db.query({"users": {}})
+        # A failed query returns no collection; keep the old directory
+        if "users" not in result:
+            return False
+        typeahead_index.load_users(result["users"])
+        return True
+
 # Global auth service instance
 auth_service = AuthService()
 
@@ -354,6 +380,7 @@ async def get_current_user_dependency(current_user: Dict[str, Any] = Depends(aut
     return current_user
 
 # Optional authentication - returns a test user if no token is provided
+@span("auth")
 async def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))) -> Dict[str, Any]:
     """Get current user, or return a test user if no credentials provided"""
     if not credentials:
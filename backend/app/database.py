@@ -2,10 +2,14 @@ import os
 import requests
 import logging
 from typing import Optional, Dict, Any
+from app.performance import span
 import json
 
 logger = logging.getLogger(__name__)
 
+# Collections known to the backend schema
+COLLECTIONS = ["users", "projects", "tasks", "task_tombstones"]
+
 class InstantDBService:
     def __init__(self):
         self.app_id = os.getenv("INSTANTDB_APP_ID")
@@ -21,6 +25,10 @@ class InstantDBService:
         }
         if self.admin_token:
             self.headers["Authorization"] = f"Bearer {self.admin_token}"
+
+        # Optional durable local outbox for writes (see app/outbox.py)
+        self.outbox_path = os.getenv("INSTANTDB_OUTBOX_PATH")
+        self.outbox = None
         
     async def init_schema(self):
         """Initialize the database schema with collections and permissions"""
@@ -46,9 +54,12 @@ class InstantDBService:
                         "name": {"type": "string"},
                         "description": {"type": "string"},
                         "owner_id": {"type": "string"},
-                        "created_at": {"type": "number"}
+                        "created_at": {"type": "number"},
+                        "status": {"type": "string", "values": ["active", "deleting"]},
+                        "deletion_started_at": {"type": "number"},
+                        "deleted_task_count": {"type": "number"}
                     },
-                    "indexes": ["owner_id"]
+                    "indexes": ["owner_id", "status"]
                 },
                 "tasks": {
                     "fields": {
@@ -59,10 +70,34 @@ class InstantDBService:
                         "status": {"type": "string", "values": ["todo", "in_progress", "done"]},
                         "acceptance_criteria": {"type": "string"},
                         "assignee_id": {"type": "string"},
+                        "rank": {"type": "string"},
                         "created_at": {"type": "number"},
                         "updated_at": {"type": "number"}
                     },
-                    "indexes": ["project_id", "assignee_id", "status"]
+                    "indexes": ["project_id", "assignee_id", "status", "updated_at"]
+                },
+                "task_tombstones": {
+                    "fields": {
+                        "id": {"type": "string"},
+                        "project_id": {"type": "string"},
+                        "deleted_at": {"type": "number"}
+                    },
+                    "indexes": ["project_id", "deleted_at"]
+                }
+            }
+
+            # Links let nested queries follow foreign keys, e.g. a project's
+            # tasks and each task's assignee
+            link_definitions = {
+                "projectTasks": {
+                    "forward": {"on": "projects", "has": "many", "label": "tasks"},
+                    "reverse": {"on": "tasks", "has": "one", "label": "project"},
+                    "field": "project_id"
+                },
+                "taskAssignee": {
+                    "forward": {"on": "tasks", "has": "one", "label": "assignee"},
+                    "reverse": {"on": "users", "has": "many", "label": "assigned_tasks"},
+                    "field": "assignee_id"
                 }
             }
 
@@ -78,7 +113,8 @@ class InstantDBService:
 
                 schema_payload = {
                     "app-id": self.app_id,
-                    "schema": schema_definitions
+                    "schema": schema_definitions,
+                    "links": link_definitions
                 }
 
                 # Attempt to initialize schema via InstantDB admin API
@@ -120,7 +156,12 @@ class InstantDBService:
             return False
     
     def get_client(self):
-        """Get the InstantDB service instance"""
+        """Get the InstantDB client, journaling writes through the local outbox when configured"""
+        if self.outbox_path:
+            if self.outbox is None:
+                from app.outbox import InstantDBOutbox
+                self.outbox = InstantDBOutbox(self, self.outbox_path)
+            return self.outbox
         return self
 
     async def query(self, query_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -136,7 +177,7 @@ class InstantDBService:
                 return {}
 
             # Check for required query keys
-            if not any(key in query_data for key in ['users', 'projects', 'tasks']):
+            if not any(key in query_data for key in COLLECTIONS):
                 logger.warning(f"Query contains no valid collection names. Got keys: {list(query_data.keys())}")
 
             url = f"{self.api_base}/api/query"
@@ -145,8 +186,11 @@ class InstantDBService:
                 "query": query_data
             }
 
-            response = requests.post(url, json=payload, headers=self.headers)
-            response.raise_for_status()
+            with span("db", "query") as db_span:
+                db_span.annotate(collection=",".join(query_data))
+                response = requests.post(url, json=payload, headers=self.headers)
+                response.raise_for_status()
+                db_span.annotate(bytes=len(response.content))
             return response.json()
         except Exception as e:
             logger.error(f"Query error: {e}")
@@ -175,7 +219,7 @@ class InstantDBService:
                     return {"error": f"Transaction step {i} must be a dictionary"}
 
                 # Check for required collection name in step
-                if not any(key in step for key in ['users', 'projects', 'tasks']):
+                if not any(key in step for key in COLLECTIONS):
                     logger.warning(f"Transaction step {i} contains no valid collection. Got keys: {list(step.keys())}")
 
             url = f"{self.api_base}/api/transact"
@@ -184,8 +228,12 @@ class InstantDBService:
                 "tx-steps": transaction_data
             }
 
-            response = requests.post(url, json=payload, headers=self.headers)
-            response.raise_for_status()
+            with span("db", "transact") as db_span:
+                collections = sorted({key for step in transaction_data for key in step if key in COLLECTIONS})
+                db_span.annotate(collection=",".join(collections), steps=len(transaction_data))
+                response = requests.post(url, json=payload, headers=self.headers)
+                response.raise_for_status()
+                db_span.annotate(bytes=len(response.content))
             return response.json()
         except Exception as e:
             logger.error(f"Transaction error: {e}")
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.database import db_service
+from app.performance import performance_monitor
+
+logger = logging.getLogger(__name__)
+
+_current_loader: ContextVar[Optional["DataLoader"]] = ContextVar("dataloader", default=None)
+
+class DataLoader:
+    """Batches and memoizes lookups by id for the duration of one request.
+
+    Lookups issued in the same event-loop tick are collected per collection
+    and sent as a single "where id in [...]" query on the next tick. Results,
+    including misses, are memoized until a write clears them.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.cache: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.batches: Dict[str, Dict[str, asyncio.Future]] = {}
+
+    async def load(self, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        """Get a record by id, or None if it does not exist"""
+        future = self.cache.get((collection, record_id))
+        performance_monitor.record_cache("dataloader", future is not None)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self.cache[(collection, record_id)] = future
+
+            batch = self.batches.get(collection)
+            if batch is None:
+                batch = self.batches[collection] = {}
+                loop.call_soon(self._dispatch, collection)
+            batch[record_id] = future
+
+        record = await asyncio.shield(future)
+        return dict(record) if record else None
+
+    async def load_many(self, collection: str, record_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Get several records by id in one batch, in the order given"""
+        return list(await asyncio.gather(*(self.load(collection, record_id) for record_id in record_ids)))
+
+    def clear(self, collection: str, record_id: str):
+        """Forget a memoized record after it was written"""
+        self.cache.pop((collection, record_id), None)
+
+    def _dispatch(self, collection: str):
+        batch = self.batches.pop(collection)
+        asyncio.ensure_future(self._fetch(collection, batch))
+
+    async def _fetch(self, collection: str, batch: Dict[str, asyncio.Future]):
+        record_ids = list(batch)
+        where = {"id": record_ids[0]} if len(record_ids) == 1 else {"id": {"$in": record_ids}}
+
+        try:
+            result = await self.db.query({collection: {"where": where}})
+        except Exception as e:
+            logger.error(f"Error loading {collection} {record_ids}: {e}")
+            result = {}
+
+        if collection not in result:
+            # Failed lookups are not memoized, so a later load retries them
+            for record_id, future in batch.items():
+                if self.cache.get((collection, record_id)) is future:
+                    del self.cache[(collection, record_id)]
+                future.set_result(None)
+            return
+
+        records = {record["id"]: record for record in result[collection]}
+        for record_id, future in batch.items():
+            future.set_result(records.get(record_id))
+
+def get_loader() -> Optional[DataLoader]:
+    """Get the current request's loader, if any"""
+    return _current_loader.get()
+
+async def load_by_id(db, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+    """Get a record by id through the request's loader, or with a direct query outside requests"""
+    loader = _current_loader.get()
+    if loader:
+        return await loader.load(collection, record_id)
+
+    result = await db.query({
+        collection: {
+            "where": {"id": record_id}
+        }
+    })
+    records = result.get(collection, [])
+    return records[0] if records else None
+
+def invalidate(collection: str, record_id: str):
+    """Drop a record from the request's loader after writing it"""
+    loader = _current_loader.get()
+    if loader:
+        loader.clear(collection, record_id)
+
+class DataLoaderMiddleware:
+    """Gives every HTTP request its own DataLoader"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _current_loader.set(DataLoader(db_service.get_client()))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_loader.reset(token)
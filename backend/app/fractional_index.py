@@ -0,0 +1,171 @@
+"""
+Fractional indexing for ordering tasks within a board column.
+
+Keys are base-62 strings that sort lexicographically. A key has an integer
+part, whose length is encoded by its first character ("a" = 1 digit,
+"b" = 2 digits, ..., "A"-"Z" for negative integers), followed by an optional
+fractional part. A new key can always be generated between any two keys,
+so moving a task only rewrites that task's key.
+"""
+
+from typing import List, Optional
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+
+# The smallest possible integer part; nothing sorts before it
+SMALLEST_INTEGER = "A" + DIGITS[0] * 26
+
+def _integer_length(head: str) -> int:
+    if "a" <= head <= "z":
+        return ord(head) - ord("a") + 2
+    if "A" <= head <= "Z":
+        return ord("Z") - ord(head) + 2
+    raise ValueError(f"Invalid order key head: {head}")
+
+def _integer_part(key: str) -> str:
+    length = _integer_length(key[0])
+    if length > len(key):
+        raise ValueError(f"Invalid order key: {key}")
+    return key[:length]
+
+def validate_key(key: str):
+    """Raise ValueError if key is not a valid order key"""
+    if not key or key == SMALLEST_INTEGER:
+        raise ValueError(f"Invalid order key: {key}")
+    integer = _integer_part(key)
+    if any(char not in DIGITS for char in key[1:]):
+        raise ValueError(f"Invalid order key: {key}")
+    if key[len(integer):].endswith(DIGITS[0]):
+        raise ValueError(f"Invalid order key: {key}")
+
+def _midpoint(a: str, b: Optional[str]) -> str:
+    """Fractional part strictly between a and b (b=None meaning 1)"""
+    if b is not None and a >= b:
+        raise ValueError(f"{a} >= {b}")
+
+    if b:
+        # Keep the common prefix and recurse on the rest
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else DIGITS[0]) == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b else BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+
+    # Adjacent digits: extend a, or take b's first digit if b has more
+    if b and len(b) > 1:
+        return b[:1]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+def _increment_integer(integer: str) -> Optional[str]:
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        value = DIGITS.index(digits[i]) + 1
+        if value < BASE:
+            digits[i] = DIGITS[value]
+            return head + "".join(digits)
+        digits[i] = DIGITS[0]
+
+    # Carried out of the integer: move to the next length
+    if head == "Z":
+        return "a" + DIGITS[0]
+    if head == "z":
+        return None
+    next_head = chr(ord(head) + 1)
+    if next_head > "a":
+        digits.append(DIGITS[0])
+    else:
+        digits.pop()
+    return next_head + "".join(digits)
+
+def _decrement_integer(integer: str) -> Optional[str]:
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        value = DIGITS.index(digits[i]) - 1
+        if value >= 0:
+            digits[i] = DIGITS[value]
+            return head + "".join(digits)
+        digits[i] = DIGITS[-1]
+
+    if head == "a":
+        return "Z" + DIGITS[-1]
+    if head == "A":
+        return None
+    next_head = chr(ord(head) - 1)
+    if next_head < "Z":
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return next_head + "".join(digits)
+
+def generate_key_between(a: Optional[str], b: Optional[str]) -> str:
+    """Generate a key that sorts strictly between a and b.
+
+    None means "before everything" for a and "after everything" for b.
+    Raises ValueError if a key is invalid or a >= b.
+    """
+    if a is not None:
+        validate_key(a)
+    if b is not None:
+        validate_key(b)
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f"{a} >= {b}")
+
+    if a is None:
+        if b is None:
+            return "a" + DIGITS[0]
+        integer_b = _integer_part(b)
+        fraction_b = b[len(integer_b):]
+        if integer_b == SMALLEST_INTEGER:
+            return integer_b + _midpoint("", fraction_b)
+        if integer_b < b:
+            return integer_b
+        decremented = _decrement_integer(integer_b)
+        if decremented is None:
+            raise ValueError("Cannot decrement any more")
+        return decremented
+
+    integer_a = _integer_part(a)
+    fraction_a = a[len(integer_a):]
+
+    if b is None:
+        incremented = _increment_integer(integer_a)
+        return incremented if incremented is not None else integer_a + _midpoint(fraction_a, None)
+
+    integer_b = _integer_part(b)
+    fraction_b = b[len(integer_b):]
+    if integer_a == integer_b:
+        return integer_a + _midpoint(fraction_a, fraction_b)
+
+    incremented = _increment_integer(integer_a)
+    if incremented is None:
+        raise ValueError("Cannot increment any more")
+    if incremented < b:
+        return incremented
+    return integer_a + _midpoint(fraction_a, None)
+
+def key_for_integer(value: int) -> str:
+    """Encode a non-negative integer as an order key that sorts numerically"""
+    digits = ""
+    while True:
+        value, remainder = divmod(value, BASE)
+        digits = DIGITS[remainder] + digits
+        if value == 0:
+            break
+    if len(digits) > 26:
+        raise ValueError("Integer too large for an order key")
+    return chr(ord("a") + len(digits) - 1) + digits
+
+def sequential_keys(count: int) -> List[str]:
+    """Generate count short, evenly spaced keys in ascending order"""
+    keys = []
+    key = None
+    for _ in range(count):
+        key = generate_key_between(key, None)
+        keys.append(key)
+    return keys
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Deque, List, Optional
+
+from app.performance import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Only frames under this directory count as blocking call sites
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MAX_BLOCKING_SITES = 50
+RECENT_STALL_RING_SIZE = 20
+STACK_DEPTH = 20
+
+def describe_frame(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_filename}:{frame.f_lineno} in {code.co_name}"
+
+class EventLoopMonitor:
+    """Measures event-loop scheduling lag and catches what blocks the loop.
+
+    A coroutine sleeps for `interval` and records how late it wakes up. A
+    watchdog thread checks when that wake-up is overdue by more than
+    `threshold` and captures the loop thread's stack while it is still
+    stuck; the stall's duration is attributed to the innermost app frame
+    once the loop recovers. Code that holds the GIL for the whole stall
+    cannot be sampled and is reported as "unknown".
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1):
+        self.interval = interval
+        self.threshold = threshold
+        self.reset()
+        self.loop_thread: Optional[int] = None
+        self.deadline: Optional[float] = None
+        self.captured_deadline: Optional[float] = None
+        self.pending_stack: Optional[List[str]] = None
+        self.stopped = threading.Event()
+
+    def reset(self):
+        """Reset lag statistics"""
+        self.lag = LatencyHistogram()
+        self.stalls = 0
+        self.sites: Dict[str, Dict[str, Any]] = {}
+        self.recent_stalls: Deque[Dict[str, Any]] = deque(maxlen=RECENT_STALL_RING_SIZE)
+
+    async def run(self):
+        """Measure lag forever"""
+        self.loop_thread = threading.get_ident()
+        self.stopped.clear()
+        watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                deadline = time.perf_counter() + self.interval
+                self.deadline = deadline
+                await asyncio.sleep(self.interval)
+                self.record(max(0.0, time.perf_counter() - deadline), deadline)
+        finally:
+            self.stopped.set()
+
+    def record(self, lag: float, deadline: Optional[float] = None):
+        """Record one lag measurement"""
+        self.lag.record(lag)
+        if lag <= self.threshold:
+            return
+
+        self.stalls += 1
+        stack = self.pending_stack if deadline is not None and self.captured_deadline == deadline else None
+        self.pending_stack = None
+        site = self._site(stack)
+
+        stats = self.sites.get(site)
+        if stats is None:
+            if len(self.sites) >= MAX_BLOCKING_SITES:
+                # Make room by forgetting the site that blocked least
+                del self.sites[min(self.sites, key=lambda key: self.sites[key]["total_blocked"])]
+            stats = self.sites[site] = {"site": site, "stalls": 0, "total_blocked": 0.0, "max_blocked": 0.0}
+        stats["stalls"] += 1
+        stats["total_blocked"] += lag
+        stats["max_blocked"] = max(stats["max_blocked"], lag)
+        stats["stack"] = stack or []
+
+        self.recent_stalls.append({"site": site, "lag": lag, "timestamp": time.time(), "stack": stack or []})
+        logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms at {site}")
+
+    def _site(self, stack: Optional[List[str]]) -> str:
+        if not stack:
+            return "unknown"
+        for entry in stack:
+            if entry.startswith(APP_ROOT) and "/site-packages/" not in entry:
+                return entry
+        return stack[0]
+
+    def _watch(self):
+        while not self.stopped.wait(self.interval / 2):
+            deadline = self.deadline
+            if deadline is None or deadline == self.captured_deadline:
+                continue
+            if time.perf_counter() - deadline <= self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread)
+            stack = []
+            while frame is not None and len(stack) < STACK_DEPTH:
+                stack.append(describe_frame(frame))
+                frame = frame.f_back
+            # Innermost frame first
+            self.pending_stack = stack
+            self.captured_deadline = deadline
+
+    def get_stats(self, top: int = 10) -> Dict[str, Any]:
+        """Get the lag distribution and the call sites that blocked longest"""
+        sites = sorted(self.sites.values(), key=lambda site: site["total_blocked"], reverse=True)
+        return {
+            "samples": self.lag.count,
+            "avg_lag": self.lag.mean(),
+            "p50_lag": self.lag.percentile(50),
+            "p99_lag": self.lag.percentile(99),
+            "max_lag": self.lag.max,
+            "threshold": self.threshold,
+            "stalls": self.stalls,
+            "blocking_sites": [{key: value for key, value in site.items() if key != "stack"} for site in sites[:top]]
+        }
+
+    def get_blocking_report(self, top: int = 10) -> Dict[str, Any]:
+        """Get blocking call sites with their last captured stacks, and recent stalls"""
+        sites = sorted(self.sites.values(), key=lambda site: site["total_blocked"], reverse=True)
+        return {
+            "blocking_sites": sites[:top],
+            "recent_stalls": list(self.recent_stalls)
+        }
+
+# Global event loop monitor; EVENT_LOOP_LAG_THRESHOLD_MS sets when a stall is reported
+event_loop_monitor = EventLoopMonitor(threshold=int(os.getenv("EVENT_LOOP_LAG_THRESHOLD_MS", "100")) / 1000)
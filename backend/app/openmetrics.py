@@ -0,0 +1,115 @@
+"""
+OpenMetrics text exposition of PerformanceMonitor data.
+
+Everything rendered here is already aggregated, so a scrape costs time
+proportional to the number of series, not to the number of requests served.
+"""
+
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.performance import (
+    PerformanceMonitor, LatencyHistogram, HISTOGRAM_BUCKETS, HISTOGRAM_SUBBUCKETS, bucket_upper_bound
+)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Exposed histogram buckets: every power of two from 100us, a subset of the
+# monitor's finer buckets so they can be summed exactly
+EXPOSED_BUCKETS = list(range(0, HISTOGRAM_BUCKETS - 1, HISTOGRAM_SUBBUCKETS))
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(str(value))}"' for name, value in labels) + "}"
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def histogram_lines(name: str, labels: List[Tuple[str, str]], histogram: LatencyHistogram) -> List[str]:
+    """Render a latency histogram as cumulative OpenMetrics buckets"""
+    lines = []
+    cumulative = 0
+    exposed = iter(EXPOSED_BUCKETS)
+    next_bound = next(exposed, None)
+    for index, count in enumerate(histogram.counts):
+        cumulative += count
+        if index == next_bound:
+            le = format_value(bucket_upper_bound(index))
+            lines.append(f"{name}_bucket{format_labels(labels + [('le', le)])} {cumulative}")
+            next_bound = next(exposed, None)
+    lines.append(f"{name}_bucket{format_labels(labels + [('le', '+Inf')])} {histogram.count}")
+    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+    lines.append(f"{name}_sum{format_labels(labels)} {format_value(histogram.total)}")
+    return lines
+
+def render(monitor: PerformanceMonitor, event_loop_lag: Optional[LatencyHistogram] = None) -> str:
+    """Render all monitor metrics, and optionally event loop lag, in OpenMetrics text format"""
+    lines = [
+        "# TYPE http_request_duration_seconds histogram",
+        "# UNIT http_request_duration_seconds seconds",
+        "# HELP http_request_duration_seconds Request latency by route.",
+    ]
+    for route, metrics in sorted(monitor.endpoints.items()):
+        lines.extend(histogram_lines("http_request_duration_seconds", [("route", route)], metrics.latency))
+
+    lines.extend([
+        "# TYPE http_request_errors counter",
+        "# HELP http_request_errors Requests answered with a 4xx or 5xx status, by route.",
+    ])
+    for route, metrics in sorted(monitor.endpoints.items()):
+        lines.append(f"http_request_errors_total{format_labels([('route', route)])} {metrics.errors}")
+
+    lines.extend([
+        "# TYPE http_request_span_seconds counter",
+        "# UNIT http_request_span_seconds seconds",
+        "# HELP http_request_span_seconds Time spent in auth, db, ai and serialize spans, by route.",
+    ])
+    for route, metrics in sorted(monitor.endpoints.items()):
+        for span_name, (_, seconds) in sorted(metrics.spans.items()):
+            labels = format_labels([("route", route), ("span", span_name)])
+            lines.append(f"http_request_span_seconds_total{labels} {format_value(seconds)}")
+
+    # One histogram and error counter family per dependency, e.g. db_call_duration_seconds
+    calls_by_kind: Dict[str, List] = {}
+    for (kind, operation), metrics in sorted(monitor.calls.items()):
+        calls_by_kind.setdefault(kind, []).append((operation, metrics))
+    for kind, calls in calls_by_kind.items():
+        lines.extend([
+            f"# TYPE {kind}_call_duration_seconds histogram",
+            f"# UNIT {kind}_call_duration_seconds seconds",
+            f"# HELP {kind}_call_duration_seconds Duration of {kind} calls, by operation.",
+        ])
+        for operation, metrics in calls:
+            lines.extend(histogram_lines(f"{kind}_call_duration_seconds", [("operation", operation)], metrics.latency))
+        lines.extend([
+            f"# TYPE {kind}_call_errors counter",
+            f"# HELP {kind}_call_errors {kind} calls that raised, by operation.",
+        ])
+        for operation, metrics in calls:
+            lines.append(f"{kind}_call_errors_total{format_labels([('operation', operation)])} {metrics.errors}")
+
+    counters_by_name: Dict[str, List] = {}
+    for (name, labels), value in sorted(monitor.counters.items()):
+        counters_by_name.setdefault(name, []).append((labels, value))
+    for name, series in counters_by_name.items():
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in series:
+            lines.append(f"{name}_total{format_labels(labels)} {value}")
+
+    if event_loop_lag is not None:
+        lines.extend([
+            "# TYPE event_loop_lag_seconds histogram",
+            "# UNIT event_loop_lag_seconds seconds",
+            "# HELP event_loop_lag_seconds How late the event loop ran a scheduled wake-up.",
+        ])
+        lines.extend(histogram_lines("event_loop_lag_seconds", [], event_loop_lag))
+
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,346 @@
+import asyncio
+import bisect
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How often the replaying worker looks for rows other workers journaled,
+# and how often the others try to take over replay
+POLL_INTERVAL = 0.5
+
+def matches_where(record: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Check a record against a query where clause"""
+    for field, condition in (where or {}).items():
+        value = record.get(field)
+        if isinstance(condition, dict):
+            for op, operand in condition.items():
+                if op == "$in" and value not in operand:
+                    return False
+                if op in ("$gt", "$gte", "$lt", "$lte") and value is None:
+                    return False
+                if op == "$gt" and not value > operand:
+                    return False
+                if op == "$gte" and not value >= operand:
+                    return False
+                if op == "$lt" and not value < operand:
+                    return False
+                if op == "$lte" and not value <= operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+def where_ids(where: Optional[Dict[str, Any]]) -> List[str]:
+    """Get the record ids a where clause pins, if it selects by id"""
+    condition = (where or {}).get("id")
+    if isinstance(condition, str):
+        return [condition]
+    if isinstance(condition, dict) and isinstance(condition.get("$in"), list):
+        return condition["$in"]
+    return []
+
+class InstantDBOutbox:
+    """Durable local outbox in front of InstantDB writes.
+
+    transact() appends the transaction to a SQLite journal, synced to disk
+    before returning, and a background replayer sends journaled transactions
+    to InstantDB strictly in order, retrying with backoff. query() overlays
+    writes that have not been replayed yet onto InstantDB results, so reads
+    see accepted writes. Transactions that keep failing are parked as dead
+    after max_attempts so they cannot block the queue forever. Journal
+    writes wait for a disk sync, so they run on one writer thread, which
+    keeps the event loop free and journal order equal to call order.
+
+    Workers sharing a journal all mirror every undelivered row, so reads see
+    each other's writes, but only the worker holding the journal lock
+    replays; another takes over when it exits.
+    """
+
+    def __init__(self, db, path: str, max_attempts: int = 10, max_backoff: float = 30.0):
+        self.db = db
+        self.path = path
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox-writer")
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                steps TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                dead INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self.lock_file = open(path + ".lock", "a")
+        self.replaying = False
+
+        # In-memory mirror of the journal's undelivered transactions, in journal order
+        self.pending: List[Tuple[int, list]] = []
+        # Last journal row seen by a sync, and last row this worker replayed
+        self.synced_seq = 0
+        self.replayed_seq = 0
+        self.data_version = None
+        self._merge(self._sync(0))
+        self.wakeup: Optional[asyncio.Event] = None
+
+    def get_client(self):
+        """Get the outbox client"""
+        return self
+
+    def _sync(self, after: int) -> Optional[Tuple[int, Set[int], List[Tuple[int, list]]]]:
+        """Read the journal if another worker changed it since the last sync.
+
+        Returns the last row id assigned, the undelivered row ids and the
+        rows added after `after`, or None if the journal is unchanged.
+        """
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return None
+        self.data_version = data_version
+
+        self.conn.execute("BEGIN")
+        try:
+            row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'outbox'").fetchone()
+            rows = self.conn.execute(
+                "SELECT seq, CASE WHEN seq > ? THEN steps END FROM outbox WHERE dead = 0 ORDER BY seq",
+                (after,)
+            ).fetchall()
+        finally:
+            self.conn.execute("COMMIT")
+
+        live = {seq for seq, _ in rows}
+        added = [(seq, json.loads(steps)) for seq, steps in rows if steps is not None]
+        return (row[0] if row else 0), live, added
+
+    def _merge(self, synced: Optional[Tuple[int, Set[int], List[Tuple[int, list]]]]):
+        """Apply a sync to the pending mirror"""
+        if synced is None:
+            return
+        last_seq, live, added = synced
+        # Rows journaled after the sync read the journal are still pending
+        self.pending = [item for item in self.pending if item[0] in live or item[0] > last_seq]
+        for seq, steps in added:
+            self._add_pending(seq, steps)
+        self.synced_seq = max(self.synced_seq, last_seq)
+
+    def _add_pending(self, seq: int, steps: list):
+        if seq <= self.replayed_seq:
+            return
+        position = bisect.bisect_left(self.pending, seq, key=lambda pending: pending[0])
+        if position == len(self.pending) or self.pending[position][0] != seq:
+            self.pending.insert(position, (seq, steps))
+
+    async def _refresh(self):
+        """Bring the pending mirror up to date with other workers' writes and deliveries"""
+        synced = await asyncio.get_running_loop().run_in_executor(self.writer, self._sync, self.synced_seq)
+        self._merge(synced)
+
+    def _try_lock(self) -> bool:
+        """Try to become the worker that replays the journal"""
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def _execute(self, sql: str, params: tuple) -> Tuple[int, list]:
+        cursor = self.conn.execute(sql, params)
+        return cursor.lastrowid, cursor.fetchall()
+
+    async def _write(self, sql: str, params: tuple) -> Tuple[int, list]:
+        """Run a journal write on the writer thread, returning its row id and rows"""
+        return await asyncio.get_running_loop().run_in_executor(self.writer, self._execute, sql, params)
+
+    async def transact(self, transaction_data: list) -> Dict[str, Any]:
+        """Journal a transaction for delivery to InstantDB"""
+        if not transaction_data or not isinstance(transaction_data, list):
+            return {"error": "Transaction data must be a non-empty list"}
+        if not all(isinstance(step, dict) for step in transaction_data):
+            return {"error": "Transaction steps must be dictionaries"}
+
+        try:
+            seq, _ = await self._write(
+                "INSERT INTO outbox (steps, created_at) VALUES (?, ?)",
+                (json.dumps(transaction_data), time.time())
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Outbox append error: {e}")
+            return {"error": str(e)}
+
+        self._add_pending(seq, transaction_data)
+        if self.wakeup:
+            self.wakeup.set()
+
+        return {"queued": True, "outbox_seq": seq}
+
+    async def query(self, query_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Query InstantDB and overlay writes that have not been replayed yet.
+
+        Paged queries fetch extra rows to make up for rows pending deletes
+        and updates may remove, and records that pending updates may move
+        into the results are fetched by id, so overlaid pages stay complete.
+        """
+        await self._refresh()
+        if not self.pending or not isinstance(query_data, dict):
+            return await self.db.query(query_data)
+
+        sent = dict(query_data)
+        pending_writes = {}
+        for collection, spec in query_data.items():
+            if isinstance(spec, dict):
+                changes, _ = pending_writes[collection] = self._pending_writes(collection, spec)
+                if changes and "limit" in spec:
+                    sent[collection] = {**spec, "limit": spec["limit"] + changes}
+
+        result = await self.db.query(sent)
+        for collection, (_, updated_ids) in pending_writes.items():
+            if collection not in result:
+                continue
+            records = result[collection]
+            missing = sorted(updated_ids - {record.get("id") for record in records})
+            if missing:
+                spec = query_data[collection]
+                by_id = {key: value for key, value in spec.items() if key not in ("where", "order", "limit")}
+                by_id["where"] = {"id": {"$in": missing}}
+                fetched = await self.db.query({collection: by_id})
+                records = records + fetched.get(collection, [])
+            result[collection] = self._overlay(collection, query_data[collection], records)
+        return result
+
+    def _pending_writes(self, collection: str, spec: Dict[str, Any]) -> Tuple[int, set]:
+        """Count pending changes to a collection and get the ids updates may move into a query's results"""
+        fields = set(spec.get("where") or {}) | set(spec.get("order") or {})
+        changes = 0
+        updated_ids = set()
+        for _, steps in self.pending:
+            for step in steps:
+                operation = step.get(collection)
+                if not operation:
+                    continue
+                if "update" in operation or "delete" in operation:
+                    changes += 1
+                if "update" in operation:
+                    update = operation["update"]
+                    if fields & set(update.get("set") or update.get("data") or {}):
+                        updated_ids.update(where_ids(update.get("where")))
+        return changes, updated_ids
+
+    def _overlay(self, collection: str, spec: Dict[str, Any],
+                 records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        by_id = {record.get("id"): dict(record) for record in records}
+
+        for _, steps in self.pending:
+            for step in steps:
+                operation = step.get(collection)
+                if not operation:
+                    continue
+                if "create" in operation:
+                    created = operation["create"]
+                    by_id[created.get("id")] = dict(created)
+                if "update" in operation:
+                    update = operation["update"]
+                    fields = update.get("set") or update.get("data") or {}
+                    for record in by_id.values():
+                        if matches_where(record, update.get("where")):
+                            record.update(fields)
+                if "delete" in operation:
+                    delete_where = operation["delete"].get("where")
+                    for record_id in [key for key, record in by_id.items() if matches_where(record, delete_where)]:
+                        del by_id[record_id]
+
+        overlaid = [record for record in by_id.values() if matches_where(record, spec.get("where"))]
+
+        # Keep paged queries consistent: re-sort, then cut back to the page size
+        for field, direction in (spec.get("order") or {}).items():
+            overlaid.sort(key=lambda record: (record.get(field) is None, record.get(field)),
+                          reverse=direction == "desc")
+        if "limit" in spec:
+            overlaid = overlaid[:spec["limit"]]
+        return overlaid
+
+    def status(self) -> Dict[str, Any]:
+        """Get outbox queue depth"""
+        dead = self.conn.execute("SELECT COUNT(*) FROM outbox WHERE dead = 1").fetchone()[0]
+        oldest = self.conn.execute("SELECT MIN(created_at) FROM outbox WHERE dead = 0").fetchone()[0]
+        return {
+            "pending": len(self.pending),
+            "dead": dead,
+            "oldest_pending_age": round(time.time() - oldest, 3) if oldest else 0
+        }
+
+    def _delivered(self, seq: int):
+        """Drop a replayed or parked row from the pending mirror"""
+        self.replayed_seq = max(self.replayed_seq, seq)
+        self.pending = [item for item in self.pending if item[0] != seq]
+
+    async def run(self):
+        """Replay every worker's journaled transactions to InstantDB in order, forever.
+
+        Only the worker holding the journal lock replays; the others wait
+        to take over.
+        """
+        self.wakeup = asyncio.Event()
+        try:
+            while True:
+                if not self.replaying:
+                    self.replaying = self._try_lock()
+                    if not self.replaying:
+                        # Keep the mirror, and status(), current while waiting
+                        await self._refresh()
+                        await asyncio.sleep(POLL_INTERVAL)
+                        continue
+                    logger.info(f"Outbox worker {os.getpid()} is replaying the journal")
+
+                # Rows journaled earlier by other workers go first
+                await self._refresh()
+                if not self.pending:
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                seq, steps = self.pending[0]
+                try:
+                    result = await self.db.transact(steps)
+                    error = result.get("error")
+                except Exception as e:
+                    error = str(e)
+
+                if not error:
+                    await self._write("DELETE FROM outbox WHERE seq = ?", (seq,))
+                    self._delivered(seq)
+                    continue
+
+                _, rows = await self._write(
+                    "UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE seq = ? RETURNING attempts",
+                    (error, seq)
+                )
+                attempts = rows[0][0]
+
+                if attempts >= self.max_attempts:
+                    logger.error(f"Outbox transaction {seq} failed {attempts} times, parking it: {error}")
+                    await self._write("UPDATE outbox SET dead = 1 WHERE seq = ?", (seq,))
+                    self._delivered(seq)
+                    continue
+
+                backoff = min(self.max_backoff, 0.5 * 2 ** attempts)
+                logger.warning(f"Outbox transaction {seq} failed (attempt {attempts}), retrying in {backoff}s: {error}")
+                await asyncio.sleep(backoff)
+        finally:
+            if self.replaying:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+                self.replaying = False
@@ -1,51 +1,454 @@
+import asyncio
+import hashlib
+import heapq
+import json
+import os
 import time
+import math
 import functools
-from typing import Callable, Any, Dict
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from array import array
+from collections import deque
+from contextvars import ContextVar
+from urllib.parse import parse_qsl
+from typing import Callable, Any, Deque, Dict, List, Optional, Tuple
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+
+# Latency histogram layout: bucket 0 holds values under HISTOGRAM_MIN, then
+# HISTOGRAM_SUBBUCKETS log-spaced buckets per doubling up to HISTOGRAM_MAX,
+# then one overflow bucket. Each bucket spans ~9%, so percentiles read from
+# bucket bounds are within ~4.5% of the true value.
+HISTOGRAM_MIN = 0.0001
+HISTOGRAM_MAX = 100.0
+HISTOGRAM_SUBBUCKETS = 8
+HISTOGRAM_BUCKETS = math.ceil(math.log2(HISTOGRAM_MAX / HISTOGRAM_MIN) * HISTOGRAM_SUBBUCKETS) + 2
+
+SLOW_REQUEST_THRESHOLD = 0.5  # 500ms
+SLOW_REQUEST_RING_SIZE = 100
+# Slowest dependency calls kept per request for the slow request breakdown;
+# the rest are only summed per kind
+MAX_CALLS_PER_REQUEST = 10
+
+# Rolling windows: one-minute slots covering 15 minutes plus the current
+# slot, reported over 1, 5 and 15 minutes
+WINDOW_SLOT_SECONDS = 60
+WINDOW_SLOTS = 15 * 60 // WINDOW_SLOT_SECONDS + 1
+WINDOW_BUCKET_MERGE = 2
+WINDOW_BUCKETS = math.ceil(HISTOGRAM_BUCKETS / WINDOW_BUCKET_MERGE)
+WINDOWS = {"1m": 60, "5m": 300, "15m": 900}
+
+# Requests that matched no route share one metric series
+UNMATCHED_ROUTE = "UNMATCHED"
+
+def matched_route(scope: Dict[str, Any]):
+    """Get the route that handled a request, or None.
+
+    A path that matched a route registered for other methods is answered
+    with 405 and does not count as a match.
+    """
+    route = scope.get("route")
+    if route is None and "app" in scope:
+        # Rejected by middleware before routing ran (e.g. rate limited)
+        for candidate in getattr(scope["app"], "routes", ()):
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+    if route is None or scope.get("method") not in (getattr(route, "methods", None) or ()):
+        return None
+    return route
+
+def route_key(scope: Dict[str, Any]) -> str:
+    """Get the metric series for a request: its method and route template"""
+    route = matched_route(scope)
+    if route is None:
+        return UNMATCHED_ROUTE
+    return f"{scope['method']} {route.path}"
+
+def request_fingerprint(scope: Dict[str, Any]) -> Dict[str, Any]:
+    """Describe a request without values that could hold secrets or personal data"""
+    headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+    query_string = scope.get("query_string", b"").decode("latin-1")
+    content_length = headers.get("content-length", "")
+
+    route = matched_route(scope)
+    fingerprint = {
+        "method": scope["method"],
+        "route": route.path if route is not None else UNMATCHED_ROUTE,
+        "query_params": sorted({name for name, _ in parse_qsl(query_string, keep_blank_values=True)}),
+        "content_type": headers.get("content-type", "").split(";")[0].strip(),
+        "content_length": int(content_length) if content_length.isdigit() else None,
+        "authenticated": "authorization" in headers,
+    }
+    # Requests of the same shape share a hash
+    shape = [fingerprint["method"], fingerprint["route"], fingerprint["query_params"], fingerprint["content_type"]]
+    fingerprint["hash"] = hashlib.sha256(json.dumps(shape).encode()).hexdigest()[:12]
+    return fingerprint
+
+def parse_slow_thresholds(value: str) -> Dict[str, float]:
+    """Parse per-route slow request thresholds, e.g. "GET /api/tasks/=300,POST /api/ai/chat=5000" in ms"""
+    thresholds = {}
+    for entry in value.split(","):
+        if entry.strip():
+            route, _, milliseconds = entry.rpartition("=")
+            thresholds[route.strip()] = float(milliseconds) / 1000
+    return thresholds
+
+def bucket_index(value: float) -> int:
+    """Get the histogram bucket a latency in seconds falls into"""
+    if value < HISTOGRAM_MIN:
+        return 0
+    index = int(math.log2(value / HISTOGRAM_MIN) * HISTOGRAM_SUBBUCKETS) + 1
+    return min(index, HISTOGRAM_BUCKETS - 1)
+
+def bucket_upper_bound(index: int) -> float:
+    """Get the largest latency a histogram bucket holds"""
+    if index >= HISTOGRAM_BUCKETS - 1:
+        return math.inf
+    return HISTOGRAM_MIN * 2 ** (index / HISTOGRAM_SUBBUCKETS)
+
+class LatencyHistogram:
+    """Fixed-size log-bucketed latency histogram.
+
+    Recording is O(1) and percentile queries walk the buckets once, so cost
+    and memory do not depend on how many values were recorded.
+    """
+
+    __slots__ = ("counts", "count", "total", "max")
 
-class PerformanceMonitor:
     def __init__(self):
-        self.metrics: Dict[str, list] = {
-            "response_times": [],
-            "endpoint_counts": {},
-            "error_counts": {},
-            "slow_queries": []
+        self.counts = array("Q", bytes(8 * HISTOGRAM_BUCKETS))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float):
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def to_state(self) -> list:
+        # Only the buckets between the first and last non-empty one
+        used = [index for index, bucket_count in enumerate(self.counts) if bucket_count]
+        first, last = (used[0], used[-1] + 1) if used else (0, 0)
+        return [first, self.counts[first:last].tobytes(), self.count, self.total, self.max]
+
+    def merge_state(self, state: list):
+        first, counts_bytes, count, total, maximum = state
+        counts = array("Q")
+        counts.frombytes(counts_bytes)
+        for index, bucket_count in enumerate(counts, first):
+            if bucket_count:
+                self.counts[index] += bucket_count
+        self.count += count
+        self.total += total
+        self.max = max(self.max, maximum)
+
+    def percentile(self, percentile: float) -> float:
+        """Get the latency at a percentile (0-100), as its bucket's midpoint"""
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(self.count * percentile / 100))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                midpoint = bucket_upper_bound(index) / 2 ** (0.5 / HISTOGRAM_SUBBUCKETS)
+                return min(midpoint, self.max)
+        return self.max
+
+class RollingWindow:
+    """Request counts and latencies over recent fixed-width time slots.
+
+    Each slot covers WINDOW_SLOT_SECONDS and holds a count, an error count
+    and a coarse histogram (every WINDOW_BUCKET_MERGE fine buckets merged,
+    ~18% wide). A slot's histogram only spans the buckets between its
+    fastest and slowest request, so a route whose latencies cluster keeps a
+    few dozen counters per slot. Slots are reused in a ring, so memory stays
+    bounded at a few KB per route.
+    """
+
+    __slots__ = ("slot_ids", "counts", "errors", "offsets", "histograms")
+
+    def __init__(self):
+        self.slot_ids = array("q", [-1] * WINDOW_SLOTS)
+        self.counts = array("I", bytes(4 * WINDOW_SLOTS))
+        self.errors = array("I", bytes(4 * WINDOW_SLOTS))
+        # First bucket each slot's histogram holds
+        self.offsets = array("H", bytes(2 * WINDOW_SLOTS))
+        self.histograms: List[Optional[array]] = [None] * WINDOW_SLOTS
+
+    def _slot(self, slot_id: int) -> int:
+        """Get the ring index for a slot id, clearing it if it held an older slot"""
+        slot = slot_id % WINDOW_SLOTS
+        if self.slot_ids[slot] != slot_id:
+            self.slot_ids[slot] = slot_id
+            self.counts[slot] = 0
+            self.errors[slot] = 0
+            self.histograms[slot] = None
+        return slot
+
+    def _add(self, slot: int, first: int, bucket_counts: array):
+        """Add counts for buckets first.. to a slot, widening its histogram to fit"""
+        histogram = self.histograms[slot]
+        if histogram is None:
+            self.offsets[slot] = first
+            self.histograms[slot] = array("I", bucket_counts)
+            return
+
+        offset = self.offsets[slot]
+        if first < offset:
+            histogram[0:0] = array("I", bytes(4 * (offset - first)))
+            offset = self.offsets[slot] = first
+        end = first + len(bucket_counts)
+        if end > offset + len(histogram):
+            histogram.frombytes(bytes(4 * (end - offset - len(histogram))))
+        for index, bucket_count in enumerate(bucket_counts, first - offset):
+            histogram[index] += bucket_count
+
+    def record(self, response_time: float, is_error: bool, now: float):
+        slot = self._slot(int(now // WINDOW_SLOT_SECONDS))
+        self._add(slot, bucket_index(response_time) // WINDOW_BUCKET_MERGE, array("I", [1]))
+        self.counts[slot] += 1
+        if is_error:
+            self.errors[slot] += 1
+
+    def to_state(self) -> list:
+        return [
+            [self.slot_ids[slot], self.counts[slot], self.errors[slot], self.offsets[slot], self.histograms[slot].tobytes()]
+            for slot in range(WINDOW_SLOTS)
+            if self.histograms[slot] is not None and self.counts[slot]
+        ]
+
+    def merge_state(self, state: list):
+        for slot_id, count, errors, offset, histogram_bytes in state:
+            if self.slot_ids[slot_id % WINDOW_SLOTS] > slot_id:
+                continue
+            slot = self._slot(slot_id)
+            histogram = array("I")
+            histogram.frombytes(histogram_bytes)
+            self._add(slot, offset, histogram)
+            self.counts[slot] += count
+            self.errors[slot] += errors
+
+    def get_stats(self, seconds: int, now: float) -> Dict[str, Any]:
+        """Get rate, error rate and percentiles over the last `seconds`"""
+        current = int(now // WINDOW_SLOT_SECONDS)
+        oldest = current - math.ceil(seconds / WINDOW_SLOT_SECONDS)
+        # Full slots plus the partly elapsed current one
+        covered = (current - oldest) * WINDOW_SLOT_SECONDS + (now % WINDOW_SLOT_SECONDS)
+
+        count = errors = 0
+        merged = array("I", bytes(4 * WINDOW_BUCKETS))
+        for slot in range(WINDOW_SLOTS):
+            if oldest <= self.slot_ids[slot] <= current and self.counts[slot]:
+                count += self.counts[slot]
+                errors += self.errors[slot]
+                for index, bucket_count in enumerate(self.histograms[slot], self.offsets[slot]):
+                    merged[index] += bucket_count
+
+        return {
+            "request_count": count,
+            "request_rate": count / covered if covered else 0,
+            "error_rate": errors / count if count else 0,
+            "p50_response_time": self._percentile(merged, count, 50),
+            "p95_response_time": self._percentile(merged, count, 95),
+            "p99_response_time": self._percentile(merged, count, 99)
         }
-    
-    def record_response_time(self, endpoint: str, response_time: float, status_code: int):
-        """Record response time for an endpoint"""
-        self.metrics["response_times"].append({
-            "endpoint": endpoint,
-            "response_time": response_time,
-            "status_code": status_code,
-            "timestamp": time.time()
-        })
-        
-        # Track endpoint counts
-        if endpoint not in self.metrics["endpoint_counts"]:
-            self.metrics["endpoint_counts"][endpoint] = 0
-        self.metrics["endpoint_counts"][endpoint] += 1
-        
-        # Track errors
+
+    @staticmethod
+    def _percentile(histogram: array, count: int, percentile: float) -> float:
+        if not count:
+            return 0
+        rank = max(1, math.ceil(count * percentile / 100))
+        seen = 0
+        for index, bucket_count in enumerate(histogram):
+            seen += bucket_count
+            if seen >= rank:
+                # Geometric midpoint of the merged fine buckets
+                first = index * WINDOW_BUCKET_MERGE
+                last = min(first + WINDOW_BUCKET_MERGE, HISTOGRAM_BUCKETS - 1) - 1
+                if first == 0:
+                    return bucket_upper_bound(last) / 2
+                return math.sqrt(bucket_upper_bound(first - 1) * bucket_upper_bound(last))
+        return 0
+
+class EndpointMetrics:
+    """Request counters and latency histograms for one endpoint"""
+
+    __slots__ = ("errors", "slow", "latency", "window", "spans")
+
+    def __init__(self):
+        self.errors = 0
+        self.slow = 0
+        self.latency = LatencyHistogram()
+        self.window = RollingWindow()
+        # Span name -> [calls, seconds] summed over requests
+        self.spans: Dict[str, List[float]] = {}
+
+    @property
+    def count(self) -> int:
+        return self.latency.count
+
+    def record(self, response_time: float, status_code: int,
+               spans: Optional[Dict[str, List[float]]] = None, threshold: float = SLOW_REQUEST_THRESHOLD):
+        self.latency.record(response_time)
+        self.window.record(response_time, status_code >= 400, time.time())
         if status_code >= 400:
-            if endpoint not in self.metrics["error_counts"]:
-                self.metrics["error_counts"][endpoint] = 0
-            self.metrics["error_counts"][endpoint] += 1
-        
-        # Track slow queries (>500ms)
-        if response_time > 0.5:  # 500ms threshold
-            self.metrics["slow_queries"].append({
+            self.errors += 1
+        if response_time > threshold:
+            self.slow += 1
+        self._add_spans(spans or {})
+
+    def to_state(self) -> dict:
+        return {
+            "errors": self.errors,
+            "slow": self.slow,
+            "latency": self.latency.to_state(),
+            "window": self.window.to_state(),
+            "spans": self.spans
+        }
+
+    def merge_state(self, state: dict):
+        self.errors += state["errors"]
+        self.slow += state["slow"]
+        self.latency.merge_state(state["latency"])
+        self.window.merge_state(state["window"])
+        self._add_spans(state["spans"])
+
+    def _add_spans(self, spans: Dict[str, List[float]]):
+        for name, (calls, seconds) in spans.items():
+            totals = self.spans.get(name)
+            if totals is None:
+                totals = self.spans[name] = [0, 0.0]
+            totals[0] += calls
+            totals[1] += seconds
+
+class CallMetrics:
+    """Latency histogram and error count for calls to one dependency operation"""
+
+    __slots__ = ("errors", "latency")
+
+    def __init__(self):
+        self.errors = 0
+        self.latency = LatencyHistogram()
+
+    def to_state(self) -> list:
+        return [self.errors, self.latency.to_state()]
+
+    def merge_state(self, state: list):
+        self.errors += state[0]
+        self.latency.merge_state(state[1])
+
+class PerformanceMonitor:
+    """Aggregates request metrics in fixed memory.
+
+    Each endpoint keeps counters and a latency histogram rather than a list
+    of requests, and only the most recent slow requests are kept. Calls to
+    dependencies (InstantDB, AI, auth) and named events such as rate-limit
+    rejections or cache lookups are counted the same way.
+    """
+
+    def __init__(self, slow_thresholds: Optional[Dict[str, float]] = None):
+        # Route -> seconds after which its requests count as slow
+        self.slow_thresholds: Dict[str, float] = dict(slow_thresholds or {})
+        self.reset_metrics()
+
+    def slow_threshold(self, endpoint: str) -> float:
+        """Get the response time after which an endpoint's requests count as slow"""
+        return self.slow_thresholds.get(endpoint, SLOW_REQUEST_THRESHOLD)
+
+    def record_response_time(self, endpoint: str, response_time: float, status_code: int,
+                             spans: Optional[Dict[str, List[float]]] = None,
+                             details: Optional[Callable[[], Dict[str, Any]]] = None):
+        """Record response time for an endpoint, with the time spent in each span.
+
+        `details` is only called for slow requests, to add their breakdown.
+        """
+        threshold = self.slow_threshold(endpoint)
+        self.overall.record(response_time, status_code, threshold=threshold)
+
+        metrics = self.endpoints.get(endpoint)
+        if metrics is None:
+            metrics = self.endpoints[endpoint] = EndpointMetrics()
+        metrics.record(response_time, status_code, spans, threshold)
+
+        # Keep the most recent slow requests
+        if response_time > threshold:
+            entry = {
                 "endpoint": endpoint,
                 "response_time": response_time,
-                "timestamp": time.time()
-            })
-    
+                "status_code": status_code,
+                "timestamp": time.time(),
+                "threshold": threshold
+            }
+            if details is not None:
+                entry.update(details())
+            self.slow_queries.append(entry)
+
+    def record_call(self, kind: str, operation: str, duration: float, error: bool = False):
+        """Record a call to a dependency, e.g. an InstantDB query"""
+        metrics = self.calls.get((kind, operation))
+        if metrics is None:
+            metrics = self.calls[(kind, operation)] = CallMetrics()
+        metrics.latency.record(duration)
+        if error:
+            metrics.errors += 1
+
+    def increment(self, name: str, **labels: str):
+        """Increment a named event counter, e.g. cache_requests with cache and result labels"""
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    def record_cache(self, cache: str, hit: bool):
+        """Count a lookup in an in-process cache or index"""
+        self.increment("cache_requests", cache=cache, result="hit" if hit else "miss")
+
+    def to_state(self, slow_limit: Optional[int] = None) -> Dict[str, Any]:
+        """Export all metrics as plain data, for merging into another monitor.
+
+        `slow_limit` keeps only the most recent slow requests.
+        """
+        slow_queries = list(self.slow_queries)
+        if slow_limit is not None:
+            slow_queries = slow_queries[-slow_limit:] if slow_limit else []
+        return {
+            "overall": self.overall.to_state(),
+            "endpoints": {endpoint: metrics.to_state() for endpoint, metrics in self.endpoints.items()},
+            "calls": [[kind, operation, metrics.to_state()] for (kind, operation), metrics in self.calls.items()],
+            "counters": [[name, [list(label) for label in labels], value]
+                         for (name, labels), value in self.counters.items()],
+            "slow_queries": slow_queries
+        }
+
+    def merge_state(self, state: Dict[str, Any]):
+        """Add metrics exported by another monitor's to_state()"""
+        self.overall.merge_state(state["overall"])
+        for endpoint, endpoint_state in state["endpoints"].items():
+            metrics = self.endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self.endpoints[endpoint] = EndpointMetrics()
+            metrics.merge_state(endpoint_state)
+        for kind, operation, call_state in state["calls"]:
+            metrics = self.calls.get((kind, operation))
+            if metrics is None:
+                metrics = self.calls[(kind, operation)] = CallMetrics()
+            metrics.merge_state(call_state)
+        for name, labels, value in state["counters"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+        slow_queries = sorted([*self.slow_queries, *state["slow_queries"]], key=lambda entry: entry["timestamp"])
+        self.slow_queries = deque(slow_queries, maxlen=SLOW_REQUEST_RING_SIZE)
+
     def get_stats(self) -> Dict[str, Any]:
         """Get performance statistics"""
-        response_times = [r["response_time"] for r in self.metrics["response_times"]]
-        
-        if not response_times:
+        overall = self.overall
+        if not overall.count:
             return {
                 "total_requests": 0,
                 "avg_response_time": 0,
@@ -53,112 +456,254 @@ class PerformanceMonitor:
                 "p99_response_time": 0,
                 "slow_requests": 0,
                 "error_rate": 0,
-                "endpoint_stats": {}
+                "endpoint_stats": {},
+                "recent_slow_requests": [],
+                "windows": self._get_window_stats(overall)
             }
-        
-        # Calculate percentiles
-        sorted_times = sorted(response_times)
-        p95_index = int(len(sorted_times) * 0.95)
-        p99_index = int(len(sorted_times) * 0.99)
-        
+
         return {
-            "total_requests": len(response_times),
-            "avg_response_time": sum(response_times) / len(response_times),
-            "p95_response_time": sorted_times[p95_index] if p95_index < len(sorted_times) else sorted_times[-1],
-            "p99_response_time": sorted_times[p99_index] if p99_index < len(sorted_times) else sorted_times[-1],
-            "slow_requests": len([t for t in response_times if t > 0.5]),
-            "error_rate": sum(self.metrics["error_counts"].values()) / len(response_times) if response_times else 0,
-            "endpoint_stats": self._get_endpoint_stats()
+            "total_requests": overall.count,
+            "avg_response_time": overall.latency.mean(),
+            "p95_response_time": overall.latency.percentile(95),
+            "p99_response_time": overall.latency.percentile(99),
+            "slow_requests": overall.slow,
+            "error_rate": overall.errors / overall.count,
+            "endpoint_stats": self._get_endpoint_stats(),
+            "recent_slow_requests": [
+                {key: entry[key] for key in ("endpoint", "response_time", "status_code", "timestamp")}
+                for entry in self.slow_queries
+            ],
+            "windows": self._get_window_stats(overall)
         }
-    
+
+    def get_slow_requests(self, endpoint: Optional[str] = None, limit: int = SLOW_REQUEST_RING_SIZE) -> List[Dict[str, Any]]:
+        """Get the most recent slow requests with their breakdown, newest first"""
+        entries = [entry for entry in reversed(self.slow_queries) if endpoint is None or entry["endpoint"] == endpoint]
+        return entries[:limit]
+
+    def _get_window_stats(self, metrics: EndpointMetrics) -> Dict[str, Any]:
+        """Get rolling-window statistics for the 1, 5 and 15 minute windows"""
+        now = time.time()
+        return {name: metrics.window.get_stats(seconds, now) for name, seconds in WINDOWS.items()}
+
     def _get_endpoint_stats(self) -> Dict[str, Any]:
         """Get statistics per endpoint"""
-        endpoint_stats = {}
-        
-        for endpoint in self.metrics["endpoint_counts"]:
-            endpoint_times = [
-                r["response_time"] for r in self.metrics["response_times"] 
-                if r["endpoint"] == endpoint
-            ]
-            
-            if endpoint_times:
-                endpoint_stats[endpoint] = {
-                    "request_count": self.metrics["endpoint_counts"][endpoint],
-                    "avg_response_time": sum(endpoint_times) / len(endpoint_times),
-                    "error_count": self.metrics["error_counts"].get(endpoint, 0),
-                    "slow_requests": len([t for t in endpoint_times if t > 0.5])
+        return {
+            endpoint: {
+                "request_count": metrics.count,
+                "avg_response_time": metrics.latency.mean(),
+                "p50_response_time": metrics.latency.percentile(50),
+                "p95_response_time": metrics.latency.percentile(95),
+                "p99_response_time": metrics.latency.percentile(99),
+                "error_count": metrics.errors,
+                "slow_requests": metrics.slow,
+                "windows": self._get_window_stats(metrics),
+                "spans": {
+                    name: {
+                        "calls": calls,
+                        "total_time": seconds,
+                        "avg_time_per_request": seconds / metrics.count
+                    }
+                    for name, (calls, seconds) in metrics.spans.items()
                 }
-        
-        return endpoint_stats
-    
+            }
+            for endpoint, metrics in self.endpoints.items()
+        }
+
     def reset_metrics(self):
         """Reset all metrics"""
-        self.metrics = {
-            "response_times": [],
-            "endpoint_counts": {},
-            "error_counts": {},
-            "slow_queries": []
+        self.overall = EndpointMetrics()
+        self.endpoints: Dict[str, EndpointMetrics] = {}
+        self.slow_queries: Deque[Dict[str, Any]] = deque(maxlen=SLOW_REQUEST_RING_SIZE)
+        self.calls: Dict[Tuple[str, str], CallMetrics] = {}
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = {}
+
+# Global performance monitor instance; SLOW_REQUEST_THRESHOLDS overrides the slow threshold per route
+performance_monitor = PerformanceMonitor(slow_thresholds=parse_slow_thresholds(os.getenv("SLOW_REQUEST_THRESHOLDS", "")))
+
+class RequestTiming:
+    """Time spent in named spans while serving one request"""
+
+    __slots__ = ("start", "handler_end", "spans", "calls", "calls_dropped", "call_seq", "response_bytes")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.handler_end: Optional[float] = None
+        # Span name -> [calls, seconds]
+        self.spans: Dict[str, List[float]] = {}
+        # Min-heap of (duration, seq, call) holding the slowest calls
+        self.calls: List[Tuple[float, int, Dict[str, Any]]] = []
+        # Kind -> [calls, seconds] for calls not kept
+        self.calls_dropped: Dict[str, List[float]] = {}
+        self.call_seq = 0
+        self.response_bytes = 0
+
+    def add(self, name: str, seconds: float):
+        totals = self.spans.get(name)
+        if totals is None:
+            totals = self.spans[name] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds
+
+    def add_call(self, name: str, operation: str, started: float, seconds: float,
+                 error: bool, details: Optional[Dict[str, Any]] = None):
+        """Keep a dependency call for the slow request breakdown if it is among the slowest"""
+        if len(self.calls) >= MAX_CALLS_PER_REQUEST and seconds <= self.calls[0][0]:
+            self._drop(name, seconds)
+            return
+        call = {"kind": name, "operation": operation, "offset": started - self.start, "duration": seconds, "error": error}
+        if details:
+            call.update(details)
+        self.call_seq += 1
+        if len(self.calls) < MAX_CALLS_PER_REQUEST:
+            heapq.heappush(self.calls, (seconds, self.call_seq, call))
+        else:
+            evicted = heapq.heapreplace(self.calls, (seconds, self.call_seq, call))[2]
+            self._drop(evicted["kind"], evicted["duration"])
+
+    def _drop(self, name: str, seconds: float):
+        totals = self.calls_dropped.get(name)
+        if totals is None:
+            totals = self.calls_dropped[name] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds
+
+    def breakdown(self, scope: Dict[str, Any]) -> Dict[str, Any]:
+        """Describe where a request's time went, for the slow request ring"""
+        return {
+            "request": request_fingerprint(scope),
+            "response_bytes": self.response_bytes,
+            "spans": {name: {"calls": calls, "time": seconds} for name, (calls, seconds) in self.spans.items()},
+            "calls": sorted((call for _, _, call in self.calls), key=lambda call: call["offset"]),
+            "calls_dropped": {name: {"calls": calls, "time": seconds}
+                              for name, (calls, seconds) in self.calls_dropped.items()}
         }
 
-# Global performance monitor instance
-performance_monitor = PerformanceMonitor()
+    def server_timing(self, total: float) -> str:
+        """Format spans as a Server-Timing header value"""
+        entries = [
+            f'{name};dur={seconds * 1000:.1f};desc="{calls} calls"' if calls > 1 else f"{name};dur={seconds * 1000:.1f}"
+            for name, (calls, seconds) in self.spans.items()
+        ]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+_current_timing: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+# Scope of the request each asyncio task is serving, so code outside the
+# task (the sampling profiler) can tell which route it is running
+_active_requests: Dict[asyncio.Task, Dict[str, Any]] = {}
+
+def active_route(task: Optional[asyncio.Task]) -> Optional[str]:
+    """Get the route a task is serving, or None if it is not serving a request"""
+    scope = _active_requests.get(task) if task is not None else None
+    return route_key(scope) if scope is not None else None
+
+class span:
+    """Time a block as a named span, e.g. span("db", "query").
+
+    The time is added to the current request's spans, if any, and recorded
+    as a call to the named dependency operation. Also usable as a decorator
+    on async functions, where the operation defaults to the function name.
+    Details added with annotate() show up in the slow request breakdown.
+    """
+
+    __slots__ = ("name", "operation", "started", "details")
+
+    def __init__(self, name: str, operation: str = ""):
+        self.name = name
+        self.operation = operation
+        self.details: Optional[Dict[str, Any]] = None
+
+    def annotate(self, **details: Any):
+        """Attach details to this call, e.g. the collection queried"""
+        if self.details is None:
+            self.details = {}
+        self.details.update(details)
+
+    def __call__(self, func: Callable) -> Callable:
+        name = self.name
+        operation = self.operation or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name, operation):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.started
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.add(self.name, duration)
+            timing.add_call(self.name, self.operation, self.started, duration, exc_type is not None, self.details)
+        performance_monitor.record_call(self.name, self.operation, duration, exc_type is not None)
+        return False
 
 def monitor_performance(func: Callable) -> Callable:
-    """Decorator to monitor function performance"""
+    """Decorator marking where an endpoint's handler ends.
+
+    Requests are recorded once by PerformanceMiddleware; the decorator lets
+    it split the time after the handler returns off as a "serialize" span.
+    """
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
-        start_time = time.time()
         try:
-            result = await func(*args, **kwargs)
-            end_time = time.time()
-            
-            # Extract endpoint name from function or request
-            endpoint = func.__name__
-            if args and hasattr(args[0], 'url'):
-                endpoint = args[0].url.path
-            
-            performance_monitor.record_response_time(
-                endpoint, 
-                end_time - start_time, 
-                200  # Success status
-            )
-            
-            return result
-        except Exception as e:
-            end_time = time.time()
-            
-            # Extract endpoint name
-            endpoint = func.__name__
-            if args and hasattr(args[0], 'url'):
-                endpoint = args[0].url.path
-            
-            performance_monitor.record_response_time(
-                endpoint, 
-                end_time - start_time, 
-                500  # Error status
-            )
-            
-            raise e
-    
+            return await func(*args, **kwargs)
+        finally:
+            timing = _current_timing.get()
+            if timing is not None:
+                timing.handler_end = time.perf_counter()
+
     return wrapper
 
-class PerformanceMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start_time = time.time()
-        
-        response = await call_next(request)
-        
-        end_time = time.time()
-        response_time = end_time - start_time
-        
-        # Record performance metrics
-        performance_monitor.record_response_time(
-            request.url.path,
-            response_time,
-            response.status_code
-        )
-        
-        # Add performance headers
-        response.headers["X-Response-Time"] = f"{response_time:.3f}s"
-        
-        return response
\ No newline at end of file
+class PerformanceMiddleware:
+    """Records every HTTP request once, with its final status and spans"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _current_timing.set(timing)
+        task = asyncio.current_task()
+        _active_requests[task] = scope
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                now = time.perf_counter()
+                if timing.handler_end is not None:
+                    timing.add("serialize", now - timing.handler_end)
+
+                headers = MutableHeaders(scope=message)
+                headers["X-Response-Time"] = f"{now - timing.start:.3f}s"
+                headers["Server-Timing"] = timing.server_timing(now - timing.start)
+            elif message["type"] == "http.response.body":
+                timing.response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timing.reset(token)
+            _active_requests.pop(task, None)
+            # Record performance metrics under the matched route template
+            performance_monitor.record_response_time(
+                route_key(scope),
+                time.perf_counter() - timing.start,
+                status_code,
+                timing.spans,
+                details=lambda: timing.breakdown(scope)
+            )
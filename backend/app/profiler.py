@@ -0,0 +1,184 @@
+"""
+On-demand statistical profiler.
+
+Nothing runs until a profile is requested. A profile starts a thread that
+samples the stacks of every other thread in the worker at a fixed interval
+for a given number of seconds, then stops. Samples on the event loop thread
+are attributed to the route its current asyncio task is serving; samples
+on other threads are labelled with the thread's name.
+"""
+
+import asyncio
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.performance import active_route
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STDLIB_ROOT = sysconfig.get_paths()["stdlib"]
+
+MAX_STACK_DEPTH = 128
+# Innermost frames of threads that are waiting rather than working
+IDLE_FUNCTIONS = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+# A frame is identified by its function: (file, first line, name)
+Frame = Tuple[str, int, str]
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running"""
+
+def short_filename(filename: str) -> str:
+    marker = os.sep + "site-packages" + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    for root in (APP_ROOT, STDLIB_ROOT):
+        if filename.startswith(root + os.sep):
+            return os.path.relpath(filename, root)
+    return filename
+
+def format_frame(frame: Frame) -> str:
+    filename, line, name = frame
+    return f"{name} ({short_filename(filename)}:{line})"
+
+class Profile:
+    """Stack samples collected by one profiling run"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.sample_count = 0
+        # (label, frames outermost first) -> number of samples
+        self.stacks: Counter = Counter()
+
+    def collapsed(self) -> str:
+        """Render in collapsed-stack format, one "label;outer;...;inner count" line per stack"""
+        lines = []
+        for (label, frames), count in self.stacks.most_common():
+            names = [label] + [format_frame(frame).replace(";", ":") for frame in frames]
+            lines.append(f"{';'.join(names)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict[str, Any]:
+        """Render in speedscope's file format, one sampled profile per route or thread"""
+        frames: List[Dict[str, Any]] = []
+        frame_index: Dict[Frame, int] = {}
+        profiles: Dict[str, Dict[str, Any]] = {}
+
+        for (label, stack), count in sorted(self.stacks.items(), key=lambda item: item[0][0]):
+            indexes = []
+            for frame in stack:
+                index = frame_index.get(frame)
+                if index is None:
+                    index = frame_index[frame] = len(frames)
+                    frames.append({"name": frame[2], "file": short_filename(frame[0]), "line": frame[1]})
+                indexes.append(index)
+
+            profile = profiles.get(label)
+            if profile is None:
+                profile = profiles[label] = {
+                    "type": "sampled",
+                    "name": label,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": 0,
+                    "samples": [],
+                    "weights": [],
+                }
+            profile["samples"].append(indexes)
+            profile["weights"].append(count * self.interval)
+            profile["endValue"] += count * self.interval
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"Task Board API profile ({self.duration:.1f}s)",
+            "exporter": "task-board-api",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values()),
+        }
+
+class SamplingProfiler:
+    """Samples the stacks of all threads in this worker on demand"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.lock.locked()
+
+    async def profile(self, seconds: float, interval: float = 0.01, include_idle: bool = False) -> Profile:
+        """Sample for `seconds` without blocking the event loop"""
+        if not self.lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            loop = asyncio.get_running_loop()
+            return await asyncio.to_thread(self.sample, seconds, interval, loop, threading.get_ident(), include_idle)
+        finally:
+            self.lock.release()
+
+    def sample(self, seconds: float, interval: float, loop: Optional[asyncio.AbstractEventLoop] = None,
+               loop_thread: Optional[int] = None, include_idle: bool = False) -> Profile:
+        """Sample every thread except this one for `seconds`"""
+        profile = Profile(interval)
+        own_thread = threading.get_ident()
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_sample = started
+
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now < next_sample:
+                time.sleep(next_sample - now)
+                continue
+            next_sample += interval
+
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = self._stack(frame)
+                if not stack or (not include_idle and self._is_idle(stack[-1])):
+                    continue
+                label = self._label(thread_id, thread_names, loop, loop_thread)
+                profile.stacks[(label, stack)] += 1
+            profile.sample_count += 1
+
+        profile.duration = time.perf_counter() - started
+        return profile
+
+    def _stack(self, frame) -> Tuple[Frame, ...]:
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        # Outermost frame first
+        stack.reverse()
+        return tuple(stack)
+
+    def _is_idle(self, frame: Frame) -> bool:
+        return (os.path.basename(frame[0]), frame[2]) in IDLE_FUNCTIONS
+
+    def _label(self, thread_id: int, thread_names: Dict[int, str],
+               loop: Optional[asyncio.AbstractEventLoop], loop_thread: Optional[int]) -> str:
+        if loop is not None and thread_id == loop_thread:
+            route = active_route(asyncio.current_task(loop))
+            return route if route else "event-loop"
+        return f"thread:{thread_names.get(thread_id, thread_id)}"
+
+# Global profiler
+sampling_profiler = SamplingProfiler()
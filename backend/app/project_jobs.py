@@ -0,0 +1,246 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Dict, Any, IO, Optional
+
+from app.database import db_service
+from app.task_counters import task_counters
+from app.search_index import search_index
+from app.typeahead import typeahead_index
+from app.timestamps import change_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Tasks deleted per transact
+DELETE_BATCH_SIZE = 200
+# Failed batches in a row before a deletion is parked until the next start
+MAX_DELETE_ATTEMPTS = 5
+# Directory for the per-project lock files that let one worker at a time
+# run a deletion; every worker on the host must use the same one
+LOCK_DIR = os.getenv("PROJECT_JOBS_LOCK_DIR") or tempfile.gettempdir()
+
+def claim_job(project_id: str, lock_dir: str = LOCK_DIR) -> Optional[IO]:
+    """Lock a project's deletion for this worker, or None if another worker holds it"""
+    path = os.path.join(lock_dir, f"project-delete-{hashlib.sha1(project_id.encode()).hexdigest()}.lock")
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # The previous holder removes the file when done; a lock on a
+        # removed file guards nothing
+        if os.fstat(lock_file.fileno()).st_ino != os.stat(path).st_ino:
+            raise BlockingIOError
+    except (BlockingIOError, FileNotFoundError):
+        lock_file.close()
+        return None
+    return lock_file
+
+def release_job(lock_file: IO):
+    """Remove and unlock a claimed deletion's lock file"""
+    try:
+        os.unlink(lock_file.name)
+    except FileNotFoundError:
+        pass
+    lock_file.close()
+
+class ProjectDeletionWorker:
+    """Deletes projects and their tasks in the background.
+
+    A project is first marked with status "deleting"; the worker then
+    removes its tasks in bounded batches, recording progress on the project
+    record in the same transact, and deletes the project last. Deleted
+    tasks leave tombstones for delta-sync clients. A deletion that keeps
+    failing is parked so it does not hold up the queue; projects still
+    marked as deleting are picked up again when the worker starts, so
+    parked and interrupted deletions resume after a restart. Each deletion
+    runs under a lock file, so uvicorn workers resuming the same projects
+    never delete one at the same time.
+    """
+
+    def __init__(self, batch_size: int = DELETE_BATCH_SIZE, max_backoff: float = 30.0,
+                 max_attempts: int = MAX_DELETE_ATTEMPTS, lock_dir: str = LOCK_DIR):
+        self.db = db_service.get_client()
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.lock_dir = lock_dir
+        self.queue: Optional[asyncio.Queue] = None
+        self.queued = set()
+        # Project id -> last error, for deletions given up until the next start
+        self.parked: Dict[str, str] = {}
+
+    async def start_deletion(self, project_id: str) -> Dict[str, Any]:
+        """Mark a project as deleting and queue it for the worker"""
+        result = await self.db.transact([
+            {
+                "projects": {
+                    "update": {
+                        "where": {"id": project_id},
+                        "data": {
+                            "status": "deleting",
+                            "deletion_started_at": int(datetime.now().timestamp()),
+                            "deleted_task_count": 0
+                        }
+                    }
+                }
+            }
+        ])
+        if "error" in result:
+            return {
+                "success": False,
+                "error": result["error"]
+            }
+
+        self._enqueue(project_id)
+        return {
+            "success": True
+        }
+
+    async def run(self):
+        """Resume interrupted deletions, then process queued ones forever"""
+        self.queue = asyncio.Queue()
+        for project_id in list(self.queued):
+            self.queue.put_nowait(project_id)
+
+        result = await self.db.query({
+            "projects": {
+                "where": {"status": "deleting"}
+            }
+        })
+        for project in result.get("projects", []):
+            logger.info(f"Resuming deletion of project {project['id']}")
+            self._enqueue(project["id"])
+
+        while True:
+            project_id = await self.queue.get()
+            lock_file = claim_job(project_id, self.lock_dir)
+            if lock_file is None:
+                logger.info(f"Project {project_id} is being deleted by another worker")
+                self.queued.discard(project_id)
+                continue
+            try:
+                await self.delete_project(project_id)
+            except Exception as e:
+                logger.error(f"Error deleting project {project_id}: {e}")
+            finally:
+                release_job(lock_file)
+                self.queued.discard(project_id)
+
+    async def delete_project(self, project_id: str) -> bool:
+        """Delete a project's tasks in batches, then the project itself.
+
+        Tasks are paged by id after the last deleted one rather than
+        re-queried from the start, so reads that already hide deletes
+        still waiting in the outbox cannot end the scan early. Returns
+        False if the deletion was parked.
+        """
+        self.parked.pop(project_id, None)
+        result = await self.db.query({
+            "projects": {
+                "where": {"id": project_id}
+            }
+        })
+        projects = result.get("projects", [])
+        if not projects:
+            return True
+        deleted = projects[0].get("deleted_task_count", 0)
+
+        failures = 0
+        last_id = None
+        while True:
+            where: Dict[str, Any] = {"project_id": project_id}
+            if last_id:
+                where["id"] = {"$gt": last_id}
+            result = await self.db.query({
+                "tasks": {
+                    "where": where,
+                    "order": {"id": "asc"},
+                    "limit": self.batch_size
+                }
+            })
+
+            if "tasks" in result:
+                tasks = result["tasks"]
+                task_ids = [task["id"] for task in tasks]
+                if not task_ids and last_id:
+                    # Sweep again from the start for tasks created with a
+                    # lower id before the project was marked as deleting
+                    last_id = None
+                    continue
+                if not task_ids:
+                    break
+
+                deleted_at = change_timestamp()
+                steps = []
+                for task_id in task_ids:
+                    steps.append({"tasks": {"delete": {"where": {"id": task_id}}}})
+                    steps.append({
+                        "task_tombstones": {
+                            "create": {"id": task_id, "project_id": project_id, "deleted_at": deleted_at}
+                        }
+                    })
+                steps.append({
+                    "projects": {
+                        "update": {
+                            "where": {"id": project_id},
+                            "data": {"deleted_task_count": deleted + len(task_ids)}
+                        }
+                    }
+                })
+                result = await self.db.transact(steps)
+            else:
+                result = {"error": "Failed to read tasks"}
+
+            if "error" in result:
+                failures += 1
+                if failures >= self.max_attempts:
+                    logger.error(f"Parking deletion of project {project_id} after {failures} failed batches: {result['error']}")
+                    self.parked[project_id] = result["error"]
+                    return False
+                backoff = min(self.max_backoff, 0.5 * 2 ** failures)
+                logger.warning(f"Deletion batch for project {project_id} failed, retrying in {backoff}s: {result['error']}")
+                await asyncio.sleep(backoff)
+                continue
+
+            failures = 0
+            last_id = task_ids[-1]
+            deleted += len(task_ids)
+            for task in tasks:
+                task_counters.task_deleted(task)
+                search_index.remove_task(task["id"])
+                typeahead_index.remove_task(task["id"])
+            logger.info(f"Project {project_id}: deleted {deleted} tasks")
+
+        result = await self.db.transact([
+            {
+                "projects": {
+                    "delete": {
+                        "where": {"id": project_id}
+                    }
+                }
+            }
+        ])
+        if "error" in result:
+            # Still marked as deleting, so the next start picks it up again
+            logger.error(f"Failed to delete project {project_id}: {result['error']}")
+            self.parked[project_id] = result["error"]
+            return False
+
+        task_counters.drop_project(project_id)
+        search_index.drop_project(project_id)
+        typeahead_index.drop_project(project_id)
+        logger.info(f"Project {project_id} deleted with {deleted} tasks")
+        return True
+
+    def _enqueue(self, project_id: str):
+        if project_id in self.queued:
+            return
+        self.queued.add(project_id)
+        if self.queue is not None:
+            self.queue.put_nowait(project_id)
+
+# Global project deletion worker
+project_deletion_worker = ProjectDeletionWorker()
@@ -2,8 +2,10 @@ import time
 import asyncio
 from typing import Dict, Optional
 from collections import defaultdict, deque
-from fastapi import HTTPException, Request, status
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from app.performance import performance_monitor
 
 class RateLimiter:
     def __init__(self, max_requests: int, time_window: int):
@@ -44,23 +46,34 @@ class RateLimiter:
         oldest_request = request_times[0]
         return oldest_request + self.time_window
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+class RateLimitMiddleware:
+    """Rejects requests over the limit with 429.
+
+    A plain ASGI middleware, so the request keeps running in the task that
+    outer middleware (performance monitoring, profiling) registered.
+    """
+
     def __init__(self, app, rate_limiter: RateLimiter, key_extractor: callable):
-        super().__init__(app)
+        self.app = app
         self.rate_limiter = rate_limiter
         self.key_extractor = key_extractor
-    
-    async def dispatch(self, request: Request, call_next):
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # Extract rate limit key (e.g., user ID, IP address)
-        key = self.key_extractor(request)
-        
+        key = self.key_extractor(Request(scope))
+
         if not self.rate_limiter.is_allowed(key):
+            performance_monitor.increment("rate_limit_rejections", key_type=key.split(":", 1)[0])
             reset_time = self.rate_limiter.get_reset_time(key)
             retry_after = int(reset_time - time.time()) if reset_time else self.rate_limiter.time_window
-            
-            raise HTTPException(
+
+            response = JSONResponse(
+                {"detail": "Rate limit exceeded"},
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Rate limit exceeded",
                 headers={
                     "Retry-After": str(retry_after),
                     "X-RateLimit-Limit": str(self.rate_limiter.max_requests),
@@ -68,20 +81,24 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
                     "X-RateLimit-Reset": str(int(reset_time)) if reset_time else ""
                 }
             )
-        
+            await response(scope, receive, send)
+            return
+
         # Get remaining requests
         request_times = self.rate_limiter.requests[key]
         remaining = max(0, self.rate_limiter.max_requests - len(request_times))
         reset_time = self.rate_limiter.get_reset_time(key)
-        
-        response = await call_next(request)
-        
-        # Add rate limit headers to successful responses
-        response.headers["X-RateLimit-Limit"] = str(self.rate_limiter.max_requests)
-        response.headers["X-RateLimit-Remaining"] = str(remaining)
-        response.headers["X-RateLimit-Reset"] = str(int(reset_time)) if reset_time else ""
-        
-        return response
+
+        async def send_with_headers(message):
+            # Add rate limit headers to successful responses
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-RateLimit-Limit"] = str(self.rate_limiter.max_requests)
+                headers["X-RateLimit-Remaining"] = str(remaining)
+                headers["X-RateLimit-Reset"] = str(int(reset_time)) if reset_time else ""
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
 
 # Rate limiters for different use cases
 ai_rate_limiter = RateLimiter(max_requests=10, time_window=60)  # 10 requests per minute for AI
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
 from pydantic import BaseModel, EmailStr
-from typing import Dict, Any
+from typing import Dict, Any, List
 from app.auth import auth_service, get_current_user_dependency
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
@@ -22,6 +22,14 @@ class UserResponse(BaseModel):
     email: str
     role: str
 
+class UserSuggestion(BaseModel):
+    id: str
+    email: str
+    name: str
+
+class UserSuggestionResponse(BaseModel):
+    suggestions: List[UserSuggestion]
+
 class SignupRequest(BaseModel):
     email: EmailStr
     name: str
@@ -96,6 +104,16 @@ async def get_current_user(current_user: Dict[str, Any] = Depends(get_current_us
     """Get current authenticated user information"""
     return current_user
 
+@router.get("/users/typeahead", response_model=UserSuggestionResponse)
+async def suggest_users(
+    q: str = Query(..., min_length=1, description="Email or name prefix"),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: Dict[str, Any] = Depends(get_current_user_dependency)
+):
+    """Suggest users by email or name prefix, for assignee pickers"""
+    suggestions = await auth_service.suggest_users(q, limit)
+    return {"suggestions": suggestions}
+
 @router.post("/logout")
 async def logout(current_user: Dict[str, Any] = Depends(get_current_user_dependency)):
     """Logout current user (client-side token removal)"""
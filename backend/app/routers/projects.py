@@ -1,14 +1,28 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-from app.auth import get_optional_user
+from app.auth import get_optional_user, get_current_user_dependency
 from app.database import db_service
+from app.tasks import task_service
+from app.task_counters import task_counters
+from app.snapshot import MAX_SNAPSHOT_SIZE, SnapshotError, SnapshotConflict, dump_project_snapshot, restore_project_snapshot
+from app.project_jobs import project_deletion_worker
+from app.routers.tasks import TaskResponse
 from app.performance import monitor_performance
+import json
+import logging
 import uuid
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 
+# Tasks fetched per query when exporting, and written per transact when importing
+EXPORT_PAGE_SIZE = 500
+IMPORT_BATCH_SIZE = 200
+
 class ProjectCreate(BaseModel):
     name: str
     description: Optional[str] = ""
@@ -28,6 +42,38 @@ class ProjectResponse(BaseModel):
 class ProjectListResponse(BaseModel):
     projects: List[ProjectResponse]
 
+class BoardUser(BaseModel):
+    id: str
+    email: Optional[str] = None
+    name: Optional[str] = None
+    role: Optional[str] = None
+
+class ProjectBoardResponse(BaseModel):
+    project: ProjectResponse
+    columns: Dict[str, List[TaskResponse]]
+    users: Dict[str, BoardUser]
+
+class ProjectImportResponse(BaseModel):
+    imported: int
+    batches: int
+    skipped_lines: List[int]
+
+class ProjectDeletionResponse(BaseModel):
+    project_id: str
+    status: str
+    deleted_task_count: int
+    remaining_task_count: Optional[int] = None
+    deletion_started_at: Optional[int] = None
+    # Set when the worker gave up until the next start
+    error: Optional[str] = None
+
+class ProjectSummaryResponse(BaseModel):
+    project_id: str
+    total: int
+    by_status: Dict[str, int]
+    by_assignee: Dict[str, int]
+    reconciled_at: int
+
 @router.get("/", response_model=ProjectListResponse)
 @monitor_performance
 async def get_projects(
@@ -40,11 +86,13 @@ async def get_projects(
             "projects": {}
         })
 
-        projects = result.get("projects", [])
+        # Projects being deleted are hidden
+        projects = [project for project in result.get("projects", []) if project.get("status") != "deleting"]
 
-        # Add task count to each project (mock for now)
+        # Batch task counts across all projects in the response
+        task_counts = await task_service.get_task_counts([project["id"] for project in projects])
         for project in projects:
-            project["task_count"] = 0
+            project["task_count"] = task_counts.get(project["id"], 0)
 
         return {"projects": projects}
 
@@ -81,6 +129,9 @@ async def create_project(
             }
         ])
 
+        # A new project starts with no tasks, so its counters are exact
+        task_counters.reconcile(project_id, [])
+
         return {
             "id": project_id,
             "name": project_data.name,
@@ -96,6 +147,51 @@ async def create_project(
             detail=f"Failed to create project: {str(e)}"
         )
 
+async def read_snapshot_body(request: Request) -> bytes:
+    """Read an uploaded snapshot, refusing bodies over MAX_SNAPSHOT_SIZE with 413"""
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Snapshot is larger than {MAX_SNAPSHOT_SIZE} bytes"
+    )
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_SNAPSHOT_SIZE:
+        raise too_large
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > MAX_SNAPSHOT_SIZE:
+            raise too_large
+    return bytes(body)
+
+@router.post("/snapshot", response_model=ProjectResponse)
+@monitor_performance
+async def restore_snapshot(
+    request: Request,
+    preserve_ids: bool = Query(False, description="Keep project and task ids from the snapshot"),
+    current_user: Dict[str, Any] = Depends(get_current_user_dependency)
+):
+    """Restore a binary project snapshot as a project owned by the current user"""
+    data = await read_snapshot_body(request)
+    try:
+        return await restore_project_snapshot(data, current_user["id"], preserve_ids)
+
+    except SnapshotError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except SnapshotConflict as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to restore snapshot: {str(e)}"
+        )
+
 @router.get("/{project_id}", response_model=ProjectResponse)
 @monitor_performance
 async def get_project(
@@ -113,14 +209,15 @@ async def get_project(
         })
 
         projects = result.get("projects", [])
-        if not projects:
+        if not projects or projects[0].get("status") == "deleting":
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Project not found"
             )
 
         project = projects[0]
-        project["task_count"] = 0
+        task_counts = await task_service.get_task_counts([project_id])
+        project["task_count"] = task_counts[project_id]
         return project
 
     except HTTPException:
@@ -131,6 +228,249 @@ async def get_project(
             detail=f"Failed to get project: {str(e)}"
         )
 
+@router.get("/{project_id}/board", response_model=ProjectBoardResponse)
+@monitor_performance
+async def get_project_board(
+    project_id: str,
+    current_user: Dict[str, Any] = Depends(get_optional_user)
+):
+    """Get a project with its tasks by column and their assignees"""
+    try:
+        board = await task_service.get_project_board(project_id)
+
+        if board is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Project not found"
+            )
+
+        return board
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get project board: {str(e)}"
+        )
+
+@router.get("/{project_id}/summary", response_model=ProjectSummaryResponse)
+@monitor_performance
+async def get_project_summary(
+    project_id: str,
+    current_user: Dict[str, Any] = Depends(get_optional_user)
+):
+    """Get task counts by status and assignee for a project"""
+    try:
+        db = db_service.get_client()
+
+        result = await db.query({
+            "projects": {
+                "where": {"id": project_id}
+            }
+        })
+
+        projects = result.get("projects", [])
+        if not projects or projects[0].get("status") == "deleting":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Project not found"
+            )
+
+        summary = await task_service.get_project_summary(project_id)
+
+        if summary is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Task counts are not available yet"
+            )
+
+        return summary
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get project summary: {str(e)}"
+        )
+
+@router.get("/{project_id}/export")
+@monitor_performance
+async def export_project(
+    project_id: str,
+    current_user: Dict[str, Any] = Depends(get_optional_user)
+):
+    """Stream a project's tasks as NDJSON, one task per line"""
+    try:
+        db = db_service.get_client()
+
+        result = await db.query({
+            "projects": {
+                "where": {"id": project_id}
+            }
+        })
+
+        projects = result.get("projects", [])
+        if not projects or projects[0].get("status") == "deleting":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Project not found"
+            )
+
+        async def generate_lines():
+            try:
+                async for task in task_service.iter_project_tasks(project_id, EXPORT_PAGE_SIZE):
+                    yield json.dumps(task, separators=(",", ":")) + "\n"
+            except Exception as e:
+                # Headers are already sent; a truncated body is all we can signal
+                logger.error(f"Export of project {project_id} aborted: {e}")
+
+        return StreamingResponse(
+            generate_lines(),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="project-{project_id}.ndjson"'}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to export project: {str(e)}"
+        )
+
+@router.get("/{project_id}/snapshot")
+@monitor_performance
+async def get_project_snapshot(
+    project_id: str,
+    current_user: Dict[str, Any] = Depends(get_optional_user)
+):
+    """Download a compressed binary snapshot of a project, its tasks and users"""
+    try:
+        data = await dump_project_snapshot(project_id)
+
+        if data is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Project not found"
+            )
+
+        return Response(
+            content=data,
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="project-{project_id}.bhsnap"'}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to snapshot project: {str(e)}"
+        )
+
+@router.post("/{project_id}/import", response_model=ProjectImportResponse)
+@monitor_performance
+async def import_project(
+    project_id: str,
+    request: Request,
+    preserve_ids: bool = Query(False, description="Keep task ids from the export"),
+    current_user: Dict[str, Any] = Depends(get_optional_user)
+):
+    """Import NDJSON tasks into a project, committing in bounded batches.
+
+    The body is parsed as it streams in; lines that are not task objects
+    with a title are skipped and reported by line number.
+    """
+    try:
+        db = db_service.get_client()
+
+        result = await db.query({
+            "projects": {
+                "where": {"id": project_id}
+            }
+        })
+
+        projects = result.get("projects", [])
+        if not projects or projects[0].get("status") == "deleting":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Project not found"
+            )
+
+        # Check permission - only owner can import
+        if projects[0]["owner_id"] != current_user["id"]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You do not have permission to import into this project"
+            )
+
+        imported = 0
+        batches = 0
+        skipped_lines: List[int] = []
+        batch: List[Dict[str, Any]] = []
+
+        async def commit_batch():
+            nonlocal imported, batches
+            batch_result = await task_service.import_tasks(project_id, batch, preserve_ids)
+            if not batch_result["success"]:
+                if "already exist" in batch_result["error"] or "being deleted" in batch_result["error"]:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail=f"Import stopped after {imported} tasks: {batch_result['error']}"
+                    )
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Import stopped after {imported} tasks: {batch_result['error']}"
+                )
+            imported += batch_result["imported"]
+            batches += 1
+            batch.clear()
+
+        line_number = 0
+        buffer = b""
+
+        async def handle_line(line: bytes):
+            try:
+                task = json.loads(line)
+            except ValueError:
+                task = None
+            if not isinstance(task, dict) or not task.get("title"):
+                skipped_lines.append(line_number)
+                return
+            batch.append(task)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await commit_batch()
+
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_number += 1
+                if line.strip():
+                    await handle_line(line)
+
+        if buffer.strip():
+            line_number += 1
+            await handle_line(buffer)
+        if batch:
+            await commit_batch()
+
+        return {
+            "imported": imported,
+            "batches": batches,
+            "skipped_lines": skipped_lines
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to import project: {str(e)}"
+        )
+
 @router.put("/{project_id}", response_model=ProjectResponse)
 @monitor_performance
 async def update_project(
@@ -150,7 +490,7 @@ async def update_project(
         })
 
         projects = result.get("projects", [])
-        if not projects:
+        if not projects or projects[0].get("status") == "deleting":
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Project not found"
@@ -186,7 +526,8 @@ async def update_project(
 
         # Return updated project
         project.update(update_data)
-        project["task_count"] = 0
+        task_counts = await task_service.get_task_counts([project_id])
+        project["task_count"] = task_counts[project_id]
         return project
 
     except HTTPException:
@@ -215,7 +556,7 @@ async def delete_project(
         })
 
         projects = result.get("projects", [])
-        if not projects:
+        if not projects or projects[0].get("status") == "deleting":
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Project not found"
@@ -230,18 +571,15 @@ async def delete_project(
                 detail="You do not have permission to delete this project"
             )
 
-        # Delete project
-        await db.transact([
-            {
-                "projects": {
-                    "delete": {
-                        "where": {"id": project_id}
-                    }
-                }
-            }
-        ])
+        # Hide the project now; its tasks are deleted in the background
+        result = await project_deletion_worker.start_deletion(project_id)
+        if not result["success"]:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=result["error"]
+            )
 
-        return {"message": "Project deleted successfully", "project_id": project_id}
+        return {"message": "Project deletion started", "project_id": project_id, "status": "deleting"}
 
     except HTTPException:
         raise
@@ -250,3 +588,50 @@ async def delete_project(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete project: {str(e)}"
         )
+
+@router.get("/{project_id}/deletion", response_model=ProjectDeletionResponse)
+@monitor_performance
+async def get_project_deletion(
+    project_id: str,
+    current_user: Dict[str, Any] = Depends(get_optional_user)
+):
+    """Get the progress of a project deletion"""
+    try:
+        db = db_service.get_client()
+
+        result = await db.query({
+            "projects": {
+                "where": {"id": project_id}
+            }
+        })
+
+        projects = result.get("projects", [])
+        if not projects:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Project not found"
+            )
+
+        project = projects[0]
+        if project.get("status") != "deleting":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Project is not being deleted"
+            )
+
+        return {
+            "project_id": project_id,
+            "status": "deleting",
+            "deleted_task_count": project.get("deleted_task_count", 0),
+            "remaining_task_count": task_counters.get_total(project_id),
+            "deletion_started_at": project.get("deletion_started_at"),
+            "error": project_deletion_worker.parked.get(project_id)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get project deletion: {str(e)}"
+        )
@@ -21,6 +21,19 @@ class TaskUpdate(BaseModel):
     assignee_id: Optional[str] = None
     acceptance_criteria: Optional[str] = None
 
+class TaskMove(BaseModel):
+    status: Optional[str] = None
+    assignee_id: Optional[str] = None
+    after_id: Optional[str] = None
+    before_id: Optional[str] = None
+
+class TaskMoveResponse(BaseModel):
+    id: str
+    status: Optional[str] = None
+    assignee_id: Optional[str] = None
+    rank: Optional[str] = None
+    updated_at: Optional[int] = None
+
 class TaskResponse(BaseModel):
     id: str
     project_id: str
@@ -29,12 +42,44 @@ class TaskResponse(BaseModel):
     status: str
     acceptance_criteria: str
     assignee_id: Optional[str] = None
+    rank: Optional[str] = None
     created_at: int
     updated_at: int
 
 class TaskListResponse(BaseModel):
     tasks: List[TaskResponse]
 
+class TaskBatchResponse(BaseModel):
+    projects: Dict[str, Dict[str, List[TaskResponse]]]
+
+class TaskSearchHit(BaseModel):
+    id: str
+    project_id: Optional[str] = None
+    title: str
+    status: str
+    score: float
+
+class TaskSearchResponse(BaseModel):
+    hits: List[TaskSearchHit]
+    total: int
+
+class TaskSuggestion(BaseModel):
+    id: str
+    title: str
+    status: str
+
+class TaskSuggestionResponse(BaseModel):
+    suggestions: List[TaskSuggestion]
+
+class TaskTombstone(BaseModel):
+    id: str
+    deleted_at: int
+
+class TaskChangesResponse(BaseModel):
+    tasks: List[TaskResponse]
+    deleted: List[TaskTombstone]
+    cursor: str
+
 @router.post("/", response_model=TaskResponse)
 @monitor_performance
 async def create_task(
@@ -46,6 +91,11 @@ async def create_task(
         result = await task_service.create_task(task_data.dict(), current_user)
         
         if not result["success"]:
+            if "being deleted" in result["error"]:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=result["error"]
+                )
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=result["error"]
@@ -78,6 +128,108 @@ async def get_tasks(
             detail=f"Failed to get tasks: {str(e)}"
         )
 
+@router.get("/batch", response_model=TaskBatchResponse)
+@monitor_performance
+async def get_tasks_batch(
+    statuses: Optional[List[str]] = Query(None, alias="status", description="Statuses to include"),
+    project_ids: Optional[List[str]] = Query(None, alias="project_id", description="Projects to include"),
+    assignee_ids: Optional[List[str]] = Query(None, alias="assignee_id", description="Assignees to include"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Most tasks per project and status"),
+    current_user: Dict[str, Any] = Depends(get_optional_user)
+):
+    """Get tasks for several statuses, projects and assignees in one query,
+    grouped by project and status"""
+    try:
+        invalid = [value for value in statuses or [] if value not in ["todo", "in_progress", "done"]]
+        if invalid:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid status. Must be one of: todo, in_progress, done"
+            )
+
+        projects = await task_service.get_tasks_batch(statuses, project_ids, assignee_ids, limit)
+        return {"projects": projects}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get tasks: {str(e)}"
+        )
+
+@router.get("/changes", response_model=TaskChangesResponse)
+@monitor_performance
+async def get_task_changes(
+    project_id: str = Query(..., description="Project to sync"),
+    since: Optional[str] = Query(None, description="Cursor returned by the previous sync"),
+    current_user: Dict[str, Any] = Depends(get_optional_user)
+):
+    """Get tasks changed or deleted since a cursor, for incremental sync"""
+    try:
+        result = await task_service.get_task_changes(project_id, since)
+
+        if not result["success"]:
+            if "cursor" in result["error"].lower():
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=result["error"]
+                )
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=result["error"]
+            )
+
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get task changes: {str(e)}"
+        )
+
+@router.get("/search", response_model=TaskSearchResponse)
+@monitor_performance
+async def search_tasks(
+    q: str = Query(..., min_length=1, description="Search text"),
+    project_id: Optional[str] = Query(None, description="Filter by project ID"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: Dict[str, Any] = Depends(get_optional_user)
+):
+    """Search tasks by title, description and acceptance criteria"""
+    try:
+        result = await task_service.search_tasks(q, project_id, limit, offset)
+
+        if not result["success"]:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=result["error"]
+            )
+
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to search tasks: {str(e)}"
+        )
+
+@router.get("/typeahead", response_model=TaskSuggestionResponse)
+async def suggest_tasks(
+    q: str = Query(..., min_length=1, description="Title prefix"),
+    project_id: str = Query(..., description="Project to search"),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: Dict[str, Any] = Depends(get_optional_user)
+):
+    """Suggest tasks in a project by title prefix"""
+    suggestions = await task_service.suggest_tasks(project_id, q, limit)
+    return {"suggestions": suggestions}
+
 @router.get("/{task_id}", response_model=TaskResponse)
 @monitor_performance
 async def get_task(
@@ -144,6 +296,58 @@ async def update_task(
             detail=f"Failed to update task: {str(e)}"
         )
 
+@router.post("/{task_id}/move", response_model=TaskMoveResponse, response_model_exclude_unset=True)
+@monitor_performance
+async def move_task(
+    task_id: str,
+    move_data: TaskMove,
+    current_user: Dict[str, Any] = Depends(get_optional_user)
+):
+    """Move a task to a column, position and assignee in one write.
+
+    Returns only the fields that changed.
+    """
+    try:
+        if move_data.status and move_data.status not in ["todo", "in_progress", "done"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid status. Must be one of: todo, in_progress, done"
+            )
+
+        result = await task_service.move_task(task_id, move_data.dict(exclude_unset=True), current_user)
+
+        if not result["success"]:
+            if "not found" in result["error"].lower():
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=result["error"]
+                )
+            elif "permission" in result["error"].lower():
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail=result["error"]
+                )
+            elif "stale" in result["error"].lower():
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=result["error"]
+                )
+            else:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=result["error"]
+                )
+
+        return {"id": task_id, **result["updated_fields"]}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to move task: {str(e)}"
+        )
+
 @router.delete("/{task_id}")
 @monitor_performance
 async def delete_task(
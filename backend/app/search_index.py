@@ -0,0 +1,226 @@
+import heapq
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Title matches rank above matches in longer free-text fields
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "description": 1.0,
+    "acceptance_criteria": 1.0
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into lowercase alphanumeric tokens"""
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+class IndexedTask:
+    __slots__ = ("project_id", "title", "status", "terms", "length")
+
+    def __init__(self, task: Dict[str, Any]):
+        self.project_id = task.get("project_id")
+        self.title = task.get("title") or ""
+        self.status = task.get("status") or "todo"
+
+        terms: Counter = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(task.get(field)):
+                terms[token] += weight
+        self.terms = dict(terms)
+        self.length = sum(self.terms.values())
+
+class TaskSearchIndex:
+    """Inverted index over task text fields with BM25 ranking.
+
+    The index is fed incrementally by TaskService writes. Projects are
+    loaded in full from the database the first time they are searched, and
+    a search without a project loads every task once. Loaded scopes are
+    periodically reloaded to pick up writes made outside this process.
+
+    Reloads build a separate index off the event loop and swap it in;
+    writes made while a reload reads and builds are recorded and applied
+    again on top of it.
+    """
+
+    def __init__(self, refresh_interval: int = 300):
+        self.refresh_interval = refresh_interval
+        self.postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.documents: Dict[str, IndexedTask] = {}
+        self.project_tasks: Dict[str, Set[str]] = defaultdict(set)
+        self.loaded_projects: Set[str] = set()
+        self.loaded_at: Dict[str, float] = {}
+        self.fully_loaded = False
+        self.fully_loaded_at = 0.0
+        self.total_length = 0.0
+        # Task id -> task, or None if removed, per reload in progress
+        self.recorders: List[Dict[str, Optional[Dict[str, Any]]]] = []
+
+    @classmethod
+    def build(cls, tasks: List[Dict[str, Any]]) -> "TaskSearchIndex":
+        """Index tasks into a new index; touches no shared state, so it can run in a thread"""
+        index = cls()
+        for task in tasks:
+            index._insert(task["id"], IndexedTask(task))
+        return index
+
+    def add_task(self, task: Dict[str, Any]):
+        """Index a task, replacing any previous version of it"""
+        for changes in self.recorders:
+            changes[task["id"]] = task
+        self._insert(task["id"], IndexedTask(task))
+
+    def remove_task(self, task_id: str):
+        """Remove a task from the index"""
+        for changes in self.recorders:
+            changes[task_id] = None
+        self._remove(task_id)
+
+    def _insert(self, task_id: str, document: IndexedTask):
+        self._remove(task_id)
+        self.documents[task_id] = document
+        self.project_tasks[document.project_id].add(task_id)
+        self.total_length += document.length
+        for token, weight in document.terms.items():
+            self.postings[token][task_id] = weight
+
+    def _remove(self, task_id: str):
+        document = self.documents.pop(task_id, None)
+        if document is None:
+            return
+
+        self.total_length -= document.length
+        self.project_tasks[document.project_id].discard(task_id)
+        for token in document.terms:
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(task_id, None)
+                if not postings:
+                    del self.postings[token]
+
+    def drop_project(self, project_id: str):
+        """Remove every task of a project from the index"""
+        for task_id in list(self.project_tasks.pop(project_id, ())):
+            self._remove(task_id)
+        self.loaded_projects.discard(project_id)
+        self.loaded_at.pop(project_id, None)
+
+    def load_project(self, project_id: str, tasks: List[Dict[str, Any]]):
+        """Replace a project's indexed tasks with its full task list"""
+        self.swap_in(self.build(tasks), project_id)
+
+    def load_all(self, tasks: List[Dict[str, Any]]):
+        """Replace the whole index with every task in the database"""
+        self.swap_in(self.build(tasks))
+
+    def start_recording(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Record writes from now on, for a reload to apply over what it read"""
+        changes: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.recorders.append(changes)
+        return changes
+
+    def stop_recording(self, changes: Dict[str, Optional[Dict[str, Any]]]):
+        """Stop recording writes for a reload"""
+        if changes in self.recorders:
+            self.recorders.remove(changes)
+
+    def swap_in(self, built: "TaskSearchIndex", project_id: Optional[str] = None,
+                changes: Optional[Dict[str, Optional[Dict[str, Any]]]] = None):
+        """Replace a project, or the whole index, with a built index, then apply recorded writes"""
+        if project_id:
+            self.drop_project(project_id)
+            for task_id, document in built.documents.items():
+                self._insert(task_id, document)
+            self.loaded_projects.add(project_id)
+            self.loaded_at[project_id] = time.time()
+        else:
+            self.postings = built.postings
+            self.documents = built.documents
+            self.project_tasks = built.project_tasks
+            self.total_length = built.total_length
+            self.fully_loaded = True
+            self.fully_loaded_at = time.time()
+            # Loaded projects were replaced too
+            for loaded_project in self.loaded_projects:
+                self.loaded_at[loaded_project] = self.fully_loaded_at
+
+        for task_id, task in (changes or {}).items():
+            if task is None:
+                self._remove(task_id)
+            else:
+                self._insert(task_id, IndexedTask(task))
+
+    def is_loaded(self, project_id: Optional[str] = None) -> bool:
+        """Check whether a project, or every project, has been loaded"""
+        if self.fully_loaded:
+            return True
+        return project_id is not None and project_id in self.loaded_projects
+
+    def needs_full_refresh(self) -> bool:
+        """Check whether every task was loaded and is due for a reload"""
+        return self.fully_loaded and time.time() - self.fully_loaded_at >= self.refresh_interval
+
+    def stale_projects(self) -> List[str]:
+        """List loaded projects due for a reload"""
+        now = time.time()
+        return [project_id for project_id, loaded_at in list(self.loaded_at.items())
+                if now - loaded_at >= self.refresh_interval]
+
+    def search(self, query: str, project_id: Optional[str] = None,
+               limit: int = 20, offset: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+        """Rank tasks matching any query token, returning (total, page of hits)"""
+        tokens = set(tokenize(query))
+        if not tokens or not self.documents:
+            return 0, []
+
+        doc_count = len(self.documents)
+        avg_length = self.total_length / doc_count or 1.0
+        scope = self.project_tasks.get(project_id, set()) if project_id else None
+        scores: Dict[str, float] = defaultdict(float)
+
+        for token in tokens:
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+
+            # Walk whichever side is smaller: the posting list or the project
+            if scope is None:
+                matches = postings.items()
+            elif len(scope) < len(postings):
+                matches = ((task_id, postings[task_id]) for task_id in scope if task_id in postings)
+            else:
+                matches = ((task_id, weight) for task_id, weight in postings.items() if task_id in scope)
+
+            documents = self.documents
+            base = K1 * (1 - B)
+            per_length = K1 * B / avg_length
+            for task_id, weight in matches:
+                scores[task_id] += idf * weight * (K1 + 1) / (weight + base + per_length * documents[task_id].length)
+
+        ranked = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        hits = []
+        for task_id, score in ranked[offset:]:
+            document = self.documents[task_id]
+            hits.append({
+                "id": task_id,
+                "project_id": document.project_id,
+                "title": document.title,
+                "status": document.status,
+                "score": round(score, 4)
+            })
+
+        return len(scores), hits
+
+# Global task search index
+search_index = TaskSearchIndex()
@@ -0,0 +1,248 @@
+"""
+Cross-worker performance metrics.
+
+With several uvicorn workers every process has its own PerformanceMonitor.
+When PERFORMANCE_SHM_PATH is set, workers share a memory-mapped file split
+into fixed-size slots, one per worker. Each worker periodically publishes
+its aggregated metrics into its own slot; since a slot has a single writer
+no locking is needed, and a sequence number around each write lets readers
+detect and retry torn reads. The stats endpoints merge all live slots.
+
+Slots are sized from the number of routes, since per-route state is
+bounded; a worker whose state still does not fit reports how many bytes it
+needed instead of silently disappearing from the merged stats.
+"""
+
+import asyncio
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Any, List, Optional
+
+import msgpack
+
+from app.performance import (
+    HISTOGRAM_BUCKETS, WINDOW_BUCKETS, WINDOW_SLOTS, PerformanceMonitor, performance_monitor
+)
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"BHPERF02"
+# Magic, slot count, slot size, reset epoch
+FILE_HEADER = struct.Struct("<8sIIQ")
+# Sequence number (odd while being written), pid, publish time, payload
+# length, bytes the full state needed when it did not fit (0 if it did)
+SLOT_HEADER = struct.Struct("<QIdII")
+
+DEFAULT_SLOTS = 16
+DEFAULT_SLOT_SIZE = 1 << 20
+# Most recent slow requests each worker publishes
+SHARED_SLOW_REQUESTS = 20
+
+# Upper bounds on the packed size of each part of a worker's state
+HISTOGRAM_STATE_BYTES = HISTOGRAM_BUCKETS * 8 + 64
+ROUTE_STATE_BYTES = HISTOGRAM_STATE_BYTES + WINDOW_SLOTS * (WINDOW_BUCKETS * 4 + 48) + 1024
+CALL_SERIES = 32
+SLOW_REQUEST_BYTES = 4096
+COUNTER_BYTES = 16 * 1024
+PUBLISH_INTERVAL = 1.0
+# Slots not published for this long belong to hung or dead workers
+STALE_AFTER = 30.0
+
+def slot_size_for(routes: int) -> int:
+    """Get a slot size that fits the state of a worker serving `routes` routes"""
+    size = (SLOT_HEADER.size
+            + (routes + 2) * ROUTE_STATE_BYTES  # plus overall and unmatched
+            + CALL_SERIES * HISTOGRAM_STATE_BYTES
+            + SHARED_SLOW_REQUESTS * SLOW_REQUEST_BYTES
+            + COUNTER_BYTES)
+    return -(-size // mmap.PAGESIZE) * mmap.PAGESIZE
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class SharedMetrics:
+    """Per-worker slots in a shared memory-mapped metrics file"""
+
+    def __init__(self, path: str, monitor: PerformanceMonitor,
+                 slots: int = DEFAULT_SLOTS, slot_size: int = DEFAULT_SLOT_SIZE):
+        self.path = path
+        self.monitor = monitor
+        self.pid = os.getpid()
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                size = FILE_HEADER.size + slots * slot_size
+                header = os.pread(fd, FILE_HEADER.size, 0)
+                if len(header) == FILE_HEADER.size and FILE_HEADER.unpack(header)[0] == MAGIC:
+                    # Another worker created the file; use its layout
+                    _, slots, slot_size, _ = FILE_HEADER.unpack(header)
+                    size = FILE_HEADER.size + slots * slot_size
+                else:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, FILE_HEADER.pack(MAGIC, slots, slot_size, 0), 0)
+
+                self.slots = slots
+                self.slot_size = slot_size
+                self.mmap = mmap.mmap(fd, size)
+                self.reset_epoch = self._read_reset_epoch()
+                self.slot = self._claim_slot()
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+        self.seq = SLOT_HEADER.unpack_from(self.mmap, self._offset(self.slot))[0] & ~1
+        self.overflow = 0
+
+    def _offset(self, slot: int) -> int:
+        return FILE_HEADER.size + slot * self.slot_size
+
+    def _read_reset_epoch(self) -> int:
+        return FILE_HEADER.unpack_from(self.mmap, 0)[3]
+
+    def _claim_slot(self) -> int:
+        now = time.time()
+        # Slots of workers that exited are free
+        for slot in range(self.slots):
+            seq, pid, published_at, _, _ = SLOT_HEADER.unpack_from(self.mmap, self._offset(slot))
+            if pid in (0, self.pid) or not process_alive(pid):
+                SLOT_HEADER.pack_into(self.mmap, self._offset(slot), seq & ~1, self.pid, now, 0, 0)
+                return slot
+        raise RuntimeError(f"All {self.slots} shared metrics slots in {self.path} are in use")
+
+    def publish(self):
+        """Write this worker's metrics into its slot"""
+        # A reset requested by any worker applies to all of them
+        reset_epoch = self._read_reset_epoch()
+        if reset_epoch != self.reset_epoch:
+            self.monitor.reset_metrics()
+            self.reset_epoch = reset_epoch
+
+        capacity = self.slot_size - SLOT_HEADER.size
+        state = self.monitor.to_state(slow_limit=SHARED_SLOW_REQUESTS)
+        payload = msgpack.packb(state, use_bin_type=True)
+        overflow = 0
+        if len(payload) > capacity:
+            # Counters and histograms matter more than slow request samples
+            overflow = len(payload)
+            state["slow_queries"] = []
+            payload = msgpack.packb(state, use_bin_type=True)
+            if len(payload) > capacity:
+                payload = b""
+
+        if overflow and not self.overflow:
+            logger.warning(f"Metrics for worker {self.pid} ({overflow} bytes) do not fit a "
+                           f"{self.slot_size} byte shared slot{'' if payload else '; not publishing them'}")
+        self.overflow = overflow
+
+        offset = self._offset(self.slot)
+        SLOT_HEADER.pack_into(self.mmap, offset, self.seq + 1, self.pid, time.time(), len(payload), overflow)
+        self.mmap[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(payload)] = payload
+        self.seq += 2
+        SLOT_HEADER.pack_into(self.mmap, offset, self.seq, self.pid, time.time(), len(payload), overflow)
+
+    def _read_slot(self, slot: int) -> Optional[Dict[str, Any]]:
+        offset = self._offset(slot)
+        for _ in range(5):
+            seq, pid, published_at, length, _ = SLOT_HEADER.unpack_from(self.mmap, offset)
+            if not pid or not length or time.time() - published_at > STALE_AFTER or not process_alive(pid):
+                return None
+            if seq & 1:
+                continue
+            payload = self.mmap[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + length]
+            if SLOT_HEADER.unpack_from(self.mmap, offset)[0] != seq:
+                continue
+            try:
+                return msgpack.unpackb(payload, raw=False)
+            except Exception:
+                return None
+        return None
+
+    def merged_monitor(self) -> PerformanceMonitor:
+        """Get a monitor holding this worker's live metrics plus every other live worker's"""
+        merged = PerformanceMonitor()
+        merged.merge_state(self.monitor.to_state())
+        for slot in range(self.slots):
+            if slot != self.slot:
+                state = self._read_slot(slot)
+                if state:
+                    merged.merge_state(state)
+        return merged
+
+    def workers(self) -> List[Dict[str, Any]]:
+        """List live workers, when they last published and whether their state overflowed its slot"""
+        workers = []
+        now = time.time()
+        for slot in range(self.slots):
+            _, pid, published_at, length, overflow = SLOT_HEADER.unpack_from(self.mmap, self._offset(slot))
+            if pid and (slot == self.slot or now - published_at <= STALE_AFTER):
+                workers.append({
+                    "pid": pid,
+                    "slot": slot,
+                    "published_at": published_at,
+                    "payload_bytes": length,
+                    "overflow_bytes": overflow
+                })
+        return workers
+
+    def reset(self):
+        """Reset metrics in every worker"""
+        self.reset_epoch = self._read_reset_epoch() + 1
+        struct.pack_into("<Q", self.mmap, FILE_HEADER.size - 8, self.reset_epoch)
+        self.monitor.reset_metrics()
+        self.publish()
+
+    async def run(self):
+        """Publish this worker's metrics forever"""
+        while True:
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Error publishing shared metrics: {e}")
+            await asyncio.sleep(PUBLISH_INTERVAL)
+
+    def close(self):
+        """Release this worker's slot"""
+        SLOT_HEADER.pack_into(self.mmap, self._offset(self.slot), self.seq, 0, 0.0, 0, 0)
+        self.mmap.close()
+
+# Shared metrics for this worker; set up by init_shared_metrics() when configured
+shared_metrics: Optional[SharedMetrics] = None
+
+def init_shared_metrics(routes: int) -> Optional[SharedMetrics]:
+    """Join the shared metrics file named by PERFORMANCE_SHM_PATH, if set"""
+    global shared_metrics
+    path = os.getenv("PERFORMANCE_SHM_PATH")
+    if path and shared_metrics is None:
+        shared_metrics = SharedMetrics(path, performance_monitor, slot_size=slot_size_for(routes))
+    return shared_metrics
+
+def aggregated_monitor() -> PerformanceMonitor:
+    """Get metrics across all workers, or this worker's when not shared"""
+    if shared_metrics:
+        return shared_metrics.merged_monitor()
+    return performance_monitor
+
+def get_workers() -> Optional[List[Dict[str, Any]]]:
+    """List workers sharing metrics, or None when not shared"""
+    return shared_metrics.workers() if shared_metrics else None
+
+def reset_all_metrics():
+    """Reset metrics in every worker, or in this one when not shared"""
+    if shared_metrics:
+        shared_metrics.reset()
+    else:
+        performance_monitor.reset_metrics()
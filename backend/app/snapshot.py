@@ -0,0 +1,272 @@
+"""
+Binary project snapshots.
+
+A snapshot holds a project, its tasks and the users they reference. The
+layout is columnar and schema-aware: each field is stored as one column,
+low-cardinality strings are dictionary-encoded and timestamps are
+delta-encoded, then the whole document is packed with msgpack and
+compressed with zstd behind a small versioned header.
+"""
+
+import struct
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+
+import msgpack
+import zstandard
+
+from app.database import db_service
+from app.tasks import task_service
+from app.task_counters import task_counters
+
+MAGIC = b"BHSNAP"
+FORMAT_VERSION = 1
+CODEC_ZSTD = 1
+HEADER = struct.Struct(">6sBB")
+COMPRESSION_LEVEL = 3
+
+# Tasks are restored through TaskService in batches of this size
+RESTORE_BATCH_SIZE = 200
+
+# Largest snapshot accepted for restore, and the most it may decompress to
+MAX_SNAPSHOT_SIZE = 32 * 1024 * 1024
+MAX_DECODED_SIZE = 256 * 1024 * 1024
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+# Column encodings: "value" stores values as-is, "dict" stores indexes into
+# a table of distinct values, "delta" stores differences between integers
+PROJECT_SCHEMA: List[Tuple[str, str]] = [
+    ("id", "value"),
+    ("name", "value"),
+    ("description", "value"),
+    ("owner_id", "value"),
+    ("created_at", "value"),
+]
+TASK_SCHEMA: List[Tuple[str, str]] = [
+    ("id", "value"),
+    ("title", "value"),
+    ("description", "value"),
+    ("status", "dict"),
+    ("acceptance_criteria", "value"),
+    ("assignee_id", "dict"),
+    ("rank", "value"),
+    ("created_at", "delta"),
+    ("updated_at", "delta"),
+]
+# Password hashes never leave the database
+USER_SCHEMA: List[Tuple[str, str]] = [
+    ("id", "value"),
+    ("email", "value"),
+    ("name", "value"),
+    ("role", "dict"),
+    ("created_at", "delta"),
+]
+
+class SnapshotError(ValueError):
+    """Raised when snapshot bytes cannot be decoded"""
+
+class SnapshotConflict(Exception):
+    """Raised when a snapshot restored with its ids would overwrite existing records"""
+
+def encode_columns(rows: List[Dict[str, Any]], schema: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """Turn rows into schema-ordered, encoded columns"""
+    columns = []
+    for field, encoding in schema:
+        values = [row.get(field) for row in rows]
+        if encoding == "dict":
+            table: Dict[Any, int] = {}
+            indexes = [table.setdefault(value, len(table)) for value in values]
+            columns.append([list(table), indexes])
+        elif encoding == "delta":
+            previous = 0
+            deltas = []
+            for value in values:
+                value = int(value or 0)
+                deltas.append(value - previous)
+                previous = value
+            columns.append(deltas)
+        else:
+            columns.append(values)
+    return {"count": len(rows), "fields": [field for field, _ in schema], "columns": columns}
+
+def decode_columns(table: Dict[str, Any], schema: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """Turn encoded columns back into rows"""
+    if table.get("fields") != [field for field, _ in schema]:
+        raise SnapshotError("Snapshot columns do not match the expected schema")
+
+    count = table["count"]
+    rows: List[Dict[str, Any]] = [{} for _ in range(count)]
+    for (field, encoding), column in zip(schema, table["columns"]):
+        if encoding == "dict":
+            values, indexes = column
+            decoded = [values[index] for index in indexes]
+        elif encoding == "delta":
+            decoded = []
+            total = 0
+            for delta in column:
+                total += delta
+                decoded.append(total)
+        else:
+            decoded = column
+        for row, value in zip(rows, decoded):
+            if value is not None:
+                row[field] = value
+    return rows
+
+def encode_snapshot(project: Dict[str, Any], tasks: List[Dict[str, Any]], users: List[Dict[str, Any]]) -> bytes:
+    """Serialize a project, its tasks and users to snapshot bytes"""
+    document = {
+        "project": encode_columns([project], PROJECT_SCHEMA),
+        "tasks": encode_columns(tasks, TASK_SCHEMA),
+        "users": encode_columns(users, USER_SCHEMA),
+    }
+    payload = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(
+        msgpack.packb(document, use_bin_type=True)
+    )
+    return HEADER.pack(MAGIC, FORMAT_VERSION, CODEC_ZSTD) + payload
+
+def decompress_payload(payload: bytes, max_size: int = MAX_DECODED_SIZE) -> bytes:
+    """Decompress a zstd payload, refusing output beyond max_size.
+
+    Streams in chunks rather than trusting the size in the frame header,
+    so a small upload cannot make the server allocate gigabytes.
+    """
+    chunks = []
+    total = 0
+    with zstandard.ZstdDecompressor().stream_reader(payload) as reader:
+        while True:
+            chunk = reader.read(DECOMPRESS_CHUNK_SIZE)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_size:
+                raise SnapshotError(f"Snapshot decompresses to more than {max_size} bytes")
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+def decode_snapshot(data: bytes, max_decoded_size: int = MAX_DECODED_SIZE) -> Dict[str, Any]:
+    """Parse snapshot bytes into project, tasks and users"""
+    if len(data) < HEADER.size:
+        raise SnapshotError("Snapshot is truncated")
+
+    magic, version, codec = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError("Not a project snapshot")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+    if codec != CODEC_ZSTD:
+        raise SnapshotError(f"Unsupported snapshot codec {codec}")
+
+    try:
+        document = msgpack.unpackb(
+            decompress_payload(data[HEADER.size:], max_decoded_size),
+            raw=False
+        )
+        projects = decode_columns(document["project"], PROJECT_SCHEMA)
+        return {
+            "project": projects[0] if projects else None,
+            "tasks": decode_columns(document["tasks"], TASK_SCHEMA),
+            "users": decode_columns(document["users"], USER_SCHEMA),
+        }
+    except SnapshotError:
+        raise
+    except Exception as e:
+        raise SnapshotError(f"Corrupt snapshot: {e}") from e
+
+async def dump_project_snapshot(project_id: str) -> Optional[bytes]:
+    """Build a snapshot of a project, or None if it does not exist or is being deleted"""
+    db = db_service.get_client()
+
+    result = await db.query({
+        "projects": {
+            "where": {"id": project_id}
+        }
+    })
+    projects = result.get("projects", [])
+    if not projects or projects[0].get("status") == "deleting":
+        return None
+
+    tasks = [task async for task in task_service.iter_project_tasks(project_id)]
+    # Creation order keeps timestamp deltas small
+    tasks.sort(key=lambda task: (task.get("created_at", 0), task["id"]))
+
+    users: List[Dict[str, Any]] = []
+    assignee_ids = sorted({task["assignee_id"] for task in tasks if task.get("assignee_id")})
+    if assignee_ids:
+        result = await db.query({
+            "users": {
+                "where": {"id": {"$in": assignee_ids}}
+            }
+        })
+        users = result.get("users", [])
+
+    return encode_snapshot(projects[0], tasks, users)
+
+async def restore_project_snapshot(data: bytes, owner_id: str, preserve_ids: bool = False) -> Dict[str, Any]:
+    """Restore a snapshot as a project owned by owner_id.
+
+    By default the project and its tasks get fresh ids, so a snapshot can be
+    restored next to the original. With preserve_ids the original ids are
+    kept, for restoring a project that was lost, and the restore is refused
+    if any of them is already taken. Users are never created
+    from a snapshot: assignees that do not exist in this database are
+    cleared.
+    """
+    snapshot = decode_snapshot(data)
+    project = snapshot["project"]
+    if not project:
+        raise SnapshotError("Snapshot has no project")
+
+    db = db_service.get_client()
+
+    tasks = snapshot["tasks"]
+    assignee_ids = sorted({task["assignee_id"] for task in tasks if task.get("assignee_id")})
+    if assignee_ids:
+        result = await db.query({
+            "users": {
+                "where": {"id": {"$in": assignee_ids}}
+            }
+        })
+        if "users" not in result:
+            raise RuntimeError("Failed to look up assignees")
+        existing_users = {user["id"] for user in result["users"]}
+        tasks = [
+            {**task, "assignee_id": None} if task.get("assignee_id") not in existing_users else task
+            for task in tasks
+        ]
+
+    if preserve_ids:
+        result = await db.query({
+            "projects": {
+                "where": {"id": project["id"]}
+            }
+        })
+        if "projects" not in result:
+            raise RuntimeError("Failed to look up project id")
+        if result["projects"]:
+            raise SnapshotConflict(f"Project {project['id']} already exists")
+
+        task_ids = [task["id"] for task in tasks if task.get("id")]
+        if len(set(task_ids)) != len(task_ids):
+            raise SnapshotConflict("Snapshot has duplicate task ids")
+        for start in range(0, len(task_ids), RESTORE_BATCH_SIZE):
+            taken = await task_service.find_existing_task_ids(task_ids[start:start + RESTORE_BATCH_SIZE])
+            if taken:
+                raise SnapshotConflict(f"Task ids already exist: {', '.join(sorted(taken)[:5])}")
+    else:
+        project = {**project, "id": str(uuid.uuid4())}
+    project = {**project, "owner_id": owner_id, "description": project.get("description", "")}
+
+    result = await db.transact([{"projects": {"create": project}}])
+    if "error" in result:
+        raise RuntimeError(f"Failed to create project: {result['error']}")
+    task_counters.reconcile(project["id"], [])
+
+    for start in range(0, len(tasks), RESTORE_BATCH_SIZE):
+        batch_result = await task_service.import_tasks(
+            project["id"], tasks[start:start + RESTORE_BATCH_SIZE], preserve_ids
+        )
+        if not batch_result["success"]:
+            raise RuntimeError(f"Restore stopped after {start} tasks: {batch_result['error']}")
+
+    return {**project, "task_count": len(tasks)}
@@ -0,0 +1,103 @@
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+TASK_STATUSES = ["todo", "in_progress", "done"]
+
+class ProjectCounters:
+    def __init__(self):
+        self.total = 0
+        self.by_status: Counter = Counter()
+        self.by_assignee: Counter = Counter()
+        self.reconciled_at = 0.0
+
+    def add(self, task: Dict[str, Any], delta: int):
+        """Apply a task's contribution to the counters"""
+        self.total += delta
+        self.by_status[task.get("status") or "todo"] += delta
+        assignee_id = task.get("assignee_id")
+        if assignee_id:
+            self.by_assignee[assignee_id] += delta
+            if self.by_assignee[assignee_id] <= 0:
+                del self.by_assignee[assignee_id]
+
+class TaskCounterStore:
+    """Per-project task counts kept current by TaskService writes.
+
+    Deltas are only applied to projects that have been seeded from the
+    database, since an unseeded project's baseline is unknown. Seeded
+    projects are periodically reconciled against the source of truth to
+    correct drift from writes made outside this process.
+    """
+
+    def __init__(self, reconcile_interval: int = 300):
+        self.reconcile_interval = reconcile_interval
+        self.projects: Dict[str, ProjectCounters] = {}
+
+    def task_created(self, task: Dict[str, Any]):
+        """Count a newly created task"""
+        counters = self.projects.get(task.get("project_id"))
+        if counters:
+            counters.add(task, 1)
+
+    def task_updated(self, before: Dict[str, Any], after: Dict[str, Any]):
+        """Move a task between status and assignee buckets"""
+        if (before.get("status") == after.get("status") and
+                before.get("assignee_id") == after.get("assignee_id")):
+            return
+        counters = self.projects.get(before.get("project_id"))
+        if counters:
+            counters.add(before, -1)
+            counters.add(after, 1)
+
+    def task_deleted(self, task: Dict[str, Any]):
+        """Stop counting a deleted task"""
+        counters = self.projects.get(task.get("project_id"))
+        if counters:
+            counters.add(task, -1)
+
+    def needs_reconcile(self, project_id: str) -> bool:
+        """Check whether a project is unseeded or its counters are stale"""
+        counters = self.projects.get(project_id)
+        return counters is None or time.time() - counters.reconciled_at >= self.reconcile_interval
+
+    def stale_projects(self) -> List[str]:
+        """List seeded projects whose counters are due for reconciliation"""
+        return [project_id for project_id in list(self.projects) if self.needs_reconcile(project_id)]
+
+    def reconcile(self, project_id: str, tasks: List[Dict[str, Any]]):
+        """Replace a project's counters with counts over its full task list"""
+        counters = ProjectCounters()
+        for task in tasks:
+            counters.add(task, 1)
+        counters.reconciled_at = time.time()
+        self.projects[project_id] = counters
+
+    def drop_project(self, project_id: str):
+        """Forget a project's counters"""
+        self.projects.pop(project_id, None)
+
+    def get_total(self, project_id: str) -> Optional[int]:
+        """Get a project's task count, or None if it has not been seeded"""
+        counters = self.projects.get(project_id)
+        return counters.total if counters else None
+
+    def get_summary(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Get a project's task counts, or None if it has not been seeded"""
+        counters = self.projects.get(project_id)
+        if not counters:
+            return None
+
+        by_status = {task_status: 0 for task_status in TASK_STATUSES}
+        by_status.update({key: value for key, value in counters.by_status.items() if value})
+
+        return {
+            "project_id": project_id,
+            "total": counters.total,
+            "by_status": by_status,
+            "by_assignee": dict(counters.by_assignee),
+            "reconciled_at": int(counters.reconciled_at)
+        }
+
+# Global task counter store
+task_counters = TaskCounterStore()
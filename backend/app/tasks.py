@@ -1,22 +1,98 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional, Set, Tuple
 from datetime import datetime
 from app.database import db_service
 from app.auth import auth_service
+from app.task_counters import task_counters, TASK_STATUSES
+from app.search_index import TaskSearchIndex, search_index
+from app.typeahead import typeahead_index
+from app.write_behind import task_write_behind
+from app.fractional_index import generate_key_between, key_for_integer, sequential_keys
+from app.dataloader import load_by_id, invalidate
+from app.performance import performance_monitor
+from app.timestamps import change_timestamp
+import asyncio
+import base64
+import hashlib
+import json
 import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Column order keys longer than this trigger a background rebalance
+REBALANCE_KEY_LENGTH = 24
+
+# Delta sync re-reads changes this far behind its cursor, so writes stamped
+# earlier but committed after a client's last sync are still delivered
+SYNC_LOOKBACK_MS = 10_000
+# Most change digests a sync cursor remembers. When more changes fall in
+# the lookback window, the window is shortened to the oldest one kept
+SYNC_SEEN_LIMIT = 100
+
+# Fields a task record may carry
+TASK_FIELDS = ["id", "project_id", "title", "description", "status", "acceptance_criteria",
+               "assignee_id", "rank", "created_at", "updated_at"]
+
+def task_rank(task: Dict[str, Any]) -> str:
+    """Get a task's order key within its column.
+
+    Tasks created before ranks existed sort by creation time, using the same
+    timestamp-derived keys that new tasks are given.
+    """
+    return task.get("rank") or key_for_integer(int(task.get("created_at", 0)) * 1000)
+
+def change_digest(item_id: str, timestamp: int) -> str:
+    """Get a short digest naming one version of a task or tombstone"""
+    return hashlib.sha1(f"{item_id}:{timestamp}".encode()).hexdigest()[:10]
+
+def encode_sync_cursor(timestamp: int, floor: Tuple[int, str], seen: List[str]) -> str:
+    """Encode a delta-sync cursor.
+
+    The cursor holds the newest millisecond change timestamp a client has
+    seen, the (timestamp, id) of the oldest change the next sync re-reads,
+    and digests of the changes it was sent from there on, so late or
+    repeated writes inside the window are delivered once.
+    """
+    payload = json.dumps({"v": 3, "t": timestamp, "f": list(floor), "seen": sorted(seen)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_sync_cursor(cursor: str) -> Tuple[int, Tuple[int, str], Set[str]]:
+    """Decode a delta-sync cursor into (timestamp, floor, seen digests).
+
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        version = payload.get("v")
+        if version == 3:
+            floor_ts, floor_id = payload["f"]
+            return int(payload["t"]), (int(floor_ts), str(floor_id)), set(payload["seen"])
+        # Cursors from before millisecond stamps hold seconds
+        timestamp = int(payload["t"]) if version == 2 else int(payload["t"]) * 1000
+        seen = set(payload["seen"]) if version == 2 else set()
+        return timestamp, (timestamp - SYNC_LOOKBACK_MS, ""), seen
+    except Exception as e:
+        raise ValueError(f"Invalid sync cursor: {cursor}") from e
+
 class TaskService:
     def __init__(self):
         self.db = db_service.get_client()
+        self.background_tasks = set()
     
     async def create_task(self, task_data: Dict[str, Any], current_user: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new task"""
         try:
+            if task_data.get("project_id") and await self.project_is_deleting(task_data["project_id"]):
+                return {
+                    "success": False,
+                    "error": f"Project {task_data['project_id']} is being deleted"
+                }
+
             # Generate task ID and timestamps
             task_id = str(uuid.uuid4())
             now = int(datetime.now().timestamp())
+            changed_at = change_timestamp()
             
             # Prepare task data
             new_task = {
@@ -27,8 +103,10 @@ class TaskService:
                 "status": "todo",
                 "acceptance_criteria": task_data.get("acceptance_criteria", ""),
                 "assignee_id": task_data.get("assignee_id", current_user["id"]),
+                # Millisecond keys put new tasks at the bottom of the column
+                "rank": key_for_integer(int(datetime.now().timestamp() * 1000)),
                 "created_at": now,
-                "updated_at": now
+                "updated_at": changed_at
             }
             
             # Create task in database
@@ -39,6 +117,11 @@ class TaskService:
                     }
                 }
             ])
+
+            if "error" not in result:
+                task_counters.task_created(new_task)
+                search_index.add_task(new_task)
+                typeahead_index.add_task(new_task)
             
             return {
                 "success": True,
@@ -61,25 +144,153 @@ class TaskService:
                 query["tasks"]["where"] = {"project_id": project_id}
             
             result = await self.db.query(query)
-            return result.get("tasks", [])
+            return task_write_behind.overlay_all(result.get("tasks", []))
             
         except Exception as e:
             logger.error(f"Error getting tasks: {e}")
             return []
     
-    async def get_task(self, task_id: str, current_user: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Get a specific task by ID"""
-        try:
+    async def iter_project_tasks(self, project_id: str, page_size: int = 500) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every task in a project, fetched in id-ordered pages.
+
+        Reads through the outbox can return short pages when they hide
+        deletes not yet replayed, so only an empty page ends the scan.
+        """
+        last_id = None
+        while True:
+            where: Dict[str, Any] = {"project_id": project_id}
+            if last_id:
+                where["id"] = {"$gt": last_id}
+
             result = await self.db.query({
                 "tasks": {
-                    "where": {"id": task_id}
+                    "where": where,
+                    "order": {"id": "asc"},
+                    "limit": page_size
                 }
             })
-            
-            tasks = result.get("tasks", [])
-            if tasks:
-                return tasks[0]
-            return None
+            if "tasks" not in result:
+                raise RuntimeError(f"Failed to fetch tasks for project {project_id}")
+
+            page = task_write_behind.overlay_all(result["tasks"])
+            if not page:
+                return
+            for task in page:
+                yield task
+            last_id = page[-1]["id"]
+
+    async def project_is_deleting(self, project_id: str) -> bool:
+        """Check whether a project is being deleted, raising if the lookup fails.
+
+        The deletion worker pages tasks by id, so a task created meanwhile
+        could be left behind.
+        """
+        result = await self.db.query({
+            "projects": {
+                "where": {"id": project_id}
+            }
+        })
+        if "projects" not in result:
+            raise RuntimeError(f"Failed to look up project {project_id}")
+        return any(project.get("status") == "deleting" for project in result["projects"])
+
+    async def find_existing_task_ids(self, task_ids: List[str]) -> Set[str]:
+        """Get which of the given task ids are already taken, raising if the lookup fails"""
+        if not task_ids:
+            return set()
+        result = await self.db.query({
+            "tasks": {
+                "where": {"id": {"$in": task_ids}}
+            }
+        })
+        if "tasks" not in result:
+            raise RuntimeError("Failed to look up task ids")
+        return {task["id"] for task in result["tasks"]}
+
+    async def import_tasks(self, project_id: str, tasks: List[Dict[str, Any]], preserve_ids: bool = False) -> Dict[str, Any]:
+        """Create a batch of exported tasks in a project with one transact.
+
+        With preserve_ids the batch is refused if any of its ids is already
+        taken, since creating a task with an existing id would overwrite it.
+        """
+        try:
+            if await self.project_is_deleting(project_id):
+                return {
+                    "success": False,
+                    "error": f"Project {project_id} is being deleted"
+                }
+
+            now = int(datetime.now().timestamp())
+            changed_at = change_timestamp()
+            new_tasks = []
+            for task in tasks:
+                new_task = {field: task[field] for field in TASK_FIELDS if task.get(field) is not None}
+                if not preserve_ids or not new_task.get("id"):
+                    new_task["id"] = str(uuid.uuid4())
+                if new_task.get("status") not in ["todo", "in_progress", "done"]:
+                    new_task["status"] = "todo"
+                new_task["project_id"] = project_id
+                new_task.setdefault("description", "")
+                new_task.setdefault("acceptance_criteria", "")
+                new_task.setdefault("created_at", now)
+                # Stamped as new so delta-sync clients past the old stamp still pick it up
+                new_task["updated_at"] = changed_at
+                new_task.setdefault("rank", task_rank(new_task))
+                new_tasks.append(new_task)
+
+            if not new_tasks:
+                return {
+                    "success": True,
+                    "imported": 0
+                }
+
+            if preserve_ids:
+                task_ids = [new_task["id"] for new_task in new_tasks]
+                taken = await self.find_existing_task_ids(task_ids)
+                taken.update(task_id for task_id in task_ids if task_ids.count(task_id) > 1)
+                if taken:
+                    return {
+                        "success": False,
+                        "error": f"Task ids already exist: {', '.join(sorted(taken)[:5])}"
+                    }
+
+            result = await self.db.transact([
+                {
+                    "tasks": {
+                        "create": new_task
+                    }
+                }
+                for new_task in new_tasks
+            ])
+
+            if "error" in result:
+                return {
+                    "success": False,
+                    "error": result["error"]
+                }
+
+            for new_task in new_tasks:
+                task_counters.task_created(new_task)
+                search_index.add_task(new_task)
+                typeahead_index.add_task(new_task)
+
+            return {
+                "success": True,
+                "imported": len(new_tasks)
+            }
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    async def get_task(self, task_id: str, current_user: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Get a specific task by ID"""
+        try:
+            # Batched with other lookups in the same request and memoized
+            task = await load_by_id(self.db, "tasks", task_id)
+            return task_write_behind.overlay(task)
             
         except Exception as e:
             logger.error(f"Error getting task {task_id}: {e}")
@@ -97,9 +308,7 @@ class TaskService:
                 }
             
             # Check if user has permission to update
-            if (current_user["id"] != existing_task.get("assignee_id") and 
-                current_user["id"] != existing_task.get("owner_id") and
-                current_user["role"] != "project_manager"):
+            if not self._can_update(existing_task, current_user):
                 return {
                     "success": False,
                     "error": "Insufficient permissions to update this task"
@@ -107,7 +316,7 @@ class TaskService:
             
             # Prepare update data
             update_fields = {
-                "updated_at": int(datetime.now().timestamp())
+                "updated_at": change_timestamp()
             }
             
             # Only update provided fields
@@ -115,7 +324,115 @@ class TaskService:
                 if field in update_data:
                     update_fields[field] = update_data[field]
             
-            # Update task in database
+            # Update task in database, or coalesce with other recent updates
+            if task_write_behind.enabled:
+                task_write_behind.enqueue(task_id, update_fields)
+                result = {"queued": True}
+            else:
+                result = await self.db.transact([
+                    {
+                        "tasks": {
+                            "update": {
+                                "where": {"id": task_id},
+                                "set": update_fields
+                            }
+                        }
+                    }
+                ])
+
+            invalidate("tasks", task_id)
+            if "error" not in result:
+                updated_task = {**existing_task, **update_fields}
+                task_counters.task_updated(existing_task, updated_task)
+                search_index.add_task(updated_task)
+                typeahead_index.add_task(updated_task)
+            
+            return {
+                "success": True,
+                "updated_fields": update_fields,
+                "result": result
+            }
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    async def move_task(self, task_id: str, move_data: Dict[str, Any], current_user: Dict[str, Any]) -> Dict[str, Any]:
+        """Move a task on the board: change its column, position and assignee at once.
+
+        The task and its new neighbours are read in one query and the change
+        is written in one transact touching only the moved task. Position is
+        given by after_id/before_id, the tasks it should sit between in the
+        target column.
+        """
+        try:
+            after_id = move_data.get("after_id")
+            before_id = move_data.get("before_id")
+
+            ids = [item_id for item_id in [task_id, after_id, before_id] if item_id]
+            result = await self.db.query({
+                "tasks": {
+                    "where": {"id": {"$in": ids}}
+                }
+            })
+            tasks = {task["id"]: task for task in task_write_behind.overlay_all(result.get("tasks", []))}
+
+            existing_task = tasks.get(task_id)
+            if not existing_task:
+                return {
+                    "success": False,
+                    "error": "Task not found"
+                }
+
+            if not self._can_update(existing_task, current_user):
+                return {
+                    "success": False,
+                    "error": "Insufficient permissions to update this task"
+                }
+
+            update_fields = {}
+            target_status = move_data.get("status") or existing_task.get("status", "todo")
+            if target_status != existing_task.get("status"):
+                update_fields["status"] = target_status
+            if "assignee_id" in move_data and move_data["assignee_id"] != existing_task.get("assignee_id"):
+                update_fields["assignee_id"] = move_data["assignee_id"]
+
+            if after_id or before_id:
+                neighbours = []
+                for neighbour_id in [after_id, before_id]:
+                    neighbour = tasks.get(neighbour_id) if neighbour_id else None
+                    if neighbour_id and (not neighbour or neighbour.get("project_id") != existing_task.get("project_id")):
+                        return {
+                            "success": False,
+                            "error": f"Neighbour task {neighbour_id} not found"
+                        }
+                    if neighbour and neighbour.get("status", "todo") != target_status:
+                        return {
+                            "success": False,
+                            "error": f"Stale ordering: neighbour task {neighbour_id} is not in column {target_status}"
+                        }
+                    neighbours.append(task_rank(neighbour) if neighbour else None)
+
+                try:
+                    update_fields["rank"] = generate_key_between(*neighbours)
+                except ValueError:
+                    return {
+                        "success": False,
+                        "error": "Stale ordering: neighbours are out of order, refresh and retry"
+                    }
+
+            if not update_fields:
+                return {
+                    "success": True,
+                    "updated_fields": {}
+                }
+
+            # Fold in coalesced updates so a later flush cannot undo the move
+            coalesced = task_write_behind.take(task_id)
+            update_fields = {**coalesced, **update_fields}
+            update_fields["updated_at"] = change_timestamp()
             result = await self.db.transact([
                 {
                     "tasks": {
@@ -126,19 +443,91 @@ class TaskService:
                     }
                 }
             ])
-            
+
+            invalidate("tasks", task_id)
+            if "error" in result:
+                # The coalesced updates were not written either
+                if coalesced:
+                    task_write_behind.requeue(task_id, coalesced)
+                return {
+                    "success": False,
+                    "error": result["error"]
+                }
+
+            moved_task = {**existing_task, **update_fields}
+            task_counters.task_updated(existing_task, moved_task)
+            search_index.add_task(moved_task)
+            typeahead_index.add_task(moved_task)
+
+            if len(update_fields.get("rank", "")) > REBALANCE_KEY_LENGTH:
+                self._run_in_background(self.rebalance_column(existing_task.get("project_id"), target_status))
+
             return {
                 "success": True,
                 "updated_fields": update_fields,
                 "result": result
             }
-            
+
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e)
             }
-    
+
+    async def rebalance_column(self, project_id: str, status: str):
+        """Rewrite a column's ranks as short, evenly spaced keys.
+
+        Each update only applies while the task still has the rank and
+        updated_at that were read, so tasks moved or edited meanwhile keep
+        their newer position.
+        """
+        try:
+            result = await self.db.query({
+                "tasks": {
+                    "where": {"project_id": project_id, "status": status}
+                }
+            })
+            tasks = sorted(result.get("tasks", []), key=lambda task: (task_rank(task), task["id"]))
+            if not tasks:
+                return
+
+            steps = []
+            for task, rank in zip(tasks, sequential_keys(len(tasks))):
+                if task.get("rank") == rank:
+                    continue
+                where = {"id": task["id"]}
+                for field in ["rank", "updated_at"]:
+                    if field in task:
+                        where[field] = task[field]
+                steps.append({
+                    "tasks": {
+                        "update": {
+                            "where": where,
+                            "set": {"rank": rank, "updated_at": change_timestamp()}
+                        }
+                    }
+                })
+            if steps:
+                await self.db.transact(steps)
+                for step in steps:
+                    invalidate("tasks", step["tasks"]["update"]["where"]["id"])
+                logger.info(f"Rebalanced {len(steps)} ranks in project {project_id} column {status}")
+
+        except Exception as e:
+            logger.error(f"Error rebalancing project {project_id} column {status}: {e}")
+
+    def _run_in_background(self, coroutine):
+        """Run a coroutine without awaiting it, keeping a reference until it finishes"""
+        task = asyncio.create_task(coroutine)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    def _can_update(self, task: Dict[str, Any], current_user: Dict[str, Any]) -> bool:
+        """Check whether a user may edit a task"""
+        return (current_user["id"] == task.get("assignee_id") or
+                current_user["id"] == task.get("owner_id") or
+                current_user["role"] == "project_manager")
+
     async def delete_task(self, task_id: str, current_user: Dict[str, Any]) -> Dict[str, Any]:
         """Delete a task"""
         try:
@@ -158,7 +547,9 @@ class TaskService:
                     "error": "Insufficient permissions to delete this task"
                 }
             
-            # Delete task from database
+            # Delete task and leave a tombstone for delta-sync clients. Queued
+            # updates are taken first so a flush cannot write the task again
+            coalesced = task_write_behind.take(task_id)
             result = await self.db.transact([
                 {
                     "tasks": {
@@ -166,8 +557,31 @@ class TaskService:
                             "where": {"id": task_id}
                         }
                     }
+                },
+                {
+                    "task_tombstones": {
+                        "create": {
+                            "id": task_id,
+                            "project_id": existing_task.get("project_id"),
+                            "deleted_at": change_timestamp()
+                        }
+                    }
                 }
             ])
+
+            invalidate("tasks", task_id)
+            if "error" in result:
+                # The task still exists, so its queued updates still apply
+                if coalesced:
+                    task_write_behind.requeue(task_id, coalesced)
+                return {
+                    "success": False,
+                    "error": result["error"]
+                }
+
+            task_counters.task_deleted(existing_task)
+            search_index.remove_task(task_id)
+            typeahead_index.remove_task(task_id)
             
             return {
                 "success": True,
@@ -199,5 +613,333 @@ class TaskService:
             logger.error(f"Error getting tasks by status {status}: {e}")
             return []
 
+    async def get_tasks_batch(self, statuses: Optional[List[str]] = None,
+                              project_ids: Optional[List[str]] = None,
+                              assignee_ids: Optional[List[str]] = None,
+                              limit: Optional[int] = None) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        """Get tasks matching any of the given statuses, projects and assignees,
+        grouped by project and then by status.
+
+        Every requested project and status gets a group, empty or not, and
+        groups are in column order, cut to limit tasks if given.
+        """
+        try:
+            where: Dict[str, Any] = {}
+            for field, values in (("status", statuses), ("project_id", project_ids), ("assignee_id", assignee_ids)):
+                if values:
+                    where[field] = values[0] if len(values) == 1 else {"$in": values}
+
+            query = {"tasks": {"where": where} if where else {}}
+            result = await self.db.query(query)
+
+            grouped: Dict[str, Dict[str, List[Dict[str, Any]]]] = {project_id: {} for project_id in project_ids or []}
+            for task in result.get("tasks", []):
+                columns = grouped.setdefault(task.get("project_id"), {})
+                columns.setdefault(task.get("status", "todo"), []).append(task)
+
+            for columns in grouped.values():
+                for status in statuses or []:
+                    columns.setdefault(status, [])
+                for status, tasks in columns.items():
+                    tasks.sort(key=lambda task: (task_rank(task), task["id"]))
+                    if limit is not None:
+                        del tasks[limit:]
+            return grouped
+
+        except Exception as e:
+            logger.error(f"Error getting task batch: {e}")
+            return {}
+
+    async def get_task_changes(self, project_id: str, since: Optional[str] = None) -> Dict[str, Any]:
+        """Get tasks changed or deleted in a project since a sync cursor.
+
+        Changes are re-read from SYNC_LOOKBACK_MS before the cursor and
+        filtered against the versions the client was already sent.
+        """
+        try:
+            since_ts, floor, seen = decode_sync_cursor(since) if since else (0, (0, ""), set())
+        except ValueError as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+        try:
+            window_start = max(0, floor[0])
+            query = {
+                "tasks": {
+                    "where": {"project_id": project_id, "updated_at": {"$gte": window_start}}
+                }
+            }
+
+            # Tombstones only matter to clients that already hold a copy
+            if since:
+                query["task_tombstones"] = {
+                    "where": {"project_id": project_id, "deleted_at": {"$gte": window_start}}
+                }
+
+            result = await self.db.query(query)
+            if "tasks" not in result:
+                raise RuntimeError(f"Failed to fetch task changes for project {project_id}")
+
+            tasks = [task for task in result["tasks"] if (task.get("updated_at", 0), task["id"]) >= floor]
+            tombstones = [
+                tombstone for tombstone in result.get("task_tombstones", [])
+                if (tombstone.get("deleted_at", 0), tombstone["id"]) >= floor
+            ]
+            changes = sorted(
+                [(task.get("updated_at", 0), task["id"]) for task in tasks] +
+                [(tombstone.get("deleted_at", 0), tombstone["id"]) for tombstone in tombstones]
+            )
+
+            new_tasks = [
+                task for task in tasks
+                if change_digest(task["id"], task.get("updated_at", 0)) not in seen
+            ]
+            deleted = [
+                {"id": tombstone["id"], "deleted_at": tombstone.get("deleted_at", 0)}
+                for tombstone in tombstones
+                if change_digest(tombstone["id"], tombstone.get("deleted_at", 0)) not in seen
+            ]
+
+            # Advance the cursor to the newest change and remember the newest
+            # changes still inside the next lookback window. The window never
+            # reaches back past changes already forgotten
+            next_ts = max([since_ts] + [timestamp for timestamp, _ in changes])
+            next_floor = max(floor, (next_ts - SYNC_LOOKBACK_MS, ""))
+            window = [change for change in changes if change >= next_floor]
+            if len(window) > SYNC_SEEN_LIMIT:
+                window = window[-SYNC_SEEN_LIMIT:]
+                next_floor = window[0]
+            next_seen = [change_digest(item_id, timestamp) for timestamp, item_id in window]
+
+            return {
+                "success": True,
+                "tasks": new_tasks,
+                "deleted": deleted,
+                "cursor": encode_sync_cursor(next_ts, next_floor, next_seen)
+            }
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    async def search_tasks(self, query: str, project_id: Optional[str] = None,
+                           limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """Full-text search over task titles, descriptions and acceptance criteria"""
+        try:
+            # Load the search scope into the index on first use
+            loaded = search_index.is_loaded(project_id)
+            performance_monitor.record_cache("search_index", loaded)
+            if not loaded:
+                await self.load_search_index(project_id)
+
+            total, hits = search_index.search(query, project_id, limit, offset)
+
+            return {
+                "success": True,
+                "hits": hits,
+                "total": total
+            }
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    async def load_search_index(self, project_id: Optional[str] = None) -> bool:
+        """(Re)load a project's tasks, or every task, into the search index.
+
+        The new index is built in a thread, so large reloads do not stall
+        the event loop, and writes made meanwhile are applied on top of it.
+        """
+        changes = search_index.start_recording()
+        try:
+            if project_id:
+                result = await self.db.query({
+                    "tasks": {
+                        "where": {"project_id": project_id}
+                    }
+                })
+            else:
+                result = await self.db.query({"tasks": {}})
+
+            # A failed query returns no collection; keep the old index
+            if "tasks" not in result:
+                return False
+
+            built = await asyncio.to_thread(TaskSearchIndex.build, result["tasks"])
+            search_index.swap_in(built, project_id, changes)
+            return True
+        finally:
+            search_index.stop_recording(changes)
+
+    async def suggest_tasks(self, project_id: str, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Suggest tasks in a project by title prefix"""
+        try:
+            loaded = project_id in typeahead_index.loaded_projects
+            performance_monitor.record_cache("typeahead", loaded)
+            if not loaded:
+                await self.load_typeahead_project(project_id)
+
+            return typeahead_index.suggest_tasks(project_id, prefix, limit)
+
+        except Exception as e:
+            logger.error(f"Error suggesting tasks for project {project_id}: {e}")
+            return []
+
+    async def load_typeahead_project(self, project_id: str) -> bool:
+        """(Re)load a project's task titles into the typeahead index"""
+        result = await self.db.query({
+            "tasks": {
+                "where": {"project_id": project_id}
+            }
+        })
+        # A failed query returns no collection; keep the old titles
+        if "tasks" not in result:
+            return False
+        typeahead_index.load_project(project_id, result["tasks"])
+        return True
+
+    async def reconcile_counters(self, project_id: str) -> bool:
+        """Recount a project's tasks from the database"""
+        result = await self.db.query({
+            "tasks": {
+                "where": {"project_id": project_id}
+            }
+        })
+
+        # A failed query returns no collection; keep the old counts
+        if "tasks" not in result:
+            logger.warning(f"Could not reconcile task counters for project {project_id}")
+            return False
+
+        task_counters.reconcile(project_id, result["tasks"])
+        return True
+
+    async def get_task_counts(self, project_ids: List[str]) -> Dict[str, int]:
+        """Get task counts for many projects, seeding unknown ones in one query"""
+        missing = [project_id for project_id in project_ids if task_counters.get_total(project_id) is None]
+        for project_id in project_ids:
+            performance_monitor.record_cache("task_counters", project_id not in missing)
+
+        if missing:
+            result = await self.db.query({
+                "tasks": {
+                    "where": {"project_id": {"$in": missing}}
+                }
+            })
+
+            if "tasks" in result:
+                grouped: Dict[str, List[Dict[str, Any]]] = {project_id: [] for project_id in missing}
+                for task in result["tasks"]:
+                    if task.get("project_id") in grouped:
+                        grouped[task["project_id"]].append(task)
+                for project_id, tasks in grouped.items():
+                    task_counters.reconcile(project_id, tasks)
+            else:
+                logger.warning(f"Could not load task counts for {len(missing)} projects")
+
+        return {project_id: task_counters.get_total(project_id) or 0 for project_id in project_ids}
+
+    async def get_project_summary(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Get task counts by status and assignee for a project"""
+        summary = task_counters.get_summary(project_id)
+        if summary is None and await self.reconcile_counters(project_id):
+            summary = task_counters.get_summary(project_id)
+        return summary
+
+    async def get_project_board(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Get a project with its tasks by column and their assignees in one query.
+
+        Returns None if the project does not exist or is being deleted.
+        """
+        result = await self.db.query({
+            "projects": {
+                "where": {"id": project_id},
+                "tasks": {
+                    "assignee": {}
+                }
+            }
+        })
+
+        if "projects" not in result:
+            raise RuntimeError("Failed to query project board")
+
+        projects = result["projects"]
+        if not projects or projects[0].get("status") == "deleting":
+            return None
+
+        project = dict(projects[0])
+        tasks = task_write_behind.overlay_all(project.pop("tasks", []))
+
+        columns: Dict[str, List[Dict[str, Any]]] = {task_status: [] for task_status in TASK_STATUSES}
+        users: Dict[str, Dict[str, Any]] = {}
+        for task in tasks:
+            task = dict(task)
+            for user in task.pop("assignee", []):
+                users[user["id"]] = {field: user.get(field) for field in ("id", "email", "name", "role")}
+            columns.setdefault(task.get("status", "todo"), []).append(task)
+
+        for column in columns.values():
+            column.sort(key=lambda task: (task_rank(task), task["id"]))
+
+        # The board holds every task, so it doubles as a counter reconciliation
+        if task_counters.needs_reconcile(project_id):
+            task_counters.reconcile(project_id, tasks)
+        project["task_count"] = len(tasks)
+
+        return {
+            "project": project,
+            "columns": columns,
+            "users": users
+        }
+
+    async def run_counter_reconciliation(self):
+        """Periodically reconcile seeded project counters against the database"""
+        while True:
+            await asyncio.sleep(task_counters.reconcile_interval)
+            for project_id in task_counters.stale_projects():
+                try:
+                    await self.reconcile_counters(project_id)
+                except Exception as e:
+                    logger.error(f"Error reconciling task counters for project {project_id}: {e}")
+
+    async def run_search_refresh(self):
+        """Periodically reload loaded search scopes from the database"""
+        while True:
+            await asyncio.sleep(search_index.refresh_interval)
+            try:
+                if search_index.needs_full_refresh():
+                    if not await self.load_search_index():
+                        logger.warning("Could not refresh the search index")
+            except Exception as e:
+                logger.error(f"Error refreshing the search index: {e}")
+            for project_id in search_index.stale_projects():
+                try:
+                    if not await self.load_search_index(project_id):
+                        logger.warning(f"Could not refresh the search index for project {project_id}")
+                except Exception as e:
+                    logger.error(f"Error refreshing the search index for project {project_id}: {e}")
+
+    async def run_typeahead_refresh(self):
+        """Periodically reload loaded task titles and the user directory"""
+        while True:
+            await asyncio.sleep(typeahead_index.refresh_interval)
+            for project_id in typeahead_index.stale_projects():
+                try:
+                    if not await self.load_typeahead_project(project_id):
+                        logger.warning(f"Could not refresh typeahead titles for project {project_id}")
+                except Exception as e:
+                    logger.error(f"Error refreshing typeahead titles for project {project_id}: {e}")
+            try:
+                if typeahead_index.users_stale() and not await auth_service.load_user_directory():
+                    logger.warning("Could not refresh the typeahead user directory")
+            except Exception as e:
+                logger.error(f"Error refreshing the typeahead user directory: {e}")
+
 # Global task service instance
 task_service = TaskService()
\ No newline at end of file
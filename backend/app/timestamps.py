@@ -0,0 +1,16 @@
+import threading
+import time
+
+_lock = threading.Lock()
+_last_change = 0
+
+def change_timestamp() -> int:
+    """Get a millisecond timestamp for updated_at and deleted_at.
+
+    Strictly increasing within the process, so two changes to the same
+    record never share a stamp and delta sync can tell them apart.
+    """
+    global _last_change
+    with _lock:
+        _last_change = max(int(time.time() * 1000), _last_change + 1)
+        return _last_change
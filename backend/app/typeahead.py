@@ -0,0 +1,192 @@
+import bisect
+import time
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+# Sorts after every character a key can contain
+KEY_SENTINEL = "\U0010ffff"
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase and collapse whitespace for prefix matching"""
+    return " ".join((text or "").lower().split())
+
+def word_suffixes(text: Optional[str]) -> List[str]:
+    """Keys for every word start, so "fix login bug" matches "login" and "bug" too"""
+    words = normalize(text).split(" ")
+    return [" ".join(words[i:]) for i in range(len(words)) if words[i]]
+
+def task_entry(task: Dict[str, Any]) -> Tuple[str, List[str], Dict[str, Any]]:
+    """Get a task's id, prefix keys and suggestion"""
+    return (
+        task["id"],
+        word_suffixes(task.get("title")),
+        {"id": task["id"], "title": task.get("title") or "", "status": task.get("status") or "todo"}
+    )
+
+def user_entry(user: Dict[str, Any]) -> Tuple[str, List[str], Dict[str, Any]]:
+    """Get a user's id, prefix keys and suggestion"""
+    return (
+        user["id"],
+        [normalize(user.get("email"))] + word_suffixes(user.get("name")),
+        {"id": user["id"], "email": user.get("email") or "", "name": user.get("name") or ""}
+    )
+
+class PrefixIndex:
+    """Sorted array of (key, item id) pairs searched with bisect.
+
+    Lookups are two binary searches plus a scan of at most the matches
+    returned. Inserts and removals shift the array, which stays cheap for
+    the tens of thousands of keys a project or user directory holds.
+    """
+
+    def __init__(self):
+        self.entries: List[Tuple[str, str]] = []
+        self.keys_by_item: Dict[str, List[str]] = {}
+        self.items: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, item_id: str, keys: Iterable[str], item: Dict[str, Any]):
+        """Index an item under the given keys, replacing any previous version"""
+        self.remove(item_id)
+        unique_keys = sorted({key for key in keys if key})
+        for key in unique_keys:
+            bisect.insort(self.entries, (key, item_id))
+        self.keys_by_item[item_id] = unique_keys
+        self.items[item_id] = item
+
+    def load(self, entries: Iterable[Tuple[str, Iterable[str], Dict[str, Any]]]):
+        """Replace the index contents with (item id, keys, item) triples.
+
+        Keys are sorted once instead of inserted one at a time, which would
+        shift the array for every key of a bulk load.
+        """
+        keys_by_item: Dict[str, List[str]] = {}
+        items: Dict[str, Dict[str, Any]] = {}
+        for item_id, keys, item in entries:
+            keys_by_item[item_id] = sorted({key for key in keys if key})
+            items[item_id] = item
+        self.entries = sorted((key, item_id) for item_id, keys in keys_by_item.items() for key in keys)
+        self.keys_by_item = keys_by_item
+        self.items = items
+
+    def remove(self, item_id: str):
+        """Remove an item from the index"""
+        for key in self.keys_by_item.pop(item_id, []):
+            position = bisect.bisect_left(self.entries, (key, item_id))
+            if position < len(self.entries) and self.entries[position] == (key, item_id):
+                del self.entries[position]
+        self.items.pop(item_id, None)
+
+    def search(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get up to limit items with a key starting with prefix"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        start = bisect.bisect_left(self.entries, (prefix, ""))
+        end = bisect.bisect_left(self.entries, (prefix + KEY_SENTINEL, ""), lo=start)
+
+        results = []
+        seen: Set[str] = set()
+        for _, item_id in self.entries[start:end]:
+            if item_id not in seen:
+                seen.add(item_id)
+                results.append(self.items[item_id])
+                if len(results) >= limit:
+                    break
+        return results
+
+class TypeaheadIndex:
+    """Prefix indexes over task titles per project and over users.
+
+    Fed by TaskService and AuthService writes; a project's titles and the
+    user directory are loaded from the database on first lookup and
+    periodically reloaded to pick up writes made outside this process.
+    """
+
+    def __init__(self, refresh_interval: int = 300):
+        self.refresh_interval = refresh_interval
+        self.task_titles: Dict[str, PrefixIndex] = {}
+        self.task_projects: Dict[str, str] = {}
+        self.loaded_projects: Set[str] = set()
+        self.loaded_at: Dict[str, float] = {}
+        self.users = PrefixIndex()
+        self.users_loaded = False
+        self.users_loaded_at = 0.0
+
+    def add_task(self, task: Dict[str, Any]):
+        """Index a task title under its project"""
+        previous_project = self.task_projects.get(task["id"])
+        if previous_project and previous_project != task.get("project_id"):
+            self.remove_task(task["id"])
+
+        project_id = task.get("project_id")
+        self.task_projects[task["id"]] = project_id
+        self.task_titles.setdefault(project_id, PrefixIndex()).add(*task_entry(task))
+
+    def remove_task(self, task_id: str):
+        """Remove a task title"""
+        project_id = self.task_projects.pop(task_id, None)
+        titles = self.task_titles.get(project_id)
+        if titles:
+            titles.remove(task_id)
+
+    def load_project(self, project_id: str, tasks: List[Dict[str, Any]]):
+        """Replace a project's indexed titles with its full task list"""
+        self.drop_project(project_id)
+        for task in tasks:
+            # A task moved here from another project leaves that one
+            previous_project = self.task_projects.get(task["id"])
+            if previous_project and previous_project != project_id:
+                self.remove_task(task["id"])
+            self.task_projects[task["id"]] = project_id
+
+        titles = PrefixIndex()
+        titles.load(task_entry(task) for task in tasks)
+        self.task_titles[project_id] = titles
+        self.loaded_projects.add(project_id)
+        self.loaded_at[project_id] = time.time()
+
+    def drop_project(self, project_id: str):
+        """Forget every task title of a project"""
+        titles = self.task_titles.pop(project_id, None)
+        if titles:
+            for task_id in titles.items:
+                self.task_projects.pop(task_id, None)
+        self.loaded_projects.discard(project_id)
+        self.loaded_at.pop(project_id, None)
+
+    def stale_projects(self) -> List[str]:
+        """List loaded projects due for a reload"""
+        now = time.time()
+        return [project_id for project_id, loaded_at in list(self.loaded_at.items())
+                if now - loaded_at >= self.refresh_interval]
+
+    def suggest_tasks(self, project_id: str, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get tasks in a project whose title has a word starting with prefix"""
+        titles = self.task_titles.get(project_id)
+        return titles.search(prefix, limit) if titles else []
+
+    def add_user(self, user: Dict[str, Any]):
+        """Index a user by email and name"""
+        self.users.add(*user_entry(user))
+
+    def load_users(self, users: List[Dict[str, Any]]):
+        """Replace the user directory with every user in the database"""
+        directory = PrefixIndex()
+        directory.load(user_entry(user) for user in users)
+        self.users = directory
+        self.users_loaded = True
+        self.users_loaded_at = time.time()
+
+    def users_stale(self) -> bool:
+        """Check whether the loaded user directory is due for a reload"""
+        return self.users_loaded and time.time() - self.users_loaded_at >= self.refresh_interval
+
+    def suggest_users(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get users whose email or a word of their name starts with prefix"""
+        return self.users.search(prefix, limit)
+
+# Global typeahead index
+typeahead_index = TypeaheadIndex()
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Any, List, Optional
+
+from app.database import db_service
+from app.timestamps import change_timestamp
+
+logger = logging.getLogger(__name__)
+
+class TaskWriteBehind:
+    """Coalesces bursts of updates to the same task into one transact.
+
+    Updates are merged per task id and flushed when the window opened by
+    the task's first pending update closes. Reads overlay pending fields so
+    callers see their own writes. updated_at is stamped again when the patch
+    is written, so delta-sync clients that synced while it was pending still
+    pick it up. Disabled unless a window is configured, since pending
+    updates are lost if the process dies before flushing.
+    """
+
+    def __init__(self, window_ms: int, max_attempts: int = 3):
+        self.db = db_service.get_client()
+        self.window = window_ms / 1000
+        self.max_attempts = max_attempts
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.attempts: Dict[str, int] = {}
+        self.flushers: Dict[str, asyncio.Task] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def enqueue(self, task_id: str, fields: Dict[str, Any]):
+        """Merge fields into the task's pending patch and schedule a flush"""
+        self.pending.setdefault(task_id, {}).update(fields)
+        if task_id not in self.flushers:
+            self.flushers[task_id] = asyncio.create_task(self._flush_later(task_id))
+
+    def overlay(self, task: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Apply a task's pending fields to a copy read from the database"""
+        if not task or task.get("id") not in self.pending:
+            return task
+        return {**task, **self.pending[task["id"]]}
+
+    def overlay_all(self, tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Apply pending fields to every task in a list"""
+        if not self.pending:
+            return tasks
+        return [self.overlay(task) for task in tasks]
+
+    def requeue(self, task_id: str, fields: Dict[str, Any]):
+        """Put back a patch whose write failed, under any fields queued since"""
+        self.pending[task_id] = {**fields, **self.pending.get(task_id, {})}
+        if task_id not in self.flushers:
+            self.flushers[task_id] = asyncio.create_task(self._flush_later(task_id))
+
+    def take(self, task_id: str) -> Dict[str, Any]:
+        """Remove and return a task's pending patch so a direct write can include it"""
+        flusher = self.flushers.pop(task_id, None)
+        if flusher and flusher is not asyncio.current_task():
+            flusher.cancel()
+        self.attempts.pop(task_id, None)
+        return self.pending.pop(task_id, {})
+
+    async def flush(self, task_id: str) -> bool:
+        """Write a task's merged patch now"""
+        attempts = self.attempts.get(task_id, 0) + 1
+        fields = self.take(task_id)
+        if not fields:
+            return True
+
+        fields["updated_at"] = change_timestamp()
+        result = await self.db.transact([
+            {
+                "tasks": {
+                    "update": {
+                        "where": {"id": task_id},
+                        "set": fields
+                    }
+                }
+            }
+        ])
+
+        if "error" not in result:
+            return True
+
+        # Keep newer pending fields on top of the failed patch and retry
+        if attempts >= self.max_attempts:
+            logger.error(f"Dropping pending update for task {task_id} after {attempts} attempts: {result['error']}")
+            return False
+
+        logger.warning(f"Retrying pending update for task {task_id}: {result['error']}")
+        self.requeue(task_id, fields)
+        self.attempts[task_id] = attempts
+        return False
+
+    async def flush_all(self):
+        """Write every pending patch, e.g. on shutdown"""
+        for task_id in list(self.pending):
+            await self.flush(task_id)
+
+    async def _flush_later(self, task_id: str):
+        await asyncio.sleep(self.window)
+        try:
+            await self.flush(task_id)
+        except Exception as e:
+            logger.error(f"Error flushing pending update for task {task_id}: {e}")
+
+# Global write-behind queue; set TASK_WRITE_BEHIND_MS to enable
+task_write_behind = TaskWriteBehind(int(os.getenv("TASK_WRITE_BEHIND_MS", "0")))
@@ -0,0 +1,81 @@
+"""
+Compare binary project snapshots with the NDJSON export path.
+
+Generates a synthetic project and reports encoded size and encode/decode
+throughput for both formats.
+
+Usage (from backend/):
+    python -m benchmarks.snapshot_benchmark [task_count]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+# The app modules need an app id to import; no requests are made
+os.environ.setdefault("INSTANTDB_APP_ID", "benchmark")
+
+from app.fractional_index import key_for_integer
+from app.snapshot import decode_snapshot, encode_snapshot
+
+WORDS = ("login page api endpoint dashboard fix bug add update remove user task "
+         "project board column status test deploy cache query index form validate").split()
+
+def make_project(task_count: int):
+    project = {"id": str(uuid.uuid4()), "name": "Benchmark", "description": "Synthetic project",
+               "owner_id": str(uuid.uuid4()), "created_at": 1700000000}
+    users = [{"id": str(uuid.uuid4()), "email": f"user{i}@example.com", "name": f"User {i}",
+              "role": "developer", "created_at": 1700000000 + i} for i in range(20)]
+
+    tasks = []
+    now = 1700000000
+    for _ in range(task_count):
+        now += random.randint(0, 120)
+        tasks.append({
+            "id": str(uuid.uuid4()),
+            "project_id": project["id"],
+            "title": " ".join(random.choices(WORDS, k=5)).capitalize(),
+            "description": " ".join(random.choices(WORDS, k=40)),
+            "status": random.choice(["todo", "in_progress", "done"]),
+            "acceptance_criteria": " ".join(random.choices(WORDS, k=15)),
+            "assignee_id": random.choice(users)["id"],
+            "rank": key_for_integer(now * 1000),
+            "created_at": now,
+            "updated_at": now + random.randint(0, 86400),
+        })
+    return project, tasks, users
+
+def timed(fn, repeat: int = 3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def main():
+    task_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    project, tasks, users = make_project(task_count)
+
+    ndjson, json_encode = timed(lambda: "".join(json.dumps(task, separators=(",", ":")) + "\n" for task in tasks).encode())
+    _, json_decode = timed(lambda: [json.loads(line) for line in ndjson.splitlines()])
+
+    snapshot, snapshot_encode = timed(lambda: encode_snapshot(project, tasks, users))
+    _, snapshot_decode = timed(lambda: decode_snapshot(snapshot))
+
+    print(f"{task_count} tasks")
+    print(f"{'format':<10}{'size (KB)':>12}{'encode (ms)':>14}{'decode (ms)':>14}{'encode MB/s':>14}")
+    raw_mb = len(ndjson) / 1e6
+    for name, size, encode, decode in [
+        ("ndjson", len(ndjson), json_encode, json_decode),
+        ("snapshot", len(snapshot), snapshot_encode, snapshot_decode),
+    ]:
+        print(f"{name:<10}{size / 1024:>12.1f}{encode * 1000:>14.1f}{decode * 1000:>14.1f}{raw_mb / encode:>14.1f}")
+    print(f"snapshot is {len(ndjson) / len(snapshot):.1f}x smaller")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends, HTTPException, Query, status
+from fastapi.responses import Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import os
+from typing import Optional
 import logging
 from dotenv import load_dotenv
 
@@ -10,8 +13,18 @@ load_dotenv()
 
 from app.database import db_service
 from app.routers import auth, tasks, ai, projects
-from app.performance import performance_monitor, PerformanceMiddleware
+from app.tasks import task_service
+from app.write_behind import task_write_behind
+from app.project_jobs import project_deletion_worker
+from app.performance import PerformanceMiddleware
+from app import openmetrics
+from app.shared_metrics import init_shared_metrics, aggregated_monitor, get_workers, reset_all_metrics
+from app.loop_monitor import event_loop_monitor
+from app.profiler import sampling_profiler, ProfilerBusy
+from app.allocations import allocation_tracker, AllocationTrackingMiddleware, init_allocation_tracking
+from app.auth import require_role
 from app.rate_limiter import RateLimitMiddleware, ai_rate_limiter, extract_user_key
+from app.dataloader import DataLoaderMiddleware
 
 # Configure logging
 logging.basicConfig(
@@ -26,9 +39,39 @@ async def lifespan(app: FastAPI):
     logger.info("Task Board API starting up...")
     # Initialize database schema
     await db_service.init_schema()
+    # Keep write-maintained task counters in line with the database
+    reconciler = asyncio.create_task(task_service.run_counter_reconciliation())
+    # Pick up task writes made by other processes in the search index
+    search_refresher = asyncio.create_task(task_service.run_search_refresh())
+    # ...and in typeahead titles and the user directory
+    typeahead_refresher = asyncio.create_task(task_service.run_typeahead_refresh())
+    # Finish project deletions, including ones interrupted by a restart
+    deleter = asyncio.create_task(project_deletion_worker.run())
+    # Replay writes accepted by the local outbox, if enabled
+    outbox = db_service.get_client()
+    replayer = asyncio.create_task(outbox.run()) if outbox is not db_service else None
+    # Share performance metrics with the other workers, if enabled
+    shared_metrics = init_shared_metrics(len(app.routes))
+    publisher = asyncio.create_task(shared_metrics.run()) if shared_metrics else None
+    # Watch for code blocking the event loop
+    lag_monitor = asyncio.create_task(event_loop_monitor.run())
+    # Account allocations per route, if enabled
+    if init_allocation_tracking():
+        logger.info("Allocation tracking enabled")
     yield
     # Shutdown
     logger.info("Task Board API shutting down...")
+    reconciler.cancel()
+    search_refresher.cancel()
+    typeahead_refresher.cancel()
+    deleter.cancel()
+    lag_monitor.cancel()
+    await task_write_behind.flush_all()
+    if replayer:
+        replayer.cancel()
+    if publisher:
+        publisher.cancel()
+        shared_metrics.close()
 
 app = FastAPI(
     title="Task Board API",
@@ -46,8 +89,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add performance monitoring middleware
-app.add_middleware(PerformanceMiddleware)
+# Charge allocations to routes while tracemalloc tracing is on
+app.add_middleware(AllocationTrackingMiddleware, tracker=allocation_tracker)
 
 # Add rate limiting middleware for AI endpoints
 app.add_middleware(
@@ -56,6 +99,13 @@ app.add_middleware(
     key_extractor=extract_user_key
 )
 
+# Add performance monitoring middleware outside the others, so requests
+# they reject (e.g. 429s) are recorded too
+app.add_middleware(PerformanceMiddleware)
+
+# Batch and memoize id lookups within each request
+app.add_middleware(DataLoaderMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(tasks.router)
@@ -68,17 +118,104 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "service": "task-board-api"}
+    health = {"status": "healthy", "service": "task-board-api"}
+    if db_service.outbox:
+        health["outbox"] = db_service.outbox.status()
+    return health
 
 @app.get("/api/performance/stats")
 async def get_performance_stats():
-    """Get performance statistics and metrics"""
-    return performance_monitor.get_stats()
+    """Get performance statistics and metrics, across all workers when shared"""
+    stats = aggregated_monitor().get_stats()
+    workers = get_workers()
+    if workers is not None:
+        stats["workers"] = workers
+    # Lag is measured per worker
+    stats["event_loop"] = event_loop_monitor.get_stats()
+    return stats
+
+@app.get("/api/performance/slow-requests")
+async def get_slow_requests(
+    endpoint: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Get recent slow requests with their DB, AI and auth call breakdown, newest first"""
+    return {"slow_requests": aggregated_monitor().get_slow_requests(endpoint, limit)}
+
+@app.get("/api/performance/event-loop")
+async def get_event_loop_stats(current_user = Depends(require_role("project_manager"))):
+    """Get event loop lag and the call sites that blocked the loop, with stacks (admin only)"""
+    return {**event_loop_monitor.get_stats(), **event_loop_monitor.get_blocking_report()}
+
+@app.get("/api/performance/profile")
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=60),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    format: str = Query("collapsed", pattern="^(collapsed|speedscope)$"),
+    idle: bool = False,
+    current_user = Depends(require_role("project_manager"))
+):
+    """Sample this worker's threads for a few seconds and return a flamegraph profile (admin only)"""
+    try:
+        profile = await sampling_profiler.profile(seconds, interval_ms / 1000, include_idle=idle)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+    if format == "speedscope":
+        return profile.speedscope()
+    return PlainTextResponse(profile.collapsed())
+
+@app.get("/api/performance/memory")
+async def get_memory_stats(current_user = Depends(require_role("project_manager"))):
+    """Get allocations per route and the snapshots kept for comparison (admin only)"""
+    return allocation_tracker.get_stats()
+
+@app.post("/api/performance/memory/start")
+async def start_memory_tracking(
+    frames: int = Query(1, ge=1, le=25),
+    current_user = Depends(require_role("project_manager"))
+):
+    """Start tracing allocations in this worker (admin only)"""
+    allocation_tracker.start(frames)
+    return {"message": "Allocation tracking started", "traceback_frames": frames}
+
+@app.post("/api/performance/memory/stop")
+async def stop_memory_tracking(current_user = Depends(require_role("project_manager"))):
+    """Stop tracing allocations in this worker (admin only)"""
+    allocation_tracker.stop()
+    return {"message": "Allocation tracking stopped"}
+
+@app.post("/api/performance/memory/snapshots")
+async def take_memory_snapshot(current_user = Depends(require_role("project_manager"))):
+    """Take an allocation snapshot to compare against later (admin only)"""
+    if not allocation_tracker.enabled:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Allocation tracking is not enabled")
+    return await asyncio.to_thread(allocation_tracker.take_snapshot)
+
+@app.get("/api/performance/memory/diff")
+async def diff_memory_snapshots(
+    start: int,
+    end: Optional[int] = None,
+    top: int = Query(20, ge=1, le=200),
+    current_user = Depends(require_role("project_manager"))
+):
+    """Get the allocation sites that grew most since snapshot `start`, or between `start` and `end` (admin only)"""
+    diff = await asyncio.to_thread(allocation_tracker.compare, start, end, top)
+    if diff is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Snapshot not found")
+    return diff
+
+@app.get("/metrics")
+async def get_metrics():
+    """Expose performance metrics in OpenMetrics text format"""
+    return Response(openmetrics.render(aggregated_monitor(), event_loop_monitor.lag), media_type=openmetrics.CONTENT_TYPE)
 
 @app.post("/api/performance/reset")
 async def reset_performance_stats():
     """Reset performance metrics (for testing/admin)"""
-    performance_monitor.reset_metrics()
+    reset_all_metrics()
+    event_loop_monitor.reset()
+    allocation_tracker.reset()
     return {"message": "Performance metrics reset"}
 
 if __name__ == "__main__":
@@ -4,8 +4,74 @@ Tests business logic and database interactions.
 """
 
 import pytest
+import asyncio
+import base64
+import json
+import os
+import threading
+import time
 from datetime import datetime
 import uuid
+from app.task_counters import TaskCounterStore
+from app.search_index import TaskSearchIndex, tokenize
+from app.typeahead import TypeaheadIndex
+from app.fractional_index import generate_key_between, key_for_integer, sequential_keys
+from app.outbox import InstantDBOutbox, matches_where
+from app.write_behind import TaskWriteBehind
+from app.project_jobs import ProjectDeletionWorker
+from app.dataloader import DataLoader
+from app.performance import PerformanceMonitor, LatencyHistogram, SLOW_REQUEST_RING_SIZE, UNMATCHED_ROUTE, route_key, RequestTiming, RollingWindow, _active_requests, parse_slow_thresholds
+from app import openmetrics
+from app.shared_metrics import SLOT_HEADER, SharedMetrics, slot_size_for
+from app.loop_monitor import EventLoopMonitor, APP_ROOT
+from app.profiler import SamplingProfiler
+from app.allocations import AllocationTracker
+from app.database import db_service
+from app.tasks import SYNC_LOOKBACK_MS, TaskService, task_service, decode_sync_cursor
+from app.timestamps import change_timestamp
+from app.snapshot import HEADER, MAGIC, SnapshotConflict, SnapshotError, decode_snapshot, encode_snapshot, restore_project_snapshot
+
+
+class MemoryDB:
+    """In-memory stand-in for InstantDB supporting where, order and limit."""
+
+    def __init__(self, **collections):
+        self.records = {name: [dict(record) for record in records] for name, records in collections.items()}
+        self.queries = []
+        self.transactions = []
+        self.failures = 0
+
+    async def query(self, query_data):
+        self.queries.append(query_data)
+        result = {}
+        for collection, spec in query_data.items():
+            records = [dict(record) for record in self.records.get(collection, [])
+                       if matches_where(record, spec.get("where"))]
+            for field, direction in (spec.get("order") or {}).items():
+                records.sort(key=lambda record: record.get(field), reverse=direction == "desc")
+            result[collection] = records[:spec["limit"]] if "limit" in spec else records
+        return result
+
+    async def transact(self, transaction_data):
+        if self.failures:
+            self.failures -= 1
+            return {"error": "unavailable"}
+        self.transactions.append(transaction_data)
+        for step in transaction_data:
+            for collection, operation in step.items():
+                records = self.records.setdefault(collection, [])
+                if "create" in operation:
+                    created = dict(operation["create"])
+                    records[:] = [record for record in records if record.get("id") != created.get("id")]
+                    records.append(created)
+                if "update" in operation:
+                    update = operation["update"]
+                    for record in records:
+                        if matches_where(record, update["where"]):
+                            record.update(update.get("set") or update.get("data") or {})
+                if "delete" in operation:
+                    records[:] = [record for record in records if not matches_where(record, operation["delete"]["where"])]
+        return {}
 
 
 class TestProjectService:
@@ -256,6 +322,1369 @@ class TestTaskService:
         other_tasks = [t for t in tasks if t["project_id"] == other_project_id]
         assert len(other_tasks) == 1
 
+    def test_iter_project_tasks_reads_past_short_pages(self):
+        """Test that a page shortened by hidden deletes does not end the export."""
+        class HidingDB(MemoryDB):
+            async def query(self, query_data):
+                result = await super().query(query_data)
+                result["tasks"] = [task for task in result["tasks"] if task["id"] != "t1"]
+                return result
+
+        service = TaskService()
+        service.db = HidingDB(tasks=[{"id": f"t{i}", "project_id": "p1"} for i in range(5)])
+
+        async def collect():
+            return [task["id"] async for task in service.iter_project_tasks("p1", page_size=2)]
+
+        assert asyncio.run(collect()) == ["t0", "t2", "t3", "t4"]
+
+    @staticmethod
+    def board_service():
+        """A task service over one project with three todo tasks and one done task."""
+        service = TaskService()
+        service.db = MemoryDB(tasks=[
+            {"id": "a", "project_id": "p1", "status": "todo", "rank": "a0", "assignee_id": "u1"},
+            {"id": "b", "project_id": "p1", "status": "todo", "rank": "a1", "assignee_id": "u1"},
+            {"id": "c", "project_id": "p1", "status": "todo", "rank": "a2", "assignee_id": "u1"},
+            {"id": "d", "project_id": "p1", "status": "done", "rank": "a0", "assignee_id": "u1"},
+        ])
+        return service
+
+    def test_move_between_neighbours(self):
+        """Test that a move writes one rank between its neighbours and touches only the moved task."""
+        service = self.board_service()
+
+        result = asyncio.run(service.move_task("c", {"after_id": "a", "before_id": "b"}, {"id": "u1", "role": "developer"}))
+
+        assert result["success"]
+        assert "a0" < result["updated_fields"]["rank"] < "a1"
+        step, = service.db.transactions[0]
+        assert step["tasks"]["update"]["where"] == {"id": "c"}
+
+    def test_move_across_columns(self):
+        """Test that moving to another column changes status and ranks against that column."""
+        service = self.board_service()
+
+        result = asyncio.run(service.move_task("a", {"status": "done", "after_id": "d"}, {"id": "u1", "role": "developer"}))
+
+        assert result["success"]
+        task = next(task for task in service.db.records["tasks"] if task["id"] == "a")
+        assert task["status"] == "done" and task["rank"] > "a0"
+
+    def test_move_refuses_stale_ordering(self):
+        """Test that neighbours from another column or out of order are refused without writing."""
+        service = self.board_service()
+        user = {"id": "u1", "role": "developer"}
+
+        other_column = asyncio.run(service.move_task("a", {"status": "done", "after_id": "b"}, user))
+        out_of_order = asyncio.run(service.move_task("c", {"after_id": "b", "before_id": "a"}, user))
+
+        assert "Stale ordering" in other_column["error"] and "Stale ordering" in out_of_order["error"]
+        assert service.db.transactions == []
+
+    def test_failed_move_keeps_coalesced_updates(self, monkeypatch):
+        """Test that a failed move reports failure and puts back the updates it took."""
+        service = self.board_service()
+        service.db.failures = 1
+        write_behind = TaskWriteBehind(window_ms=60_000)
+        monkeypatch.setattr("app.tasks.task_write_behind", write_behind)
+
+        async def move():
+            write_behind.enqueue("c", {"title": "Renamed"})
+            result = await service.move_task("c", {"after_id": "a", "before_id": "b"}, {"id": "u1", "role": "developer"})
+            for flusher in write_behind.flushers.values():
+                flusher.cancel()
+            return result
+
+        result = asyncio.run(move())
+
+        assert not result["success"] and result["error"] == "unavailable"
+        assert write_behind.pending == {"c": {"title": "Renamed"}}
+
+    def test_writes_keep_counts_equal_to_a_recount(self, monkeypatch):
+        """Test that create, update, move and delete keep the counters equal to a full recount."""
+        counters = TaskCounterStore()
+        monkeypatch.setattr("app.tasks.task_counters", counters)
+        monkeypatch.setattr("app.tasks.search_index", TaskSearchIndex())
+        monkeypatch.setattr("app.tasks.typeahead_index", TypeaheadIndex())
+        service = self.board_service()
+        service.db.records["tasks"].append({"id": "e", "project_id": "p2", "status": "todo", "rank": "a0", "assignee_id": "u2"})
+        user = {"id": "u1", "role": "project_manager"}
+
+        def assert_matches_recount():
+            counts = asyncio.run(service.get_task_counts(["p1", "p2"]))
+            recount = TaskCounterStore()
+            for project_id in ("p1", "p2"):
+                tasks = [task for task in service.db.records["tasks"] if task["project_id"] == project_id]
+                recount.reconcile(project_id, tasks)
+                assert counts[project_id] == len(tasks)
+                assert counters.get_summary(project_id) == recount.get_summary(project_id)
+
+        assert_matches_recount()
+
+        created = asyncio.run(service.create_task({"project_id": "p1", "title": "New", "assignee_id": "u2"}, user))
+        assert created["success"]
+        assert_matches_recount()
+
+        assert asyncio.run(service.update_task("a", {"status": "in_progress", "assignee_id": "u2"}, user))["success"]
+        assert_matches_recount()
+
+        assert asyncio.run(service.move_task(created["task"]["id"], {"status": "done", "after_id": "d"}, user))["success"]
+        assert_matches_recount()
+
+        assert asyncio.run(service.delete_task("b", user))["success"]
+        assert asyncio.run(service.delete_task("e", user))["success"]
+        assert_matches_recount()
+        assert counters.get_summary("p1")["by_status"] == {"todo": 1, "in_progress": 1, "done": 2}
+
+    def test_batch_query_groups_by_project_and_status(self):
+        """Test one $in query grouped by project and status, with empty groups and a per-group limit."""
+        service = TaskService()
+        service.db = MemoryDB(tasks=[
+            {"id": "a", "project_id": "p1", "status": "todo", "rank": "a2"},
+            {"id": "b", "project_id": "p1", "status": "todo", "rank": "a0"},
+            {"id": "c", "project_id": "p1", "status": "todo", "rank": "a1"},
+            {"id": "d", "project_id": "p1", "status": "in_progress", "rank": "a0"},
+            {"id": "e", "project_id": "p2", "status": "todo", "rank": "a0"},
+            {"id": "f", "project_id": "p3", "status": "todo", "rank": "a0"},
+        ])
+
+        grouped = asyncio.run(service.get_tasks_batch(["todo", "done"], ["p1", "p2", "p4"], limit=2))
+
+        assert service.db.queries == [{"tasks": {"where": {
+            "status": {"$in": ["todo", "done"]}, "project_id": {"$in": ["p1", "p2", "p4"]}
+        }}}]
+        assert {project_id: {status: [task["id"] for task in tasks] for status, tasks in columns.items()}
+                for project_id, columns in grouped.items()} == {
+            "p1": {"todo": ["b", "c"], "done": []},
+            "p2": {"todo": ["e"], "done": []},
+            "p4": {"todo": [], "done": []},
+        }
+
+    def test_batch_query_uses_equality_for_single_values(self):
+        """Test that single-value filters are sent as equality and unrequested statuses still group."""
+        service = TaskService()
+        service.db = MemoryDB(tasks=[
+            {"id": "a", "project_id": "p1", "status": "todo", "assignee_id": "u1"},
+            {"id": "b", "project_id": "p1", "status": "done", "assignee_id": "u1"},
+            {"id": "c", "project_id": "p1", "status": "done", "assignee_id": "u2"},
+        ])
+
+        grouped = asyncio.run(service.get_tasks_batch(project_ids=["p1"], assignee_ids=["u1"]))
+
+        assert service.db.queries == [{"tasks": {"where": {"project_id": "p1", "assignee_id": "u1"}}}]
+        assert {status: [task["id"] for task in tasks] for status, tasks in grouped["p1"].items()} == {
+            "todo": ["a"], "done": ["b"]
+        }
+
+    def test_project_board_groups_ranks_and_collects_assignees(self, monkeypatch):
+        """Test one nested query grouped into every column by rank, with legacy tasks and assignees."""
+        class BoardDB(MemoryDB):
+            async def query(self, query_data):
+                self.queries.append(query_data)
+                projects = [dict(project) for project in self.records["projects"]
+                            if matches_where(project, query_data["projects"]["where"])]
+                for project in projects:
+                    project["tasks"] = [
+                        {**task, "assignee": [user for user in self.records["users"] if user["id"] == task.get("assignee_id")]}
+                        for task in self.records["tasks"] if task["project_id"] == project["id"]
+                    ]
+                return {"projects": projects}
+
+        counters = TaskCounterStore()
+        monkeypatch.setattr("app.tasks.task_counters", counters)
+        service = TaskService()
+        service.db = BoardDB(
+            projects=[{"id": "p1", "name": "Board"}, {"id": "p2", "name": "Going", "status": "deleting"}],
+            users=[
+                {"id": "u1", "email": "ada@example.com", "name": "Ada", "role": "developer", "password_hash": "x"},
+                {"id": "u2", "email": "bob@example.com", "name": "Bob", "role": "project_manager"},
+            ],
+            tasks=[
+                {"id": "a", "project_id": "p1", "status": "todo", "rank": "a1", "assignee_id": "u1"},
+                {"id": "b", "project_id": "p1", "status": "todo", "rank": "a0", "assignee_id": "u2"},
+                # Legacy tasks without a rank sort after ranked ones by creation time
+                {"id": "c", "project_id": "p1", "status": "todo", "rank": None, "created_at": 200},
+                {"id": "d", "project_id": "p1", "status": "todo", "created_at": 100},
+                {"id": "e", "project_id": "p1", "status": "done", "rank": "a0", "assignee_id": "u1"},
+                {"id": "f", "project_id": "p2", "status": "todo", "rank": "a0"},
+            ],
+        )
+
+        board = asyncio.run(service.get_project_board("p1"))
+
+        assert len(service.db.queries) == 1
+        assert board["project"] == {"id": "p1", "name": "Board", "task_count": 5}
+        assert {status: [task["id"] for task in tasks] for status, tasks in board["columns"].items()} == {
+            "todo": ["b", "a", "d", "c"], "in_progress": [], "done": ["e"]
+        }
+        assert all("assignee" not in task for tasks in board["columns"].values() for task in tasks)
+        assert board["users"] == {
+            "u1": {"id": "u1", "email": "ada@example.com", "name": "Ada", "role": "developer"},
+            "u2": {"id": "u2", "email": "bob@example.com", "name": "Bob", "role": "project_manager"},
+        }
+        assert counters.get_summary("p1")["by_status"] == {"todo": 4, "in_progress": 0, "done": 1}
+        assert asyncio.run(service.get_project_board("p2")) is None
+        assert asyncio.run(service.get_project_board("missing")) is None
+
+    def test_failed_delete_keeps_coalesced_updates(self, monkeypatch):
+        """Test that a failed delete reports failure and puts back the updates it took."""
+        service = self.board_service()
+        service.db.failures = 1
+        write_behind = TaskWriteBehind(window_ms=60_000)
+        monkeypatch.setattr("app.tasks.task_write_behind", write_behind)
+
+        async def delete():
+            write_behind.enqueue("c", {"title": "Renamed"})
+            result = await service.delete_task("c", {"id": "u1", "role": "project_manager"})
+            for flusher in write_behind.flushers.values():
+                flusher.cancel()
+            return result
+
+        result = asyncio.run(delete())
+
+        assert not result["success"] and result["error"] == "unavailable"
+        assert write_behind.pending == {"c": {"title": "Renamed"}}
+        assert "c" in [task["id"] for task in service.db.records["tasks"]]
+
+    def test_rebalance_skips_tasks_changed_since_the_read(self):
+        """Test that a rebalance stamps updated_at and leaves tasks moved meanwhile alone."""
+        class RacingDB(MemoryDB):
+            async def query(self, query_data):
+                result = await super().query(query_data)
+                # Another request moves task b after the rebalance read the column
+                self.records["tasks"][1].update({"rank": "a0V", "updated_at": 99})
+                return result
+
+        service = TaskService()
+        service.db = RacingDB(tasks=[
+            {"id": task_id, "project_id": "p1", "status": "todo", "rank": "a0" + "V" * 30 + task_id, "updated_at": 1}
+            for task_id in "abc"
+        ])
+
+        asyncio.run(service.rebalance_column("p1", "todo"))
+
+        ranks = {task["id"]: (task["rank"], task["updated_at"]) for task in service.db.records["tasks"]}
+        assert ranks["b"] == ("a0V", 99)
+        assert len(ranks["a"][0]) < 5 and ranks["a"][1] > 1
+        assert len(ranks["c"][0]) < 5 and ranks["c"][1] > 1
+
+    def test_change_timestamps_are_strictly_increasing(self):
+        """Test that back-to-back changes never share a stamp."""
+        stamps = [change_timestamp() for _ in range(1000)]
+
+        assert stamps == sorted(set(stamps))
+
+    def test_sync_cursor_delivers_each_change_once(self):
+        """Test that repeated syncs deliver new versions and tombstones exactly once."""
+        service = TaskService()
+        service.db = MemoryDB(tasks=[{"id": "t1", "project_id": "p1", "updated_at": 5000}])
+
+        def sync(cursor=None):
+            result = asyncio.run(service.get_task_changes("p1", cursor))
+            assert result["success"]
+            return [task["id"] for task in result["tasks"]], [tombstone["id"] for tombstone in result["deleted"]], result["cursor"]
+
+        tasks, _, cursor = sync()
+        assert tasks == ["t1"]
+        assert sync(cursor)[:2] == ([], [])
+
+        # A second update in the same second, then a deletion
+        service.db.records["tasks"][0]["updated_at"] = 5001
+        tasks, _, cursor = sync(cursor)
+        assert tasks == ["t1"]
+        service.db.records["tasks"] = []
+        service.db.records["task_tombstones"] = [{"id": "t1", "project_id": "p1", "deleted_at": 5002}]
+        _, deleted, cursor = sync(cursor)
+        assert deleted == ["t1"]
+        assert sync(cursor)[:2] == ([], [])
+
+    def test_sync_cursor_catches_late_writes(self):
+        """Test that a write stamped before the cursor but committed after it is delivered."""
+        service = TaskService()
+        now = 10 ** 12
+        service.db = MemoryDB(tasks=[{"id": "t1", "project_id": "p1", "updated_at": now}])
+
+        cursor = asyncio.run(service.get_task_changes("p1"))["cursor"]
+        service.db.records["tasks"].append({"id": "t2", "project_id": "p1", "updated_at": now - SYNC_LOOKBACK_MS // 2})
+        service.db.records["tasks"].append({"id": "t3", "project_id": "p1", "updated_at": now - SYNC_LOOKBACK_MS * 2})
+        result = asyncio.run(service.get_task_changes("p1", cursor))
+
+        assert [task["id"] for task in result["tasks"]] == ["t2"]
+        assert decode_sync_cursor(result["cursor"])[0] == now
+
+    def test_sync_cursor_stays_small_after_bulk_import(self):
+        """Test that a batch sharing one change stamp keeps the cursor bounded and is delivered once."""
+        service = TaskService()
+        service.db = MemoryDB(tasks=[])
+        cursor = asyncio.run(service.get_task_changes("p1"))["cursor"]
+
+        imported = asyncio.run(service.import_tasks("p1", [{"title": f"Task {i}"} for i in range(2000)]))
+        assert imported["imported"] == 2000
+
+        result = asyncio.run(service.get_task_changes("p1", cursor))
+        assert len(result["tasks"]) == 2000
+        assert len(result["cursor"]) < 4096
+
+        result = asyncio.run(service.get_task_changes("p1", result["cursor"]))
+        assert result["tasks"] == []
+
+        # Later changes are still delivered past the shortened window
+        service.db.records["tasks"].append({"id": "late", "project_id": "p1", "updated_at": change_timestamp()})
+        result = asyncio.run(service.get_task_changes("p1", result["cursor"]))
+        assert [task["id"] for task in result["tasks"]] == ["late"]
+
+    def test_legacy_sync_cursor_is_read_as_seconds(self):
+        """Test that cursors from before millisecond stamps still decode."""
+        legacy = base64.urlsafe_b64encode(json.dumps({"t": 1700000000, "ids": [], "del": []}).encode()).decode()
+
+        assert decode_sync_cursor(legacy) == (1700000000000, (1700000000000 - SYNC_LOOKBACK_MS, ""), set())
+        with pytest.raises(ValueError):
+            decode_sync_cursor("not-a-cursor")
+
+
+class TestTaskCounters:
+    """Tests for write-maintained project task counters."""
+
+    @pytest.fixture
+    def counters(self):
+        """Fixture for a counter store seeded with one project."""
+        store = TaskCounterStore()
+        store.reconcile("p1", [
+            {"id": "t1", "project_id": "p1", "status": "todo", "assignee_id": "u1"},
+            {"id": "t2", "project_id": "p1", "status": "done", "assignee_id": "u2"},
+        ])
+        return store
+
+    def test_reconcile_counts_tasks(self, counters):
+        """Test that reconciliation counts by status and assignee."""
+        summary = counters.get_summary("p1")
+
+        assert summary["total"] == 2
+        assert summary["by_status"] == {"todo": 1, "in_progress": 0, "done": 1}
+        assert summary["by_assignee"] == {"u1": 1, "u2": 1}
+
+    def test_writes_update_counters(self, counters):
+        """Test that create, status change and delete adjust the counts."""
+        task = {"id": "t3", "project_id": "p1", "status": "todo", "assignee_id": "u1"}
+        counters.task_created(task)
+        counters.task_updated(task, {**task, "status": "in_progress"})
+        counters.task_deleted({"id": "t2", "project_id": "p1", "status": "done", "assignee_id": "u2"})
+
+        summary = counters.get_summary("p1")
+        assert summary["total"] == 2
+        assert summary["by_status"] == {"todo": 1, "in_progress": 1, "done": 0}
+        assert summary["by_assignee"] == {"u1": 2}
+
+    def test_unseeded_project_is_not_counted(self, counters):
+        """Test that writes to unseeded projects do not create partial counts."""
+        counters.task_created({"id": "t4", "project_id": "p2", "status": "todo"})
+
+        assert counters.get_summary("p2") is None
+        assert counters.needs_reconcile("p2")
+        assert not counters.needs_reconcile("p1")
+
+
+class TestTaskSearchIndex:
+    """Tests for the full-text task search index."""
+
+    @pytest.fixture
+    def index(self):
+        """Fixture for an index holding tasks in two projects."""
+        index = TaskSearchIndex()
+        index.load_project("p1", [
+            {"id": "t1", "project_id": "p1", "title": "Fix login bug", "description": "Users cannot log in"},
+            {"id": "t2", "project_id": "p1", "title": "Add dashboard", "description": "Show login history"},
+        ])
+        index.load_project("p2", [
+            {"id": "t3", "project_id": "p2", "title": "Login page", "acceptance_criteria": "Form validates email"},
+        ])
+        return index
+
+    def test_tokenize(self):
+        """Test that tokenization lowercases and drops punctuation."""
+        assert tokenize("Fix: Login-Bug #42") == ["fix", "login", "bug", "42"]
+        assert tokenize(None) == []
+
+    def test_title_matches_rank_first(self, index):
+        """Test that title matches outrank description matches."""
+        total, hits = index.search("login", "p1")
+
+        assert total == 2
+        assert [hit["id"] for hit in hits] == ["t1", "t2"]
+
+    def test_search_across_projects_and_paginate(self, index):
+        """Test global search with pagination."""
+        total, hits = index.search("login", limit=1, offset=1)
+
+        assert total == 3
+        assert len(hits) == 1
+
+    def test_incremental_updates(self, index):
+        """Test that updates and deletes are reflected in results."""
+        index.add_task({"id": "t2", "project_id": "p1", "title": "Add dashboard", "description": "Charts"})
+        index.remove_task("t1")
+
+        assert index.search("login", "p1") == (0, [])
+        assert index.search("charts", "p1")[1][0]["id"] == "t2"
+
+    def test_refresh_picks_up_external_writes(self, monkeypatch):
+        """Test that stale loaded projects are reloaded from the database."""
+        index = TaskSearchIndex(refresh_interval=0)
+        monkeypatch.setattr("app.tasks.search_index", index)
+        service = TaskService()
+        service.db = MemoryDB(tasks=[{"id": "t1", "project_id": "p1", "title": "Fix login bug"}])
+
+        async def run():
+            await service.search_tasks("login", "p1")
+            # Written by another process, so never fed to this index
+            service.db.records["tasks"].append({"id": "t2", "project_id": "p1", "title": "Login page"})
+            refresher = asyncio.create_task(service.run_search_refresh())
+            await asyncio.sleep(0.01)
+            refresher.cancel()
+
+        asyncio.run(run())
+
+        assert index.stale_projects() == ["p1"]
+        assert index.search("login", "p1")[0] == 2
+
+    def test_reload_builds_off_loop_and_keeps_concurrent_writes(self, monkeypatch):
+        """Test that a full reload builds in a thread and keeps writes made while it ran."""
+        index = TaskSearchIndex()
+        monkeypatch.setattr("app.tasks.search_index", index)
+        index.add_task({"id": "t9", "project_id": "p1", "title": "Login audit"})
+        build_threads = []
+        build = TaskSearchIndex.build.__func__
+
+        def tracked_build(cls, tasks):
+            build_threads.append(threading.get_ident())
+            return build(cls, tasks)
+
+        monkeypatch.setattr(TaskSearchIndex, "build", classmethod(tracked_build))
+
+        class RacingDB(MemoryDB):
+            async def query(self, query_data):
+                result = await super().query(query_data)
+                # Written after the read, so missing from what the reload builds
+                index.add_task({"id": "t2", "project_id": "p1", "title": "Login page"})
+                index.remove_task("t9")
+                return result
+
+        service = TaskService()
+        service.db = RacingDB(tasks=[
+            {"id": "t1", "project_id": "p1", "title": "Fix login bug"},
+            {"id": "t9", "project_id": "p1", "title": "Login audit"},
+        ])
+
+        assert asyncio.run(service.load_search_index())
+        assert build_threads and threading.get_ident() not in build_threads
+        assert sorted(hit["id"] for hit in index.search("login")[1]) == ["t1", "t2"]
+        assert index.recorders == []
+
+
+class TestTypeahead:
+    """Tests for prefix suggestions over task titles and users."""
+
+    @pytest.fixture
+    def index(self):
+        """Fixture for a typeahead index with tasks and users."""
+        index = TypeaheadIndex()
+        index.load_project("p1", [
+            {"id": "t1", "project_id": "p1", "title": "Fix login bug"},
+            {"id": "t2", "project_id": "p1", "title": "Login page"},
+            {"id": "t3", "project_id": "p1", "title": "Dashboard"},
+        ])
+        index.load_users([
+            {"id": "u1", "email": "ada@example.com", "name": "Ada Lovelace"},
+            {"id": "u2", "email": "grace@example.com", "name": "Grace Hopper"},
+        ])
+        return index
+
+    def test_suggest_matches_any_word_start(self, index):
+        """Test that title prefixes match at every word."""
+        suggestions = index.suggest_tasks("p1", "log")
+
+        assert sorted(s["id"] for s in suggestions) == ["t1", "t2"]
+        assert index.suggest_tasks("p1", "ogin") == []
+
+    def test_suggest_respects_limit_and_project(self, index):
+        """Test the result limit and project scoping."""
+        assert len(index.suggest_tasks("p1", "l", limit=1)) == 1
+        assert index.suggest_tasks("p2", "log") == []
+
+    def test_task_updates_and_deletes(self, index):
+        """Test that renamed and deleted tasks leave the index."""
+        index.add_task({"id": "t2", "project_id": "p1", "title": "Signup page"})
+        index.remove_task("t1")
+
+        assert index.suggest_tasks("p1", "login") == []
+        assert index.suggest_tasks("p1", "sign")[0]["id"] == "t2"
+
+    def test_suggest_users_by_email_or_name(self, index):
+        """Test user suggestions by email and by any name word."""
+        assert index.suggest_users("ada@")[0]["id"] == "u1"
+        assert index.suggest_users("hop")[0]["id"] == "u2"
+
+    def test_bulk_load_matches_incremental_adds(self):
+        """Test that a sorted bulk load builds the same index as one add per task."""
+        tasks = [{"id": f"t{i}", "project_id": "p2", "title": f"Fix bug {i % 7} in login"} for i in range(200)]
+        loaded = TypeaheadIndex()
+        loaded.add_task({"id": "t0", "project_id": "p1", "title": "Moved task"})
+        loaded.load_project("p2", tasks)
+        added = TypeaheadIndex()
+        for task in tasks:
+            added.add_task(task)
+
+        assert loaded.task_titles["p2"].entries == added.task_titles["p2"].entries
+        assert loaded.suggest_tasks("p1", "moved") == []
+        assert loaded.task_projects["t0"] == "p2"
+
+    def test_refresh_picks_up_external_writes(self, monkeypatch):
+        """Test that stale titles and users are reloaded from the database."""
+        from app.auth import auth_service
+
+        index = TypeaheadIndex(refresh_interval=0)
+        monkeypatch.setattr("app.tasks.typeahead_index", index)
+        monkeypatch.setattr("app.auth.typeahead_index", index)
+        db = MemoryDB(
+            tasks=[{"id": "t1", "project_id": "p1", "title": "Fix login bug"}],
+            users=[{"id": "u1", "email": "ada@example.com", "name": "Ada Lovelace"}]
+        )
+        service = TaskService()
+        service.db = db
+        monkeypatch.setattr(auth_service, "db", db)
+
+        async def run():
+            await service.suggest_tasks("p1", "log")
+            await auth_service.suggest_users("ada")
+            # Written by another process, so never fed to this index
+            db.records["tasks"].append({"id": "t2", "project_id": "p1", "title": "Login page"})
+            db.records["users"].append({"id": "u2", "email": "grace@example.com", "name": "Grace Hopper"})
+            refresher = asyncio.create_task(service.run_typeahead_refresh())
+            await asyncio.sleep(0.01)
+            refresher.cancel()
+
+        asyncio.run(run())
+
+        assert len(index.suggest_tasks("p1", "log")) == 2
+        assert index.suggest_users("grace")[0]["id"] == "u2"
+
+
+class TestFractionalIndex:
+    """Tests for column order keys."""
+
+    def test_key_between_neighbours(self):
+        """Test that generated keys sort strictly between their neighbours."""
+        first = generate_key_between(None, None)
+        last = generate_key_between(first, None)
+        middle = generate_key_between(first, last)
+        before = generate_key_between(None, first)
+
+        assert before < first < middle < last
+
+    def test_repeated_inserts_stay_ordered(self):
+        """Test many inserts into the same gap."""
+        low, high = "a0", "a1"
+        for _ in range(50):
+            key = generate_key_between(low, high)
+            assert low < key < high
+            high = key
+
+    def test_out_of_order_neighbours_rejected(self):
+        """Test that stale neighbour keys raise."""
+        with pytest.raises(ValueError):
+            generate_key_between("a1", "a0")
+
+    def test_integer_keys_sort_numerically(self):
+        """Test timestamp-derived keys and sequential keys."""
+        values = [0, 61, 62, 1000, 1792375920000]
+        keys = [key_for_integer(value) for value in values]
+
+        assert keys == sorted(keys)
+        assert sequential_keys(3) == ["a0", "a1", "a2"]
+
+
+class TestTaskWriteBehind:
+    """Tests for coalescing bursts of task updates."""
+
+    def test_coalesces_updates_and_stamps_at_flush(self):
+        """Test that a burst becomes one write stamped when it is flushed."""
+        write_behind = TaskWriteBehind(window_ms=20)
+        write_behind.db = MemoryDB(tasks=[{"id": "t1", "title": "Old", "status": "todo", "updated_at": 1}])
+
+        async def burst():
+            write_behind.enqueue("t1", {"title": "New", "updated_at": change_timestamp()})
+            write_behind.enqueue("t1", {"status": "done", "updated_at": change_timestamp()})
+            enqueued_at = write_behind.pending["t1"]["updated_at"]
+            await asyncio.sleep(0.05)
+            return enqueued_at
+
+        enqueued_at = asyncio.run(burst())
+
+        assert len(write_behind.db.transactions) == 1
+        task, = write_behind.db.records["tasks"]
+        assert task["title"] == "New" and task["status"] == "done"
+        assert task["updated_at"] > enqueued_at
+
+    def test_reads_overlay_pending_fields(self):
+        """Test that pending fields are applied to copies of tasks read from the database."""
+        write_behind = TaskWriteBehind(window_ms=1000)
+
+        async def overlay():
+            write_behind.enqueue("t1", {"status": "done"})
+            tasks = write_behind.overlay_all([{"id": "t1", "status": "todo"}, {"id": "t2", "status": "todo"}])
+            write_behind.take("t1")
+            return tasks
+
+        assert asyncio.run(overlay()) == [{"id": "t1", "status": "done"}, {"id": "t2", "status": "todo"}]
+        assert write_behind.overlay(None) is None
+
+    def test_failed_flush_retries_with_newer_fields_on_top(self):
+        """Test that a failed write is retried without undoing updates made meanwhile."""
+        write_behind = TaskWriteBehind(window_ms=10)
+        write_behind.db = MemoryDB(tasks=[{"id": "t1", "status": "todo"}])
+        write_behind.db.failures = 1
+
+        async def run():
+            write_behind.enqueue("t1", {"status": "in_progress", "title": "First"})
+            assert not await write_behind.flush("t1")
+            write_behind.enqueue("t1", {"status": "done"})
+            await asyncio.sleep(0.05)
+
+        asyncio.run(run())
+
+        task, = write_behind.db.records["tasks"]
+        assert task["status"] == "done" and task["title"] == "First"
+        assert not write_behind.pending
+
+
+class TestOutbox:
+    """Tests for the durable local write outbox."""
+
+    class UnreachableDB:
+        """Stand-in for InstantDB while it is down."""
+
+        async def query(self, query_data):
+            return {"tasks": [{"id": "t1", "project_id": "p1", "status": "todo"}]}
+
+        async def transact(self, transaction_data):
+            return {"error": "unavailable"}
+
+    def test_matches_where(self):
+        """Test equality and operator where clauses."""
+        record = {"id": "t1", "status": "todo", "updated_at": 10}
+
+        assert matches_where(record, {"status": "todo"})
+        assert matches_where(record, {"status": {"$in": ["todo", "done"]}, "updated_at": {"$gte": 10}})
+        assert not matches_where(record, {"updated_at": {"$gt": 10}})
+
+    def test_writes_survive_restart(self, tmp_path):
+        """Test that journaled writes are reloaded by a new outbox."""
+        path = str(tmp_path / "outbox.db")
+        outbox = InstantDBOutbox(self.UnreachableDB(), path)
+        result = asyncio.run(outbox.transact([{"tasks": {"create": {"id": "t2", "project_id": "p1"}}}]))
+
+        assert result["queued"]
+        assert InstantDBOutbox(self.UnreachableDB(), path).status()["pending"] == 1
+
+    def test_reads_overlay_pending_writes(self, tmp_path):
+        """Test that queries see writes not yet replayed."""
+        outbox = InstantDBOutbox(self.UnreachableDB(), str(tmp_path / "outbox.db"))
+        asyncio.run(outbox.transact([
+            {"tasks": {"create": {"id": "t2", "project_id": "p1", "status": "todo"}}},
+            {"tasks": {"update": {"where": {"id": "t1"}, "set": {"status": "done"}}}},
+        ]))
+
+        result = asyncio.run(outbox.query({"tasks": {"where": {"project_id": "p1", "status": "todo"}}}))
+        assert [task["id"] for task in result["tasks"]] == ["t2"]
+
+    def test_reads_include_records_pending_writes_move_into_them(self, tmp_path):
+        """Test that pending updates can add records and pending deletes do not shorten pages."""
+        db = MemoryDB(tasks=[{"id": f"t{i}", "project_id": "p1", "status": "todo"} for i in range(5)])
+        db.failures = 10
+        outbox = InstantDBOutbox(db, str(tmp_path / "outbox.db"))
+        asyncio.run(outbox.transact([
+            {"tasks": {"update": {"where": {"id": "t4"}, "set": {"status": "done"}}}},
+            {"tasks": {"delete": {"where": {"id": "t0"}}}},
+            {"tasks": {"delete": {"where": {"id": "t1"}}}},
+        ]))
+
+        done = asyncio.run(outbox.query({"tasks": {"where": {"status": "done"}}}))
+        page = asyncio.run(outbox.query({"tasks": {"where": {"project_id": "p1"}, "order": {"id": "asc"}, "limit": 2}}))
+
+        assert [task["id"] for task in done["tasks"]] == ["t4"]
+        assert [task["id"] for task in page["tasks"]] == ["t2", "t3"]
+
+    def test_journal_writes_leave_the_loop_free(self, tmp_path):
+        """Test that journal writes run on the writer thread, in call order, and replay in order."""
+        db = MemoryDB()
+        db.failures = 1
+        outbox = InstantDBOutbox(db, str(tmp_path / "outbox.db"), max_backoff=0)
+        threads = set()
+        execute = outbox._execute
+
+        def tracked_execute(sql, params):
+            threads.add(threading.get_ident())
+            return execute(sql, params)
+
+        outbox._execute = tracked_execute
+
+        async def run():
+            await asyncio.gather(*[
+                outbox.transact([{"tasks": {"create": {"id": f"t{i}", "project_id": "p1"}}}]) for i in range(5)
+            ])
+            replayer = asyncio.create_task(outbox.run())
+            while outbox.pending:
+                await asyncio.sleep(0.01)
+            replayer.cancel()
+
+        asyncio.run(run())
+
+        assert threading.get_ident() not in threads and len(threads) == 1
+        assert [steps[0]["tasks"]["create"]["id"] for steps in db.transactions] == [f"t{i}" for i in range(5)]
+        assert outbox.status()["pending"] == 0
+
+    def test_reads_overlay_other_workers_writes(self, tmp_path):
+        """Test that a worker's reads see writes another worker journaled and stop once they are delivered."""
+        path = str(tmp_path / "outbox.db")
+        db = MemoryDB(tasks=[{"id": "t1", "project_id": "p1", "status": "todo"}])
+        db.failures = 10
+        first = InstantDBOutbox(db, path)
+        second = InstantDBOutbox(db, path)
+
+        async def status_seen_by_first():
+            result = await first.query({"tasks": {"where": {"id": "t1"}}})
+            return result["tasks"][0]["status"]
+
+        asyncio.run(second.transact([{"tasks": {"update": {"where": {"id": "t1"}, "set": {"status": "done"}}}}]))
+        assert asyncio.run(status_seen_by_first()) == "done"
+
+        second.conn.execute("DELETE FROM outbox")
+        assert asyncio.run(status_seen_by_first()) == "todo"
+        assert first.pending == []
+
+    def test_one_worker_replays_every_write_in_journal_order(self, tmp_path):
+        """Test that only the lock holder replays, in journal order across workers, and another takes over."""
+        path = str(tmp_path / "outbox.db")
+        db = MemoryDB()
+        db.failures = 1
+        first = InstantDBOutbox(db, path, max_backoff=0)
+        second = InstantDBOutbox(db, path, max_backoff=0)
+
+        def update(status):
+            return [{"tasks": {"update": {"where": {"id": "t1"}, "set": {"status": status}}}}]
+
+        async def run():
+            await first.transact(update("in_progress"))
+            await second.transact(update("done"))
+            await first.transact(update("todo"))
+            replayers = [asyncio.create_task(first.run()), asyncio.create_task(second.run())]
+            while first.pending or second.pending:
+                await asyncio.sleep(0.01)
+            assert first.replaying != second.replaying
+
+            # The lock is released on shutdown so the other worker takes over
+            leader, follower = (first, second) if first.replaying else (second, first)
+            replayers[[first, second].index(leader)].cancel()
+            await asyncio.sleep(0.01)
+            assert not leader.replaying
+            await follower.transact(update("in_progress"))
+            while follower.pending:
+                await asyncio.sleep(0.01)
+            for replayer in replayers:
+                replayer.cancel()
+
+        asyncio.run(run())
+
+        statuses = [steps[0]["tasks"]["update"]["set"]["status"] for steps in db.transactions]
+        assert statuses == ["in_progress", "done", "todo", "in_progress"]
+
+
+class TestSnapshot:
+    """Tests for binary project snapshots."""
+
+    def test_decompression_is_capped(self):
+        """Test that a small frame decompressing past the limit is refused."""
+        import zstandard
+
+        bomb = HEADER.pack(MAGIC, 1, 1) + zstandard.ZstdCompressor().compress(b"\0" * (4 * 1024 * 1024))
+        assert len(bomb) < 1024
+
+        with pytest.raises(SnapshotError, match="decompresses to more than"):
+            decode_snapshot(bomb, max_decoded_size=1024 * 1024)
+
+    def test_oversized_upload_is_refused(self, monkeypatch):
+        """Test that restore bodies over the size limit get 413 before they are buffered whole."""
+        from fastapi import HTTPException
+        from starlette.requests import Request
+        from app.routers.projects import read_snapshot_body
+
+        monkeypatch.setattr("app.routers.projects.MAX_SNAPSHOT_SIZE", 10)
+        chunks = [b"123456", b"789012", b"345678"]
+        received = []
+
+        async def receive():
+            chunk = chunks.pop(0)
+            received.append(chunk)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+        request = Request({"type": "http", "method": "POST", "headers": []}, receive)
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(read_snapshot_body(request))
+
+        assert error.value.status_code == 413
+        assert len(received) == 2
+
+    def test_round_trip(self):
+        """Test that value, dict and delta columns decode to the rows encoded."""
+        project = {"id": "p1", "name": "Board", "description": "", "owner_id": "u1", "created_at": 1700000000}
+        tasks = [
+            {"id": "t1", "title": "First", "status": "todo", "assignee_id": "u1", "rank": "a0",
+             "created_at": 1700000100, "updated_at": 1700000500},
+            {"id": "t2", "title": "Second", "description": "Details", "status": "done",
+             "acceptance_criteria": "Works", "rank": "a1", "created_at": 1700000050, "updated_at": 1700000600},
+            {"id": "t3", "title": "Third", "status": "todo", "assignee_id": "u1", "rank": "a2",
+             "created_at": 1700000200, "updated_at": 1700000700},
+        ]
+        users = [{"id": "u1", "email": "ada@example.com", "name": "Ada", "role": "developer", "created_at": 1690000000}]
+
+        decoded = decode_snapshot(encode_snapshot(project, tasks, users))
+
+        assert decoded["project"] == project
+        assert decoded["tasks"] == tasks
+        assert decoded["users"] == users
+
+    def test_restore_never_creates_users(self, monkeypatch):
+        """Test that unknown assignees are cleared instead of created from the snapshot."""
+        db = MemoryDB(users=[{"id": "u1", "email": "ada@example.com"}])
+        monkeypatch.setattr(db_service, "get_client", lambda: db)
+        monkeypatch.setattr(task_service, "db", db)
+        data = encode_snapshot(
+            {"id": "p1", "name": "Board", "owner_id": "someone", "created_at": 1},
+            [{"id": "t1", "title": "Known", "assignee_id": "u1"}, {"id": "t2", "title": "Unknown", "assignee_id": "u9"}],
+            [{"id": "u9", "email": "ada@example.com", "role": "project_manager"}]
+        )
+
+        project = asyncio.run(restore_project_snapshot(data, "u1"))
+
+        assert project["owner_id"] == "u1" and project["id"] != "p1"
+        assert [user["id"] for user in db.records["users"]] == ["u1"]
+        assignees = {task["title"]: task.get("assignee_id") for task in db.records["tasks"]}
+        assert assignees == {"Known": "u1", "Unknown": None}
+
+    def test_restore_refuses_taken_ids(self, monkeypatch):
+        """Test that preserve_ids cannot overwrite an existing project or task."""
+        db = MemoryDB(projects=[{"id": "p1", "owner_id": "u1"}], tasks=[{"id": "t1", "project_id": "p1"}])
+        monkeypatch.setattr(db_service, "get_client", lambda: db)
+        monkeypatch.setattr(task_service, "db", db)
+        same_project = encode_snapshot({"id": "p1", "name": "Board"}, [], [])
+        same_task = encode_snapshot({"id": "p2", "name": "Board"}, [{"id": "t1", "title": "Taken"}], [])
+
+        with pytest.raises(SnapshotConflict):
+            asyncio.run(restore_project_snapshot(same_project, "u2", preserve_ids=True))
+        with pytest.raises(SnapshotConflict):
+            asyncio.run(restore_project_snapshot(same_task, "u2", preserve_ids=True))
+        assert db.transactions == []
+        assert db.records["projects"][0]["owner_id"] == "u1"
+
+    def test_import_refuses_taken_ids(self):
+        """Test that a preserve_ids import batch with a taken id writes nothing."""
+        service = TaskService()
+        service.db = MemoryDB(tasks=[{"id": "t1", "project_id": "p1", "title": "Original"}])
+
+        result = asyncio.run(service.import_tasks("p2", [{"id": "t1", "title": "Copy"}], preserve_ids=True))
+
+        assert not result["success"] and "already exist" in result["error"]
+        assert service.db.records["tasks"] == [{"id": "t1", "project_id": "p1", "title": "Original"}]
+
+    def test_import_stamps_updated_at(self):
+        """Test that imported tasks keep created_at but are stamped as updated now."""
+        service = TaskService()
+        service.db = MemoryDB()
+
+        asyncio.run(service.import_tasks("p1", [{"title": "Old", "created_at": 100, "updated_at": 200}]))
+
+        task, = service.db.records["tasks"]
+        assert task["created_at"] == 100
+        assert task["updated_at"] > 200
+
+
+class TestProjectDeletionWorker:
+    """Tests for batched background project deletion."""
+
+    class OverlayDB(MemoryDB):
+        """Stand-in whose reads hide deletes still queued, like the outbox overlay."""
+
+        def __init__(self, **collections):
+            super().__init__(**collections)
+            self.pending = set()
+
+        async def query(self, query_data):
+            result = await super().query(query_data)
+            if "tasks" in result:
+                result["tasks"] = [task for task in result["tasks"] if task["id"] not in self.pending]
+            return result
+
+        async def transact(self, transaction_data):
+            self.transactions.append(transaction_data)
+            for step in transaction_data:
+                if "delete" in step.get("tasks", {}):
+                    self.pending.add(step["tasks"]["delete"]["where"]["id"])
+            return {}
+
+    def test_deletes_tasks_in_batches(self):
+        """Test that tasks are removed in bounded batches before the project."""
+        db = MemoryDB(
+            projects=[{"id": "p1", "status": "deleting"}, {"id": "p2"}],
+            tasks=[{"id": f"t{i}", "project_id": "p1" if i < 5 else "p2"} for i in range(7)]
+        )
+        worker = ProjectDeletionWorker(batch_size=2)
+        worker.db = db
+
+        assert asyncio.run(worker.delete_project("p1"))
+
+        assert [project["id"] for project in db.records["projects"]] == ["p2"]
+        assert {task["project_id"] for task in db.records["tasks"]} == {"p2"}
+        # Three task batches with a tombstone per task and the progress update, then the project
+        assert [len(steps) for steps in db.transactions] == [5, 5, 3, 1]
+        assert db.transactions[-2][-1]["projects"]["update"]["data"]["deleted_task_count"] == 5
+        assert sorted(tombstone["id"] for tombstone in db.records["task_tombstones"]) == [f"t{i}" for i in range(5)]
+
+    def test_pages_past_pending_deletes(self):
+        """Test that reads hiding queued deletes do not end the scan early."""
+        db = self.OverlayDB(
+            projects=[{"id": "p1", "status": "deleting"}],
+            tasks=[{"id": f"t{i}", "project_id": "p1"} for i in range(5)]
+        )
+        worker = ProjectDeletionWorker(batch_size=2)
+        worker.db = db
+
+        assert asyncio.run(worker.delete_project("p1"))
+
+        assert db.pending == {f"t{i}" for i in range(5)}
+
+    def test_parks_after_repeated_failures(self):
+        """Test that a failing deletion is parked instead of retried forever."""
+        db = MemoryDB(
+            projects=[{"id": "p1", "status": "deleting"}],
+            tasks=[{"id": "t0", "project_id": "p1"}]
+        )
+        db.failures = 10
+        worker = ProjectDeletionWorker(batch_size=2, max_backoff=0, max_attempts=3)
+        worker.db = db
+
+        assert not asyncio.run(worker.delete_project("p1"))
+
+        assert worker.parked == {"p1": "unavailable"}
+        assert db.records["projects"][0]["status"] == "deleting"
+        assert db.failures == 7
+
+    def test_workers_resuming_the_same_project_delete_it_once(self, tmp_path):
+        """Test that only the worker holding a project's lock deletes it."""
+
+        class SlowDB(MemoryDB):
+            async def query(self, query_data):
+                await asyncio.sleep(0.001)
+                return await super().query(query_data)
+
+        db = SlowDB(
+            projects=[{"id": "p1", "status": "deleting"}],
+            tasks=[{"id": f"t{i}", "project_id": "p1"} for i in range(6)]
+        )
+        workers = [ProjectDeletionWorker(batch_size=2, lock_dir=str(tmp_path)) for _ in range(2)]
+        for worker in workers:
+            worker.db = db
+
+        async def run():
+            runners = [asyncio.create_task(worker.run()) for worker in workers]
+            while db.records["projects"] or any(worker.queued for worker in workers):
+                await asyncio.sleep(0.005)
+            for runner in runners:
+                runner.cancel()
+
+        asyncio.run(run())
+
+        tombstones = [step["task_tombstones"]["create"]["id"] for steps in db.transactions
+                      for step in steps if "task_tombstones" in step]
+        progress = [steps[-1]["projects"]["update"]["data"]["deleted_task_count"] for steps in db.transactions
+                    if "update" in steps[-1].get("projects", {})]
+        assert sorted(tombstones) == [f"t{i}" for i in range(6)]
+        assert progress == [2, 4, 6]
+        assert sum("delete" in steps[0].get("projects", {}) for steps in db.transactions) == 1
+        assert list(tmp_path.iterdir()) == []
+
+    def test_sweeps_tasks_created_behind_the_scan(self):
+        """Test that a task created with a lower id while the scan runs is still deleted."""
+
+        class CreatingDB(MemoryDB):
+            async def transact(self, transaction_data):
+                if not self.transactions:
+                    self.records["tasks"].append({"id": "t0", "project_id": "p1"})
+                return await super().transact(transaction_data)
+
+        db = CreatingDB(
+            projects=[{"id": "p1", "status": "deleting"}],
+            tasks=[{"id": f"t{i}", "project_id": "p1"} for i in range(1, 4)]
+        )
+        worker = ProjectDeletionWorker(batch_size=2)
+        worker.db = db
+
+        assert asyncio.run(worker.delete_project("p1"))
+
+        assert db.records["tasks"] == []
+        assert db.records["projects"] == []
+
+    def test_writes_to_deleting_projects_are_refused(self):
+        """Test that creating or importing tasks into a project being deleted fails."""
+        service = TaskService()
+        service.db = MemoryDB(projects=[{"id": "p1", "status": "deleting"}], tasks=[])
+
+        created = asyncio.run(service.create_task({"project_id": "p1", "title": "Late"}, {"id": "u1"}))
+        imported = asyncio.run(service.import_tasks("p1", [{"title": "Late"}]))
+
+        assert not created["success"] and "being deleted" in created["error"]
+        assert not imported["success"] and "being deleted" in imported["error"]
+        assert service.db.records["tasks"] == []
+
+
+class TestDataLoader:
+    """Tests for request-scoped id lookup batching."""
+
+    class CountingDB:
+        """Stand-in for InstantDB that records queries."""
+
+        def __init__(self):
+            self.tasks = [{"id": f"t{i}", "title": f"Task {i}"} for i in range(3)]
+            self.queries = []
+
+        async def query(self, query_data):
+            self.queries.append(query_data)
+            return {"tasks": [task for task in self.tasks if matches_where(task, query_data["tasks"]["where"])]}
+
+    def test_batches_lookups_in_one_tick(self):
+        """Test that concurrent loads become one $in query."""
+        db = self.CountingDB()
+        loader = DataLoader(db)
+
+        tasks = asyncio.run(loader.load_many("tasks", ["t0", "t2", "missing"]))
+
+        assert [task and task["id"] for task in tasks] == ["t0", "t2", None]
+        assert db.queries == [{"tasks": {"where": {"id": {"$in": ["t0", "t2", "missing"]}}}}]
+
+    def test_memoizes_until_cleared(self):
+        """Test that repeated loads are served from memory until a write clears them."""
+        db = self.CountingDB()
+        loader = DataLoader(db)
+
+        async def load():
+            await loader.load("tasks", "t1")
+            await loader.load("tasks", "t1")
+            loader.clear("tasks", "t1")
+            return await loader.load("tasks", "t1")
+
+        assert asyncio.run(load())["title"] == "Task 1"
+        assert len(db.queries) == 2
+
+
+class TestPerformanceMonitor:
+    """Tests for fixed-memory request metrics."""
+
+    def test_histogram_percentiles(self):
+        """Test that percentiles are within bucket precision."""
+        histogram = LatencyHistogram()
+        for millis in range(1, 1001):
+            histogram.record(millis / 1000)
+
+        assert histogram.count == 1000
+        assert histogram.percentile(50) == pytest.approx(0.5, rel=0.05)
+        assert histogram.percentile(99) == pytest.approx(0.99, rel=0.05)
+        assert histogram.percentile(100) <= 1.0
+
+    def test_memory_is_bounded(self):
+        """Test that recording does not keep per-request data."""
+        monitor = PerformanceMonitor()
+        for _ in range(SLOW_REQUEST_RING_SIZE * 3):
+            monitor.record_response_time("/api/tasks", 0.6, 200)
+        monitor.record_response_time("/api/tasks", 0.01, 404)
+
+        stats = monitor.get_stats()
+        assert stats["total_requests"] == SLOW_REQUEST_RING_SIZE * 3 + 1
+        assert stats["slow_requests"] == SLOW_REQUEST_RING_SIZE * 3
+        assert stats["endpoint_stats"]["/api/tasks"]["error_count"] == 1
+        assert len(stats["recent_slow_requests"]) == SLOW_REQUEST_RING_SIZE
+
+    def test_route_key_uses_template(self):
+        """Test that requests are keyed by method and route template."""
+        class Route:
+            path = "/api/tasks/{task_id}"
+            methods = {"GET", "HEAD"}
+
+        assert route_key({"method": "GET", "route": Route()}) == "GET /api/tasks/{task_id}"
+        assert route_key({"method": "GET", "path": "/favicon.ico"}) == UNMATCHED_ROUTE
+        # A path match with the wrong method is a 405, not a request for the route
+        assert route_key({"method": "PATCH", "route": Route()}) == UNMATCHED_ROUTE
+
+    def test_rate_limited_requests_are_recorded(self):
+        """Test that requests rejected by inner middleware are recorded under their route."""
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from app.performance import PerformanceMiddleware, performance_monitor
+        from app.rate_limiter import RateLimiter, RateLimitMiddleware
+
+        app = FastAPI()
+
+        @app.get("/api/limited-test")
+        async def limited():
+            return {"ok": True}
+
+        app.add_middleware(RateLimitMiddleware, rate_limiter=RateLimiter(1, 60), key_extractor=lambda request: "ip:test")
+        app.add_middleware(PerformanceMiddleware)
+
+        client = TestClient(app)
+        assert client.get("/api/limited-test").status_code == 200
+        response = client.get("/api/limited-test")
+        assert response.status_code == 429
+        assert response.headers["X-RateLimit-Remaining"] == "0"
+
+        stats = performance_monitor.get_stats()["endpoint_stats"]["GET /api/limited-test"]
+        assert stats["request_count"] == 2
+        assert stats["error_count"] == 1
+
+    def test_spans_are_aggregated_per_route(self):
+        """Test that request spans are summed per route and formatted for Server-Timing."""
+        timing = RequestTiming()
+        timing.add("db", 0.010)
+        timing.add("db", 0.005)
+        timing.add("auth", 0.002)
+
+        assert timing.server_timing(0.020) == 'db;dur=15.0;desc="2 calls", auth;dur=2.0, total;dur=20.0'
+
+        monitor = PerformanceMonitor()
+        monitor.record_response_time("GET /api/tasks/", 0.02, 200, timing.spans)
+        monitor.record_response_time("GET /api/tasks/", 0.02, 200, timing.spans)
+
+        db_span = monitor.get_stats()["endpoint_stats"]["GET /api/tasks/"]["spans"]["db"]
+        assert db_span["calls"] == 4
+        assert db_span["avg_time_per_request"] == pytest.approx(0.015)
+
+    def test_slow_requests_keep_call_breakdown(self):
+        """Test that slow requests are captured per route threshold with their calls."""
+        monitor = PerformanceMonitor(slow_thresholds=parse_slow_thresholds("GET /api/tasks/=100"))
+        timing = RequestTiming()
+        timing.add("db", 0.08)
+        timing.add_call("db", "query", timing.start, 0.08, False, {"collection": "tasks", "bytes": 512})
+        timing.response_bytes = 2048
+        scope = {
+            "method": "GET",
+            "route": type("Route", (), {"path": "/api/tasks/", "methods": {"GET"}})(),
+            "query_string": b"status=todo&q=secret",
+            "headers": [(b"authorization", b"Bearer token")],
+        }
+
+        monitor.record_response_time("GET /api/tasks/", 0.2, 200, timing.spans, details=lambda: timing.breakdown(scope))
+        monitor.record_response_time("GET /api/tasks/", 0.05, 200)
+        monitor.record_response_time("GET /api/projects/", 0.2, 200)
+
+        entries = monitor.get_slow_requests()
+        assert len(entries) == 1
+        entry = entries[0]
+        assert entry["threshold"] == 0.1
+        assert entry["response_bytes"] == 2048
+        assert entry["calls"][0]["collection"] == "tasks"
+        assert entry["request"]["query_params"] == ["q", "status"]
+        assert entry["request"]["authenticated"] is True
+        assert "secret" not in str(entry) and "token" not in str(entry["request"])
+        assert monitor.get_stats()["slow_requests"] == 1
+
+    def test_slow_request_breakdown_keeps_slowest_calls(self):
+        """Test that only the slowest calls are kept and the rest are summed per kind."""
+        timing = RequestTiming()
+        for call in range(30):
+            timing.add_call("db", "query", timing.start + call, 0.001 * call, False)
+        timing.add_call("ai", "chat", timing.start + 30, 0.0001, False)
+
+        breakdown = timing.breakdown({"method": "GET"})
+
+        assert [call["duration"] for call in breakdown["calls"]] == [0.001 * call for call in range(20, 30)]
+        assert breakdown["calls_dropped"]["db"]["calls"] == 20
+        assert breakdown["calls_dropped"]["db"]["time"] == pytest.approx(0.001 * sum(range(20)))
+        assert breakdown["calls_dropped"]["ai"] == {"calls": 1, "time": 0.0001}
+
+    def test_rolling_window_forgets_old_requests(self):
+        """Test that windows only count requests inside them."""
+        window = RollingWindow()
+        # Aligned to a slot boundary, so the last minute is exactly one slot
+        now = 1_000_020.0
+        for second in range(0, 600, 2):
+            window.record(0.1 if second < 540 else 1.0, second >= 540, now + second)
+
+        last_minute = window.get_stats(60, now + 600)
+        assert last_minute["request_count"] == 30
+        assert last_minute["error_rate"] == 1
+        assert last_minute["p50_response_time"] == pytest.approx(1.0, rel=0.1)
+
+        last_fifteen = window.get_stats(900, now + 600)
+        assert last_fifteen["request_count"] == 300
+        assert last_fifteen["p50_response_time"] == pytest.approx(0.1, rel=0.1)
+
+    def test_rolling_window_histograms_span_seen_latencies(self):
+        """Test that slot histograms only hold buckets between the fastest and slowest request."""
+        window = RollingWindow()
+        now = 1_000_020.0
+        for second in range(900):
+            window.record(0.010 + (second % 10) / 1000, False, now + second)
+        window.record(0.002, False, now + 899)
+
+        assert max(len(histogram) for histogram in window.histograms if histogram) <= 16
+        merged = RollingWindow()
+        merged.merge_state(window.to_state())
+        merged.merge_state(window.to_state())
+        assert merged.get_stats(900, now + 900)["request_count"] == 1802
+        assert merged.get_stats(900, now + 900)["p50_response_time"] == pytest.approx(0.015, rel=0.2)
+
+    def test_shared_metrics_merge_workers(self, tmp_path, monkeypatch):
+        """Test that metrics published by one worker are merged by another."""
+        path = str(tmp_path / "metrics")
+        first_monitor = PerformanceMonitor()
+        first = SharedMetrics(path, first_monitor, slots=4, slot_size=1 << 16)
+        first_monitor.record_response_time("GET /api/tasks/", 0.01, 200)
+        first.publish()
+
+        monkeypatch.setattr("os.getpid", lambda: first.pid + 1)
+        second_monitor = PerformanceMonitor()
+        second = SharedMetrics(path, second_monitor)
+        second_monitor.record_response_time("GET /api/tasks/", 0.02, 500)
+
+        assert second.slot != first.slot
+        stats = second.merged_monitor().get_stats()
+        assert stats["total_requests"] == 2
+        assert stats["endpoint_stats"]["GET /api/tasks/"]["error_count"] == 1
+
+    def test_shared_metrics_fit_slots_sized_from_routes(self, tmp_path):
+        """Test that a busy worker's state fits the slot sized for its routes."""
+        monitor = PerformanceMonitor()
+        calls = [{"kind": "db", "operation": "query", "start": 0.01 * i, "duration": 0.05,
+                  "error": False, "collection": "tasks", "bytes": 4096} for i in range(10)]
+        for route in range(60):
+            endpoint = f"GET /api/route{route}/{{item_id}}"
+            for millis in range(1, 3000, 7):
+                monitor.record_response_time(endpoint, millis / 1000, 200 if millis % 5 else 500,
+                                             details=lambda: {"calls": calls, "request": {"method": "GET"}})
+            now = 1_000_020.0
+            for second in range(0, 900, 30):
+                monitor.endpoints[endpoint].window.record(second / 100, False, now + second)
+            monitor.record_call("db", f"op{route % 8}", route / 100)
+
+        shared = SharedMetrics(str(tmp_path / "metrics"), monitor, slots=2, slot_size=slot_size_for(60))
+        shared.publish()
+
+        worker, = shared.workers()
+        assert worker["overflow_bytes"] == 0 and worker["payload_bytes"] > 0
+
+    def test_shared_metrics_report_overflow(self, tmp_path):
+        """Test that a worker whose state does not fit its slot says so."""
+        monitor = PerformanceMonitor()
+        for route in range(20):
+            monitor.record_response_time(f"GET /api/route{route}/", 0.01, 200)
+
+        shared = SharedMetrics(str(tmp_path / "metrics"), monitor, slots=2, slot_size=SLOT_HEADER.size + 256)
+        shared.publish()
+
+        worker, = shared.workers()
+        assert worker["overflow_bytes"] > 256 and worker["payload_bytes"] == 0
+
+    def test_event_loop_stalls_are_attributed(self):
+        """Test that stalls are attributed to the innermost app frame captured."""
+        monitor = EventLoopMonitor(threshold=0.1)
+        monitor.record(0.001)
+        monitor.captured_deadline = 5.0
+        monitor.pending_stack = [
+            "/usr/lib/python3/site-packages/bcrypt/__init__.py:91 in hashpw",
+            f"{APP_ROOT}/app/auth.py:120 in hash_password",
+        ]
+        monitor.record(0.4, 5.0)
+        monitor.record(0.2)
+
+        stats = monitor.get_stats()
+        assert stats["samples"] == 3
+        assert stats["stalls"] == 2
+        assert stats["blocking_sites"][0]["site"] == f"{APP_ROOT}/app/auth.py:120 in hash_password"
+        assert stats["blocking_sites"][1]["site"] == "unknown"
+
+    def test_openmetrics_exposition(self):
+        """Test that metrics render as cumulative OpenMetrics series."""
+        monitor = PerformanceMonitor()
+        monitor.record_response_time("GET /api/tasks/", 0.003, 200)
+        monitor.record_response_time("GET /api/tasks/", 2.0, 500)
+        monitor.record_call("db", "query", 0.002)
+        monitor.record_cache("dataloader", True)
+
+        text = openmetrics.render(monitor)
+        lines = text.splitlines()
+
+        assert lines[-1] == "# EOF"
+        assert 'http_request_duration_seconds_bucket{route="GET /api/tasks/",le="0.0064"} 1' in lines
+        assert 'http_request_duration_seconds_bucket{route="GET /api/tasks/",le="+Inf"} 2' in lines
+        assert 'http_request_errors_total{route="GET /api/tasks/"} 1' in lines
+        assert 'db_call_duration_seconds_count{operation="query"} 1' in lines
+        assert 'cache_requests_total{cache="dataloader",result="hit"} 1' in lines
+
+    def test_profiler_attributes_samples_to_routes(self):
+        """Test that loop samples carry the route of the task being served."""
+        profiler = SamplingProfiler()
+
+        def spin(until):
+            while time.perf_counter() < until:
+                pass
+
+        async def handler():
+            # Hold the loop so the sampler sees this task as current
+            spin(time.perf_counter() + 0.2)
+
+        async def run():
+            scope = {"method": "GET", "route": type("Route", (), {"path": "/api/tasks/", "methods": {"GET"}})()}
+            loop = asyncio.get_running_loop()
+            sampling = asyncio.ensure_future(asyncio.to_thread(profiler.sample, 0.15, 0.005, loop, threading.get_ident()))
+            task = asyncio.ensure_future(handler())
+            _active_requests[task] = scope
+            await task
+            _active_requests.pop(task)
+            return await sampling
+
+        profile = asyncio.run(run())
+        assert profile.sample_count > 0
+        collapsed = profile.collapsed()
+        assert any(line.startswith("GET /api/tasks/;") and "spin (" in line for line in collapsed.splitlines())
+
+        speedscope = profile.speedscope()
+        names = [frame["name"] for frame in speedscope["shared"]["frames"]]
+        assert "spin" in names
+        assert "GET /api/tasks/" in [profile["name"] for profile in speedscope["profiles"]]
+
+    def test_allocations_are_charged_to_routes(self):
+        """Test that net allocations and growing sites are reported per route."""
+        tracker = AllocationTracker()
+        tracker.start()
+        try:
+            baseline = tracker.take_snapshot()
+            retained = []
+            for _ in range(3):
+                request = tracker.begin_request()
+                retained.append(bytearray(200_000))
+                tracker.end_request(request, "GET /api/tasks/")
+
+            stats = tracker.get_stats()["routes"]["GET /api/tasks/"]
+            assert stats["requests"] == 3
+            assert stats["avg_net_bytes"] >= 200_000
+            assert stats["max_peak_bytes"] >= 200_000
+
+            diff = tracker.compare(baseline["snapshot_id"], top=1)
+            assert diff["top_growing"][0]["size_diff_bytes"] >= 600_000
+            assert diff["top_growing"][0]["site"].startswith(__file__)
+            assert tracker.compare(baseline["snapshot_id"] + 1) is None
+        finally:
+            tracker.stop()
+
 
 class TestDataValidation:
     """Tests for general data validation."""